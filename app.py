@@ -10,10 +10,59 @@ with multiple useful columns.
 """
 
 from fastapi import Depends, FastAPI, Form, HTTPException, Response, Query
-from typing import List
+from typing import List, Tuple
+from urllib.parse import urlencode
+from email.utils import formatdate, parsedate_to_datetime
 from datetime import datetime, timedelta, timezone
-from database.db import get_conn
+from database.db import (
+    ROLE_ADMIN,
+    ROLE_CLIENT,
+    close_pools,
+    get_pool,
+    pool_stats
+)
+from database.aio import (
+    DB_ERRORS,
+    cached_db,
+    fan_out,
+    run_db,
+    shared_db,
+    shutdown_executors,
+    single_flight,
+    stale_stats,
+    swr_db
+)
+from database.cache import LRUCache, SizedLRUCache
+from database.facets import (
+    get_facet_index,
+    parse_selection,
+    selection_key
+)
+from database.autocomplete import NameList, get_autocomplete
+from database.indexes import CatalogIndexes
+from database.search import get_search_index
+from database.query import statement_stats
+from database.ownership import OwnedGames, ownership_index
+from database.purchases import (
+    INSUFFICIENT_FUNDS,
+    KEY_CONFLICT,
+    OWNED_OUTCOMES,
+    REQUEST_KEY_MAX,
+    purchase_stats
+)
+from database.pagination import NEXT, PREV, decode_cursor, encode_cursor
 from database.objects import (
+    ATTRIBUTES_KEY,
+    ATTRIBUTE_FIELDS,
+    CATALOG_MAX_STALE,
+    CATALOG_VERSION_KEY,
+    attributes_cache,
+    catalog_version_cache,
+    get_catalog_version,
+    facet_list_cache,
+    filter_result_cache,
+    game_detail_cache,
+    Attribute,
     Attributes, 
     Games, 
     User, 
@@ -21,13 +70,33 @@ from database.objects import (
     UserPurchases, 
     Users
 )
+from compression import (
+    CompressionMiddleware,
+    compressed_cache,
+    compression_stats,
+    negotiate
+)
+from prefetch import Prefetcher
+from static_pages import StaticPageGenerator
+from streaming import Deferred, render_chunks
+from starlette.concurrency import run_in_threadpool
 from starlette.requests import Request
 from starlette.templating import Jinja2Templates
-from fastapi.responses import RedirectResponse
+from fastapi.responses import (
+    FileResponse,
+    RedirectResponse,
+    StreamingResponse
+)
 from starlette import status
 from fastapi.security import OAuth2PasswordRequestForm
 
 
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
 import jwt
 import uvicorn
 
@@ -36,8 +105,57 @@ PORT = 8000
 ALGORITHM = "HS256"
 SECRET_KEY = "secret"
 
+PAGE_SIZE = 10
+
+# facet types shown in the home page sidebar
+SIDEBAR_FACETS = ('genre', 'tag', 'category', 'lang', 'developer', 'publisher')
+# sidebar facets too long to list; only selected ones are rendered and the
+# rest are found through /autocomplete
+TYPEAHEAD_FACETS = ('developer', 'publisher')
+# unselected items rendered per list facet; the rest load from /api/facets
+SIDEBAR_INITIAL = 15
+FACET_PAGE_MAX = 200
+FACET_CACHE_CONTROL = "private, max-age=300"
+
+# Rendered listing and sidebar fragments shared by all users, keyed by page
+# and filter set; bounded by the size of the stored HTML. After a catalog
+# change the old fragments are re-rendered, but still served if that fails.
+FRAGMENT_CACHE_BYTES = 32 * 1024 * 1024
+fragment_cache = SizedLRUCache(
+    FRAGMENT_CACHE_BYTES, max_stale=CATALOG_MAX_STALE)
+
+# serve game pages from the pre-rendered files in static_pages/ when present
+STATIC_GAME_PAGES = True
+
+# After a /home page is served, render the next page into fragment_cache in
+# the background (see prefetch_listing). next_page_cache remembers where each
+# cached listing's "next" link leads, so cache hits can prefetch too.
+PREFETCH_NEXT_PAGE = True
+PREFETCH_POOL_SHARE = 0.5
+next_page_cache = LRUCache(max_entries=10_000)
+
+# game ids in a rendered _listing.html, for the per-user owned badges
+LISTED_GAME_ID = re.compile(r'data-game-id="(\d+)"')
+
+# messages for purchases that did not go through
+PURCHASE_ERRORS = {
+    INSUFFICIENT_FUNDS: "Your balance does not cover this game.",
+    KEY_CONFLICT: "This purchase form was already used; please try again.",
+}
+
+# catalog pages may be stored by the browser but must be revalidated
+CATALOG_CACHE_CONTROL = "private, no-cache"
+# pages rendered without fresh data (e.g. empty after a database error) are
+# not stored, so they are never revalidated as current
+FALLBACK_CACHE_CONTROL = "no-store"
+
 app = FastAPI()
+app.add_middleware(CompressionMiddleware, cache=compressed_cache)
 templates = Jinja2Templates(directory="templates")
+page_generator = StaticPageGenerator(app.url_path_for)
+# fragments rendered from the previous indexes are re-rendered after a load
+catalog_indexes = CatalogIndexes(on_loaded=fragment_cache.expire)
+prefetcher = Prefetcher(lambda: prefetch_capacity())
 
 class OAuth2PasswordBearerWithCookie():
     def __init__(self):
@@ -73,14 +191,124 @@ async def http_exception_handler(request, exc):
     return response
 
 
+# Conditional GET. Catalog responses carry a strong ETag made from the
+# catalog version, the render generation of this process (reset on restart
+# and on /refresh_catalog, when templates may change), the load time of the
+# in-memory indexes (which catch up with a catalog change in the background)
+# and whatever else the body depends on, so a revalidation costs a lookup of
+# the cached version stamp instead of queries and a render.
+_render_generation = time.time()
+_seen_version = None
+
+async def catalog_version() -> tuple:
+    """
+    Returns (catalog version, unix time of the last change to the catalog
+    or the indexes), or None if catalog_version cannot be read. Rendered
+    fragments, game details and filter results expire when the version
+    moves on, and the indexes and pre-rendered pages are rebuilt.
+    """
+    global _seen_version
+    stamp = await swr_db(
+        catalog_version_cache, CATALOG_VERSION_KEY,
+        ROLE_CLIENT, get_catalog_version
+    )
+    if stamp is None:
+        return None
+
+    if _seen_version is not None and stamp[0] != _seen_version:
+        fragment_cache.expire()
+        game_detail_cache.expire()
+        filter_result_cache.expire()
+        catalog_indexes.start()
+        if STATIC_GAME_PAGES:
+            page_generator.start()
+    _seen_version = stamp[0]
+    return stamp[0], max(stamp[1], _render_generation,
+                         catalog_indexes.loaded_at)
+
+async def catalog_validators(request: Request, *parts) -> dict:
+    """
+    ETag, Last-Modified and Cache-Control headers for a catalog response to
+    `request` whose body also depends on `parts`. Empty if the catalog
+    version is unavailable.
+    """
+    return stamp_validators(request, await catalog_version(), *parts)
+
+def stamp_validators(request: Request, stamp: tuple, *parts) -> dict:
+    """
+    catalog_validators for a `stamp` the caller already has from
+    catalog_version, e.g. fetched alongside other lookups.
+    """
+    if stamp is None:
+        return {}
+
+    version, modified = stamp
+    key = repr((version, _render_generation, catalog_indexes.loaded_at,
+                str(request.url)) + parts)
+    validators = {
+        "ETag": '"' + hashlib.sha1(key.encode()).hexdigest()[:20] + '"',
+        "Cache-Control": CATALOG_CACHE_CONTROL,
+    }
+    # while the indexes catch up with the catalog, the ETag alone validates:
+    # at one-second resolution, Last-Modified could not tell these pages
+    # from the ones rendered right after the load
+    if catalog_indexes.catalog_version == version:
+        validators["Last-Modified"] = formatdate(modified, usegmt=True)
+    return validators
+
+def is_not_modified(request: Request, validators: dict) -> bool:
+    """
+    Whether the client's If-None-Match (or, without one, If-Modified-Since)
+    matches `validators`.
+    """
+    if not validators:
+        return False
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        # compression may have weakened the tag we sent
+        tags = [t[2:] if t.startswith("W/") else t for t in tags]
+        return "*" in tags or validators["ETag"] in tags
+
+    since = request.headers.get("if-modified-since")
+    if since is None or "Last-Modified" not in validators:
+        return False
+    try:
+        return parsedate_to_datetime(validators["Last-Modified"]) <= \
+            parsedate_to_datetime(since)
+    except (TypeError, ValueError):
+        return False
+
+def catalog_headers(validators: dict, fresh: bool = True) -> dict:
+    """
+    Response headers for a catalog page: its validators if the body was
+    built from fresh data, otherwise no-store and no validators.
+    """
+    if fresh and validators:
+        return validators
+    return {"Cache-Control": FALLBACK_CACHE_CONTROL}
+
+
 # Startup and shutdown events
 @app.on_event("startup")
 async def startup_event():
-    app.db_conn = get_conn()
+    # warm one connection per role so the first request skips the handshake
+    for role in (ROLE_CLIENT, ROLE_ADMIN):
+        pool = get_pool(role)
+        pool.release(pool.acquire())
+
+    await run_in_threadpool(catalog_indexes.load)
+
+    # bring the pre-rendered game pages up to date in the background; game
+    # pages are rendered dynamically until that run completes
+    if STATIC_GAME_PAGES:
+        page_generator.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    app.db_conn.close()
+    shutdown_executors()
+    close_pools()
 
 # create token
 async def create_token(
@@ -134,9 +362,8 @@ async def login(
 
     # check username and password
     # get admin db connection
-    admin_conn = get_conn(user="admin", password="admin")
-    user = User(username=username).auth_user(admin_conn, password)
-    admin_conn.close()
+    user = await run_db(
+        ROLE_ADMIN, User(username=username).auth_user, password)
     if user is None:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
@@ -164,9 +391,8 @@ async def logout(request: Request):
 # create account
 @app.post("/register")
 async def create_account(request: Request, username: str=Form(), password: str=Form()):
-    admin_conn = get_conn(user="admin", password="admin")
-    user = User(username=username).create_user(admin_conn, password)
-    admin_conn.close()
+    user = await run_db(
+        ROLE_ADMIN, User(username=username).create_user, password)
     if user is None:
         return templates.TemplateResponse(
             "register.html", 
@@ -194,113 +420,471 @@ async def root(
     response.headers["Location"] = "/home/0"
     return response
 
-@app.get("/home/{page}")
-async def home(
-    request: Request, page: int = 0, user: dict = Depends(get_current_user),
-    genre: List[str] = Query([]), category: List[str] = Query([]),
-    tag: List[str] = Query([]), lang: List[str] = Query([]),
-    developer: List[str] = Query([]), publisher: List[str] = Query([])):
-    
-    genres = ",".join(genre)
-    categories = ",".join(category)
-    tags = ",".join(tag)
-    langs = ",".join(lang)
-    developers = ",".join(developer)
-    publishers = ",".join(publisher)
-
-    no_filter = True
-    if (genres != "" or categories != "" or tags != "" or langs != "" or 
-        developers != "" or publishers != ""):
-        no_filter = False
-
-    if no_filter:
-        games = Games(games=[]).get_games(
-            app.db_conn, 
-            limit=10, 
-            offset=page*10
+# Fetches one listing page, by cursor when possible. Returns the games, the
+# next/prev cursor tokens (None when that direction is exhausted) and whether
+# the page was fetched by cursor rather than by offset; None if the database
+# failed.
+async def listing_page(selection: dict, page: int, cursor: str = None):
+    anchor = decode_cursor(cursor)
+    after_id = before_id = None
+    if anchor is not None:
+        direction, anchor_id = anchor
+        if direction == NEXT:
+            after_id = anchor_id
+        else:
+            before_id = anchor_id
+
+    index = get_facet_index()
+    keyset = (anchor is not None or page == 0) and \
+        (not selection or index is not None)
+
+    if not keyset:
+        # legacy page-number links and the no-index fallback
+        if not selection:
+            games = await shared_db(
+                ("games", page),
+                ROLE_CLIENT,
+                Games(games=[]).get_games, 
+                limit=PAGE_SIZE, 
+                offset=page*PAGE_SIZE
+            )
+        elif index is not None:
+            _, game_ids = index.page(
+                selection, limit=PAGE_SIZE, offset=page*PAGE_SIZE)
+            games = await shared_db(
+                ("games_by_ids", tuple(game_ids)),
+                ROLE_CLIENT, Games(games=[]).get_games_by_ids, game_ids)
+        else:
+            games = await shared_db(
+                ("filter", selection_key(selection), page),
+                ROLE_CLIENT,
+                Games(games=[]).get_games_by_all_limit,
+                selection=selection,
+                limit=PAGE_SIZE,
+                offset=page*PAGE_SIZE
+            )
+        if games is None:
+            return None
+        return games.games, None, None, False
+
+    # fetch one extra row to learn whether there is a page beyond this one
+    if not selection:
+        games = await shared_db(
+            ("games_keyset", after_id, before_id),
+            ROLE_CLIENT,
+            Games(games=[]).get_games_keyset,
+            after_id=after_id,
+            before_id=before_id,
+            limit=PAGE_SIZE + 1
         )
-        attributes = Attributes(genres=[]).get_attributes(app.db_conn)
     else:
-        conn_admin = get_conn(user="admin", password="admin") 
-        games = Games(games=[]).get_games_by_all_limit(
-            conn_admin,
-            category_ids_str=categories,
-            tag_ids_str=tags,
-            lang_ids_str=langs,
-            dev_ids_str=developers,
-            pub_ids_str=publishers,
-            genre_ids_str=genres,
-            limit=10,
-            offset=page*10
-        )
-        conn_admin.close()
-
-        attributes = Attributes(genres=[]).get_attributes(
-            app.db_conn
+        _, game_ids = index.page_keyset(
+            selection, after_id=after_id, before_id=before_id,
+            limit=PAGE_SIZE + 1
         )
+        games = await shared_db(
+            ("games_by_ids", tuple(game_ids)),
+            ROLE_CLIENT, Games(games=[]).get_games_by_ids, game_ids)
+    if games is None:
+        return None
+    ret_games = games.games
 
-        for g in attributes.genres:
-            g.checked = str(g.id) in genre
-
-        for c in attributes.categories:
-            c.checked = str(c.id) in category
-
-        for t in attributes.tags:
-            t.checked = str(t.id) in tag
-
-        for l in attributes.languages:
-            l.checked = str(l.id) in lang
+    if before_id is not None:
+        has_prev = len(ret_games) > PAGE_SIZE
+        has_next = True
+        ret_games = ret_games[-PAGE_SIZE:]
+    else:
+        has_prev = after_id is not None
+        has_next = len(ret_games) > PAGE_SIZE
+        ret_games = ret_games[:PAGE_SIZE]
+
+    next_cursor = prev_cursor = None
+    if ret_games:
+        if has_next:
+            next_cursor = encode_cursor(NEXT, ret_games[-1].game_id)
+        if has_prev:
+            prev_cursor = encode_cursor(PREV, ret_games[0].game_id)
+    return ret_games, next_cursor, prev_cursor, True
+
+# Builds a /home/{page} (or /search/{page}) link that keeps the current
+# filters and search query
+def home_url(request: Request, page: int, cursor: str = None,
+             route: str = "home") -> str:
+    params = [
+        (k, v) for k, v in request.query_params.multi_items()
+        if k != "cursor"
+    ]
+    if cursor is not None:
+        params.append(("cursor", cursor))
+    url = app.url_path_for(route, page=page)
+    return url + ("?" + urlencode(params) if params else "")
 
-        for d in attributes.developers:
-            d.checked = str(d.id) in developer
+@app.get("/home/{page}")
+async def home(
+    request: Request, page: int = 0, user: dict = Depends(get_current_user),
+    genre: List[str] = Query([]), category: List[str] = Query([]),
+    tag: List[str] = Query([]), lang: List[str] = Query([]),
+    developer: List[str] = Query([]), publisher: List[str] = Query([]),
+    cursor: str = Query(None)):
 
-        for p in attributes.publishers:
-            p.checked = str(p.id) in publisher
+    selection = parse_selection(
+        genre=genre, category=category, tag=tag, lang=lang,
+        developer=developer, publisher=publisher
+    )
 
+    # the owned badges are per user, so the library size is part of the
+    # validator (purchases only ever add to it)
+    owned = await owned_games(user["user_id"])
+    validators = await catalog_validators(
+        request, user["user_id"], user["username"], owned_count(owned))
+    if is_not_modified(request, validators):
+        return Response(status_code=304, headers=validators)
+
+    key = fragment_key(request, "listing", "home", page, cursor,
+                       selection_key(selection))
+    listing = fragment_cache.get(key)
+    fresh = True
+    if listing is not None:
+        prefetcher.hit(key)
+        following = next_page_cache.get(key)
+    else:
+        listing, following = await home_listing(
+            request, selection, page, cursor)
+        if listing is None:
+            # a stale listing was rendered for an older catalog version
+            fresh = False
+            listing = stale_fragment(key)
+        if listing is None:
+            listing = render_fragment("_listing.html", {
+                "request": request, "games": [], "page": page,
+                "prev_page": home_url(request, page - 1 if page > 0 else 0),
+                "next_page": home_url(request, page),
+                "checked": selection, "query": None
+            })
+
+    if PREFETCH_NEXT_PAGE and following is not None:
+        prefetch_listing(request, selection, *following)
+
+    return await render_listing(
+        request, user, listing, selection, owned=owned,
+        headers=catalog_headers(validators, fresh))
+
+# Renders the /home listing fragment for a page into fragment_cache. Returns
+# the HTML and the (page, cursor) its "next" link leads to (None on the last
+# page), or (None, None) if the database failed.
+async def home_listing(request: Request, selection: dict, page: int,
+                       cursor: str = None) -> tuple:
+    try:
+        fetched = await listing_page(selection, page, cursor)
+    except DB_ERRORS as err:
+        print(err)
+        fetched = None
+    if fetched is None:
+        return None, None
+    ret_games, next_cursor, prev_cursor, keyset = fetched
+
+    following = None
+    if keyset:
+        next_url = home_url(request, page + 1, next_cursor) \
+            if next_cursor is not None else home_url(request, page, cursor)
+        # the first page is always the cursor-less start of the listing
+        prev_url = home_url(request, page - 1, prev_cursor) \
+            if prev_cursor is not None and page > 1 \
+            else home_url(request, 0)
+        if next_cursor is not None:
+            following = (page + 1, next_cursor)
+    else:
+        next_page = page + 1 if len(ret_games) == PAGE_SIZE else page
+        prev_page = page - 1 if page > 0 else 0
+        next_url = home_url(request, next_page)
+        prev_url = home_url(request, prev_page)
+        if next_page != page:
+            following = (next_page, None)
+
+    listing = render_fragment("_listing.html", {
+        "request": request, "games": ret_games, "page": page,
+        "prev_page": prev_url, "next_page": next_url,
+        "checked": selection, "query": None
+    })
+    # an empty page may be a failed query; don't pin it in the cache
+    if ret_games:
+        key = fragment_key(request, "listing", "home", page, cursor,
+                           selection_key(selection))
+        fragment_cache.put(key, listing)
+        if following is None:
+            next_page_cache.invalidate(key)
+        else:
+            next_page_cache.put(key, following)
+    return listing, following
+
+# Warms the listing fragment of the page after the one just served, within
+# the prefetch budget
+def prefetch_listing(request: Request, selection: dict, page: int,
+                     cursor: str = None):
+    key = fragment_key(request, "listing", "home", page, cursor,
+                       selection_key(selection))
+    if key in fragment_cache:
+        return
+
+    async def warm() -> bool:
+        await home_listing(request, selection, page, cursor)
+        return key in fragment_cache
+    prefetcher.schedule(key, warm)
+
+# Prefetch only runs while most of the client pool is idle, so it never
+# holds connections foreground requests are waiting for
+def prefetch_capacity() -> bool:
+    stats = get_pool(ROLE_CLIENT).stats()
+    return stats["in_use"] < stats["size"] * PREFETCH_POOL_SHARE
+
+@app.get("/search/{page}")
+async def search(
+    request: Request, page: int = 0, user: dict = Depends(get_current_user),
+    q: str = Query(""),
+    genre: List[str] = Query([]), category: List[str] = Query([]),
+    tag: List[str] = Query([]), lang: List[str] = Query([]),
+    developer: List[str] = Query([]), publisher: List[str] = Query([])):
 
-    ret_games = [] if games is None else games.games
+    selection = parse_selection(
+        genre=genre, category=category, tag=tag, lang=lang,
+        developer=developer, publisher=publisher
+    )
 
-    next_page = page + 1 if len(ret_games) == 10 else page
-    prev_page = page - 1 if page > 0 else 0
+    owned = await owned_games(user["user_id"])
+    validators = await catalog_validators(
+        request, user["user_id"], user["username"], owned_count(owned))
+    if is_not_modified(request, validators):
+        return Response(status_code=304, headers=validators)
+
+    key = fragment_key(request, "listing", "search", page, q,
+                       selection_key(selection))
+    listing = fragment_cache.get(key)
+    ret_games = []
+    # an unloaded search index or a failed query leave the results empty
+    fresh = True
+    if listing is None:
+        # rank by BM25, filtering by the facet bitmaps during the same scan
+        index = get_search_index()
+        if index is None and q.strip():
+            fresh = False
+        elif q.strip():
+            allowed = None
+            if get_facet_index() is not None:
+                allowed = get_facet_index().member_test(selection)
+            _, game_ids = index.search(
+                q, limit=PAGE_SIZE, offset=page*PAGE_SIZE, allowed=allowed)
+            try:
+                games = await shared_db(
+                    ("games_by_ids", tuple(game_ids)),
+                    ROLE_CLIENT, Games(games=[]).get_games_by_ids, game_ids)
+            except DB_ERRORS as err:
+                print(err)
+                games = None
+            if games is None:
+                fresh = False
+                listing = stale_fragment(key)
+            else:
+                ret_games = games.games
+
+    if listing is None:
+        next_page = page + 1 if len(ret_games) == PAGE_SIZE else page
+        prev_page = page - 1 if page > 0 else 0
+
+        listing = render_fragment("_listing.html", {
+            "request": request, "games": ret_games, "page": page,
+            "prev_page": home_url(request, prev_page, route="search"),
+            "next_page": home_url(request, next_page, route="search"),
+            "checked": selection, "query": q
+        })
+        if ret_games:
+            fragment_cache.put(key, listing)
+
+    return await render_listing(
+        request, user, listing, selection, query=q, owned=owned,
+        headers=catalog_headers(validators, fresh))
+
+# Cache key for a rendered fragment. Fragments contain absolute links, so the
+# base URL the request came in on is part of the key.
+def fragment_key(request: Request, *parts) -> tuple:
+    return (str(request.base_url),) + parts
+
+# The last good rendering of a fragment whose fresh render failed on the
+# database, if it is recent enough to serve
+def stale_fragment(key: tuple) -> str:
+    stale = fragment_cache.get_stale(key)
+    return None if stale is None else stale[0]
+
+# The user's owned games: from ownership_index, or loaded into it with one
+# query (None if the database failed)
+async def owned_games(user_id: int) -> OwnedGames:
+    owned = ownership_index.peek(user_id)
+    if owned is not None:
+        return owned
+    try:
+        return await shared_db(
+            ("owned", user_id), ROLE_CLIENT, ownership_index.load, user_id)
+    except DB_ERRORS as err:
+        print(err)
+        return None
 
-    current_url = str(request.url)
-    current_url = current_url.split("?")
+def owned_count(owned: OwnedGames):
+    return None if owned is None else len(owned)
+
+# Ids of the games in a rendered listing that are in `owned`
+def listed_owned(listing: str, owned: OwnedGames) -> List[int]:
+    if not owned:
+        return []
+    return [
+        game_id for game_id in map(int, LISTED_GAME_ID.findall(listing))
+        if game_id in owned
+    ]
+
+def render_fragment(name: str, context: dict) -> str:
+    return templates.get_template(name).render(context)
+
+# Renders a template as a streamed response; see streaming.render_chunks
+def stream_template(name: str, context: dict, deferred: list = (),
+                    headers: dict = None) -> StreamingResponse:
+    return StreamingResponse(
+        render_chunks(templates.get_template(name), context, deferred),
+        media_type="text/html",
+        headers=headers
+    )
 
-    filter = "?" + current_url[1] if len(current_url) > 1 else ""
-    next_url = "/".join((current_url[0].split("/")[:-1])) \
-        + f"/{next_page}" + filter
-    
-    prev_url = "/".join((current_url[0].split("/")[:-1])) \
-        + f"/{prev_page}" + filter
-    
+# Streams index.html around a rendered game listing: the per-user navbar and
+# the listing go out first, the filter sidebar once it is ready. Games of the
+# listing that are in `owned` get their owned badge.
+async def render_listing(
+        request: Request, user: dict, listing: str, selection: dict,
+        query: str = None, owned: OwnedGames = None, headers: dict = None):
+    # The headers go out before a deferred sidebar is rendered, so it is
+    # only deferred when fresh cached data is there to build it from.
+    # Otherwise it is built first, and a fallback sidebar drops the
+    # validators like any other fallback body.
+    if sidebar_ready(request, selection, query):
+        async def make_sidebar() -> str:
+            return (await sidebar_fragment(request, selection, query))[0]
+        sidebar = Deferred("sidebar", make_sidebar)
+        deferred = [sidebar]
+    else:
+        sidebar, fresh = await sidebar_fragment(request, selection, query)
+        deferred = []
+        if not fresh:
+            headers = catalog_headers(headers, fresh=False)
 
-    return templates.TemplateResponse(
+    return stream_template(
         "index.html",
         {
-            "request": request, "games": ret_games, "page": page,
-            "user": user,
-            "prev_page": prev_url,
-            "next_page": next_url,
-            "genres": attributes.genres if attributes is not None else [] ,
-            "categories": attributes.categories if attributes is not None 
-                            else [] ,
-            "tags": attributes.tags if attributes is not None else [] ,
-            "langs": attributes.languages if attributes is not None else [] ,
-            "audio_langs": attributes.audio_languages if attributes is not None 
-                            else [] ,
-            "developers": attributes.developers if attributes is not None 
-                            else [],
-            "publishers": attributes.publishers if attributes is not None 
-                            else []
-         }
+            "request": request, "user": user,
+            "listing": listing, "sidebar": sidebar,
+            "owned": listed_owned(listing, owned)
+        },
+        deferred=deferred,
+        headers=headers
+    )
+
+def sidebar_key(request: Request, selection: dict, query: str = None):
+    return fragment_key(request, "sidebar", selection_key(selection), query)
+
+# Whether the sidebar can be built without the database: it is cached, or
+# the attribute lists are (facet counts come from the in-memory index)
+def sidebar_ready(request: Request, selection: dict,
+                  query: str = None) -> bool:
+    return sidebar_key(request, selection, query) in fragment_cache or \
+        ATTRIBUTES_KEY in attributes_cache
+
+# Rendered filter sidebar for a selection, from fragment_cache when possible.
+# Returns (html, fresh); fresh is False for a stale sidebar or one built from
+# stale or missing attribute lists.
+async def sidebar_fragment(
+        request: Request, selection: dict,
+        query: str = None) -> Tuple[str, bool]:
+    key = sidebar_key(request, selection, query)
+    sidebar = fragment_cache.get(key)
+    if sidebar is not None:
+        return sidebar, True
+
+    # shared, cached attribute lists; checkbox state is a per-request overlay
+    attributes = await swr_db(
+        attributes_cache, ATTRIBUTES_KEY,
+        ROLE_CLIENT, Attributes(genres=[]).get_attributes
     )
+    if attributes is None:
+        sidebar = stale_fragment(key)
+        if sidebar is not None:
+            return sidebar, False
+    # attribute lists past their TTL are served while they reload; a
+    # sidebar built from them is neither kept nor validated as current
+    fresh = attributes is not None and ATTRIBUTES_KEY in attributes_cache
+    checked = {t: set(selection.get(t, ())) for t in SIDEBAR_FACETS}
+
+    # list facets: the selected items plus the first few, in view order
+    shown = {}
+    for t in SIDEBAR_FACETS:
+        if t in TYPEAHEAD_FACETS:
+            continue
+        items = [] if attributes is None \
+            else getattr(attributes, ATTRIBUTE_FIELDS[t])
+        selected = [a for a in items if a.id in checked[t]] \
+            if checked[t] else []
+        first = [
+            a for a in items[:SIDEBAR_INITIAL + len(selected)]
+            if a.id not in checked[t]
+        ][:SIDEBAR_INITIAL]
+        shown[t] = selected + first
+
+    # how many games each sidebar facet would leave if added
+    facet_counts = None
+    index = get_facet_index()
+    if index is not None:
+        facet_counts = index.counts(selection, [
+            t for t in SIDEBAR_FACETS if t not in TYPEAHEAD_FACETS])
+        for t in TYPEAHEAD_FACETS:
+            facet_counts[t] = index.counts_for(selection, t, checked[t])
+
+    # only the selected developers/publishers go into the page
+    typeahead = {}
+    autocomplete = get_autocomplete()
+    for t in TYPEAHEAD_FACETS:
+        if autocomplete is not None:
+            typeahead[t] = [
+                Attribute(id=i, name=autocomplete.name(t, i))
+                for i in sorted(checked[t]) if autocomplete.name(t, i)
+            ]
+        elif attributes is not None:
+            typeahead[t] = [
+                a for a in getattr(attributes, ATTRIBUTE_FIELDS[t])
+                if a.id in checked[t]
+            ]
+        else:
+            typeahead[t] = []
+
+    sidebar = render_fragment(
+        "_sidebar.html",
+        {
+            "request": request,
+            "genres": shown["genre"],
+            "categories": shown["category"],
+            "tags": shown["tag"],
+            "langs": shown["lang"],
+            "developers": typeahead["developer"],
+            "publishers": typeahead["publisher"],
+            "counts": facet_counts,
+            "checked": checked,
+            "query": query
+        }
+    )
+    if fresh:
+        fragment_cache.put(key, sidebar)
+    return sidebar, fresh
 
 @app.post("/home/{page}")
 async def home_post(request: Request, user: dict = Depends(get_current_user),
                     page: int = 0, genre: list = Form([]), 
                     category: list = Form([]),
                     tag: list = Form([]), lang: list = Form([]),
-                    developer: list = Form([]), publisher: list = Form([])):
+                    developer: list = Form([]), publisher: list = Form([]),
+                    q: str = Form("")):
 
     genres = ""
     categories = ""
@@ -340,7 +924,10 @@ async def home_post(request: Request, user: dict = Depends(get_current_user),
     categories = categories[:-1]
     genres = genres[:-1]
 
-    url = f"/home/{page}?"
+    # a new filter set starts again from the first page
+    url = "/home/0?"
+    if q.strip():
+        url = "/search/0?" + urlencode({"q": q}) + "&"
 
     if genres != "":
         url += genres + "&"
@@ -366,39 +953,292 @@ async def home_post(request: Request, user: dict = Depends(get_current_user),
 
     
 
+# drop cached catalog data and rebuild the facet index after the catalog
+# tables have been changed
+@app.post("/refresh_catalog")
+async def refresh_catalog(
+    request: Request, user: dict = Depends(get_current_user)):
+    global _render_generation
+    if user["user_role"] != "admin":
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    Attributes.invalidate_cache()
+    game_detail_cache.expire()
+    filter_result_cache.expire()
+    catalog_version_cache.invalidate()
+    await run_in_threadpool(catalog_indexes.load, rebuild_search=True)
+    # rendered pages embed all of the above
+    fragment_cache.expire()
+    if STATIC_GAME_PAGES:
+        page_generator.start()
+    _render_generation = time.time()
+
+    return RedirectResponse(
+        url="/account/0", 
+        status_code=status.HTTP_303_SEE_OTHER
+    )
+
+# Whether the pre-rendered game pages match the current catalog version
+async def static_pages_current() -> bool:
+    stamp = await catalog_version()
+    return stamp is not None and \
+        page_generator.catalog_version == stamp[0]
+
+# Shared details of a game, from game_detail_cache
+async def game_detail(game_id: int) -> GameInfo:
+    return await cached_db(
+        game_detail_cache, game_id,
+        ROLE_CLIENT, GameInfo(game_id=game_id).get_game_detail
+    )
+
+# Game page data: shared details plus the user's owned games from
+# ownership_index, fetched concurrently with one fan_out
+async def game_page_info(game_id: int, user_id: int) -> GameInfo:
+    page = await fan_out(
+        detail=game_detail(game_id),
+        owned=owned_games(user_id)
+    )
+
+    if page["detail"] is None:
+        return None
+    purchased = page["owned"] is not None and game_id in page["owned"]
+    return page["detail"].with_purchased(purchased)
+
+# typeahead suggestions for the search box and the long sidebar facets
+@app.get("/autocomplete/{kind}")
+async def autocomplete(
+    kind: str, q: str = Query(""), limit: int = Query(10),
+    user: dict = Depends(get_current_user)):
+    index = get_autocomplete()
+    if index is None:
+        return []
+    return [
+        {"id": item_id, "name": name}
+        for item_id, name in index.suggest(kind, q, limit)
+    ]
+
+# Sorted name list for one facet type, built from the cached attributes
+async def facet_name_list(facet_type: str) -> Tuple[NameList, bool]:
+    """
+    Returns (names, fresh); fresh is False when the names come from stale
+    attribute lists, which are not kept in facet_list_cache.
+    """
+    names = facet_list_cache.get(facet_type)
+    if names is None:
+        attributes = await swr_db(
+            attributes_cache, ATTRIBUTES_KEY,
+            ROLE_CLIENT, Attributes(genres=[]).get_attributes
+        )
+        if attributes is None:
+            return None, False
+        names = NameList(
+            (a.id, a.name)
+            for a in getattr(attributes, ATTRIBUTE_FIELDS[facet_type])
+        )
+        if ATTRIBUTES_KEY not in attributes_cache:
+            return names, False
+        facet_list_cache.put(facet_type, names)
+    return names, True
+
+# Paged facet values as JSON, with optional name prefix and counts for the
+# current selection. Responses carry a content ETag and may be cached by the
+# browser for a few minutes.
+@app.get("/api/facets/{facet_type}")
+async def facet_values(
+    request: Request, facet_type: str, user: dict = Depends(get_current_user),
+    offset: int = Query(0), limit: int = Query(50), prefix: str = Query(""),
+    genre: List[str] = Query([]), category: List[str] = Query([]),
+    tag: List[str] = Query([]), lang: List[str] = Query([]),
+    developer: List[str] = Query([]), publisher: List[str] = Query([])):
+    if facet_type not in ATTRIBUTE_FIELDS:
+        return Response(status_code=404)
+
+    validators = await catalog_validators(request)
+    if validators:
+        validators["Cache-Control"] = FACET_CACHE_CONTROL
+    if is_not_modified(request, validators):
+        return Response(status_code=304, headers=validators)
+
+    names, fresh = await facet_name_list(facet_type)
+    if names is None:
+        return Response(status_code=503)
+
+    limit = max(1, min(limit, FACET_PAGE_MAX))
+    total, items = names.page(prefix, offset, limit)
+
+    selection = parse_selection(
+        genre=genre, category=category, tag=tag, lang=lang,
+        developer=developer, publisher=publisher
+    )
+    counts = {}
+    if get_facet_index() is not None:
+        counts = get_facet_index().counts_for(
+            selection, facet_type, [i for i, _ in items])
+
+    payload = {
+        "type": facet_type,
+        "total": total,
+        "offset": offset,
+        "items": [
+            {"id": i, "name": name, "count": counts.get(i)}
+            for i, name in items
+        ],
+        "next_offset": offset + limit if offset + limit < total else None,
+    }
+    body = json.dumps(payload, separators=(",", ":")).encode()
+    if not fresh:
+        validators = catalog_headers(validators, fresh=False)
+    elif not validators:
+        # no catalog version to go by; fall back to a content hash
+        validators = {
+            "ETag": '"' + hashlib.sha1(body).hexdigest() + '"',
+            "Cache-Control": FACET_CACHE_CONTROL,
+        }
+        if is_not_modified(request, validators):
+            return Response(status_code=304, headers=validators)
+    return Response(
+        content=body, media_type="application/json", headers=validators)
+
+# pool and cache metrics for admins
+@app.get("/stats")
+async def stats(request: Request, user: dict = Depends(get_current_user)):
+    if user["user_role"] != "admin":
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    return {
+        "pools": pool_stats(),
+        "caches": {
+            "attributes": attributes_cache.stats(),
+            "game_detail": game_detail_cache.stats(),
+            "filter_results": filter_result_cache.stats(),
+            "fragments": fragment_cache.stats(),
+            "compressed": compressed_cache.stats(),
+        },
+        "compression": compression_stats(),
+        "statements": statement_stats(),
+        "single_flight": single_flight.stats(),
+        "stale": stale_stats(),
+        "prefetch": prefetcher.stats(),
+        "ownership": ownership_index.stats(),
+        "purchases": purchase_stats(),
+    }
+
+# Game page: the pre-rendered file when there is one (its purchase widget is
+# loaded from /games/{game_id}/purchase), otherwise a full render
 @app.get("/games/{game_id}")
 async def game(
     game_id: int, request: Request, user: dict = Depends(get_current_user)):
-    conn_admin = get_conn(user="admin", password="admin")
-    game = GameInfo(game_id=game_id).get_game_info(conn_admin, user["user_id"])
-    conn_admin.close()
+    # the files are only served while current: a page rendered before the
+    # latest catalog change may show old details and prices
+    if STATIC_GAME_PAGES and \
+            negotiate(request.headers.get("accept-encoding", ""),
+                      ("gzip",)) == "gzip" and \
+            await static_pages_current():
+        try:
+            stat = os.stat(page_generator.path(game_id))
+        except FileNotFoundError:
+            stat = None
+        if stat is not None:
+            # the file is the whole shared page, so its stat is the validator
+            validators = {
+                "ETag": f'"g{game_id}-{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+                "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+                "Cache-Control": CATALOG_CACHE_CONTROL,
+                "Vary": "Accept-Encoding",
+            }
+            if is_not_modified(request, validators):
+                return Response(status_code=304, headers=validators)
+            return FileResponse(
+                page_generator.path(game_id), stat_result=stat,
+                media_type="text/html",
+                headers={**validators, "Content-Encoding": "gzip"}
+            )
+
+    # the full page shows ownership, so it is part of the validator, and
+    # the 304 check needs only that and the catalog version. A request
+    # that cannot be answered with 304 also fetches the details in the same
+    # fan_out; a revalidation fetches them only if the check fails.
+    conditional = "if-none-match" in request.headers or \
+        "if-modified-since" in request.headers
+    lookups = {
+        "owned": owned_games(user["user_id"]),
+        "stamp": catalog_version(),
+    }
+    if not conditional:
+        lookups["detail"] = game_detail(game_id)
+    page = await fan_out(**lookups)
+
+    owned = page["owned"]
+    purchased = None if owned is None else game_id in owned
+    validators = stamp_validators(
+        request, page["stamp"], user["user_id"], user["username"], purchased)
+    if is_not_modified(request, validators):
+        return Response(status_code=304, headers=validators)
+
+    detail = page["detail"] if not conditional else \
+        await game_detail(game_id)
+    game = None if detail is None else detail.with_purchased(bool(purchased))
 
     return templates.TemplateResponse(
         "game.html",
         {
             "request": request,
             "user": user,
-            "game": game
-        }
+            "game": game,
+            "request_key": new_request_key()
+        },
+        # a page without details or ownership (database error) is a
+        # fallback
+        headers=catalog_headers(
+            validators, fresh=game is not None and owned is not None)
+    )
+
+# the per-user ownership/purchase widget of a game page
+@app.get("/games/{game_id}/purchase")
+async def purchase_widget(
+    game_id: int, request: Request, user: dict = Depends(get_current_user)):
+    owned = await owned_games(user["user_id"])
+    purchased = owned is not None and game_id in owned
+
+    return templates.TemplateResponse(
+        "_purchase.html",
+        {
+            "request": request,
+            "game": GameInfo(game_id=game_id, is_purchased=purchased),
+            "request_key": new_request_key()
+        },
+        headers={"Cache-Control": "private, no-store"}
     )
 
 @app.get("/mygames/{page}")
 async def mygames(
     request: Request, page: int=0, user: dict = Depends(get_current_user)):
-    app.db_conn = get_conn()
-    games = UserPurchases(user_id=user["user_id"]).get_user_purchases(
-        app.db_conn, user["user_id"],
-        limit=10, offset=page*10
-    )
+    # the library size comes from ownership_index: pages past the end need
+    # no query, and "Next" is only offered when there are more games
+    owned = await owned_games(user["user_id"])
+    if owned is not None and page*10 >= len(owned):
+        games = []
+    else:
+        games = await run_db(
+            ROLE_CLIENT,
+            UserPurchases(user_id=user["user_id"]).get_user_purchases,
+            user["user_id"],
+            limit=10, offset=page*10
+        )
+    if owned is not None:
+        has_next = (page + 1)*10 < len(owned)
+    else:
+        has_next = games is not None and len(games) == 10
 
-    return templates.TemplateResponse(
+    return stream_template(
         "mygames.html",
         {
             "request": request,
             "user": user,
-            "purchases": games,
+            "purchases": games or [],
+            "owned": owned_count(owned),
             "prev_page": page - 1 if page > 0 else 0,
-            "next_page": page + 1 if len(games) == 10 else page,
+            "next_page": page + 1 if has_next else page,
             "page": page
         }
     )
@@ -406,15 +1246,14 @@ async def mygames(
 @app.get("/account/{page}")
 async def account(
     request: Request, page: int=0, user: dict = Depends(get_current_user)):
-    app.db_conn = get_conn()
-    account = User(user_id=user["user_id"]).get_user(app.db_conn)
+    account = await run_db(
+        ROLE_CLIENT, User(user_id=user["user_id"]).get_user)
 
     if user["user_role"] == "admin":
-        conn_admin = get_conn(user="admin", password="admin")
-        users = Users(users=[]).get_users(conn_admin, limit=10, offset=page*10)
-        conn_admin.close()
+        users = await run_db(
+            ROLE_ADMIN, Users(users=[]).get_users, limit=10, offset=page*10)
 
-        return templates.TemplateResponse(
+        return stream_template(
             "account.html",
             {
                 "request": request,
@@ -427,8 +1266,7 @@ async def account(
             }
         )
 
-
-    return templates.TemplateResponse(
+    return stream_template(
         "account.html",
         {
             "request": request,
@@ -442,14 +1280,17 @@ async def change_password(
     request: Request, user: dict = Depends(get_current_user), 
     password: str = Form(...)):
 
-    conn_admin = get_conn(user="admin", password="admin")
-    temp_user = User(
-        user_id=user["user_id"], 
-        username=user["username"]
-    ).change_password(conn_admin, password)
-    conn_admin.close()
+    temp_user = await run_db(
+        ROLE_ADMIN,
+        User(
+            user_id=user["user_id"], 
+            username=user["username"]
+        ).change_password,
+        password
+    )
 
-    account = User(user_id=user["user_id"]).get_user(app.db_conn)
+    account = await run_db(
+        ROLE_CLIENT, User(user_id=user["user_id"]).get_user)
 
     if temp_user is None:
         return templates.TemplateResponse(
@@ -473,12 +1314,11 @@ async def change_password(
 @app.post("/change_role")
 async def change_role(request: Request, user: dict = Depends(get_current_user), 
                       username: str = Form(...), role: str = Form(...)):
-    conn_admin = get_conn(user="admin", password="admin")
-    temp_user = User(user_role=role, username=username).update_user_role(
-        conn_admin, 
+    temp_user = await run_db(
+        ROLE_ADMIN,
+        User(user_role=role, username=username).update_user_role,
         user["user_role"]
     )
-    conn_admin.close()
 
     return RedirectResponse(
         url="/account/0", 
@@ -492,35 +1332,39 @@ async def delete_user(
     username: str = Form(...)
 ):
     print("USER: ", user)
-    conn_admin = get_conn(user="admin", password="admin")
-    temp_user = User(username=username).delete_user(
-        conn_admin, user["user_role"])
-    conn_admin.close()
+    temp_user = await run_db(
+        ROLE_ADMIN, User(username=username).delete_user, user["user_role"])
 
     return RedirectResponse(
         url="/account/0", 
         status_code=status.HTTP_303_SEE_OTHER
     )
 
+# A fresh idempotency key for each rendered purchase form: resubmitting the
+# form (double clicks, retries after a timeout) buys the game at most once
+def new_request_key() -> str:
+    return uuid.uuid4().hex
+
 @app.post("/purchase_game")
 async def purchase_game(request: Request, game_id: int = Form(...), 
+                        request_key: str = Form(None,
+                                                max_length=REQUEST_KEY_MAX),
                         user: dict = Depends(get_current_user)):
-    conn_admin = get_conn(user="admin", password="admin")
-    purchase = GameInfo(game_id=game_id).purchase_game(conn_admin, 
-                                                       user["user_id"])
-    conn_admin.close()
-
-    if purchase is None:
-        conn_admin = get_conn(user="admin", password="admin")
-        game = GameInfo(game_id=game_id).get_game_info(conn_admin)
-        conn_admin.close()
+    outcome = await run_db(
+        ROLE_ADMIN, GameInfo(game_id=game_id).purchase_game, user["user_id"],
+        request_key)
+
+    if outcome not in OWNED_OUTCOMES:
+        game = await game_page_info(game_id, user["user_id"])
         return templates.TemplateResponse(
             "game.html",
             {
                 "request": request,
                 "user": user,
                 "game": game,
-                "error": "Game could not be purchased."
+                "request_key": new_request_key(),
+                "error": PURCHASE_ERRORS.get(
+                    outcome, "Game could not be purchased.")
             }
         )
     
@@ -0,0 +1,110 @@
+"""
+Concurrency benchmark for database access from async handlers.
+
+Fires `--concurrency` slow filtered queries at once, `--rounds` times, and
+compares calling the blocking objects.py methods directly on the event loop
+against running them through database.aio.run_db. A ticker task measures how
+long the loop is stalled while the queries are in flight.
+
+Needs the games database from database/setup. Run from the project root:
+    python benchmarks/bench_async_db.py --tags 1,2 --concurrency 8
+    python benchmarks/bench_async_db.py --sleep 0.2
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.aio import run_db, shutdown_executors
+from database.db import ROLE_ADMIN, close_pools, get_pool
+from database.facets import parse_selection
+from database.objects import Games
+
+
+def sleep_query(conn, seconds: float):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT SLEEP(%s);", (seconds,))
+        return cursor.fetchall()
+
+
+def make_query(args):
+    if args.sleep:
+        return sleep_query, (args.sleep,), {}
+    selection = parse_selection(tag=[args.tags], genre=[args.genres])
+    return Games(games=[]).get_games_by_all_limit, (), {
+        "selection": selection,
+        "limit": 10,
+        "offset": args.offset,
+    }
+
+
+async def ticker(stop: asyncio.Event, interval: float = 0.005) -> float:
+    max_lag = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        max_lag = max(max_lag, time.perf_counter() - start - interval)
+    return max_lag
+
+
+async def blocking_call(fn, args, kwargs):
+    # what the handlers used to do: query straight on the event loop
+    with get_pool(ROLE_ADMIN).connection() as conn:
+        return fn(conn, *args, **kwargs)
+
+
+async def run_mode(name, call, fn, args, kwargs, concurrency, rounds):
+    stop = asyncio.Event()
+    tick = asyncio.create_task(ticker(stop))
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await asyncio.gather(
+            *(call(fn, args, kwargs) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    max_lag = await tick
+
+    total = concurrency * rounds
+    print(f"{name:>9}: {total} queries in {elapsed:.3f}s "
+          f"({total / elapsed:.1f} q/s), max loop stall "
+          f"{max_lag * 1000:.1f} ms")
+
+
+async def main(args):
+    fn, fn_args, fn_kwargs = make_query(args)
+
+    async def executor_call(fn, a, kw):
+        return await run_db(ROLE_ADMIN, fn, *a, **kw)
+
+    # warm the pool so connect time is not measured
+    await asyncio.gather(
+        *(executor_call(fn, fn_args, fn_kwargs)
+          for _ in range(args.concurrency)))
+
+    await run_mode("blocking", blocking_call, fn, fn_args, fn_kwargs,
+                   args.concurrency, args.rounds)
+    await run_mode("executor", executor_call, fn, fn_args, fn_kwargs,
+                   args.concurrency, args.rounds)
+    print(get_pool(ROLE_ADMIN).stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--tags", default="1,2,3")
+    parser.add_argument("--genres", default="1")
+    parser.add_argument("--offset", type=int, default=500)
+    parser.add_argument("--sleep", type=float, default=0.0,
+                        help="use SELECT SLEEP(n) instead of a filter query")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(main(args))
+    finally:
+        shutdown_executors()
+        close_pools()
@@ -0,0 +1,136 @@
+"""
+Benchmark for the response compression middleware.
+
+Pushes a listing page through compression.CompressionMiddleware in front of
+a stub ASGI app and reports bytes on the wire and CPU time per request for
+each available coding: uncached (every response compressed), cached (the
+compressed variant comes from compressed_cache) and streamed (chunked body
+compressed as it goes).
+
+The page is a synthetic home page with every attribute checkbox in the
+sidebar, like index.html before the sidebar was paged, unless --html points
+at a saved page (e.g. `curl -b cookies.txt localhost:8000/home/0 > home.html`).
+
+Run from the project root:
+    python benchmarks/bench_compression.py --requests 200
+    python benchmarks/bench_compression.py --html home.html
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compression import CODINGS, CompressionMiddleware
+from database.cache import SizedLRUCache
+
+# sidebar list -> number of checkboxes
+SIDEBAR = {
+    'genre': 30,
+    'category': 40,
+    'tag': 450,
+    'lang': 100,
+    'audio_lang': 100,
+}
+CHUNK = 16 * 1024
+
+
+def synthetic_page() -> bytes:
+    parts = ['<html><head><title>Home</title></head><body>',
+             '<div class="container"><div class="row mx-auto">',
+             '<div class="col-md-3 mx-auto"><form method="post">']
+    for kind, n in SIDEBAR.items():
+        parts.append(f'<label for="{kind}">{kind.title()}</label>'
+                     f'<div class="form-group overflow-auto" id="{kind}-options">')
+        for i in range(n):
+            parts.append(
+                f'<div class="form-check ml-3"><input class="form-check-input" '
+                f'type="checkbox" value="{i}" id="{i}" name="{kind}">'
+                f'<label class="form-check label" for="{i}">{kind} name {i} '
+                f'({(i * 7919) % 5000})</label></div>')
+        parts.append('</div>')
+    parts.append('</form></div><div class="col-md-9 mx-auto"><div class="row">')
+    for i in range(10):
+        parts.append(
+            f'<div class="col-md-5 mx-auto"><a href="/games/{1000 + i}">'
+            f'<h3>Game {i}</h3><img src="https://cdn.example.com/apps/'
+            f'{1000 + i}/header.jpg" class="img-responsive shadow-lg p-3 '
+            f'mb-5 bg-white rounded"></a></div>')
+    parts.append('</div></div></div></div></body></html>')
+    return ''.join(parts).encode()
+
+
+def make_app(body: bytes, stream: bool):
+    async def app(scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/html; charset=utf-8")],
+        })
+        if not stream:
+            await send({"type": "http.response.body", "body": body})
+            return
+        for i in range(0, len(body), CHUNK):
+            await send({"type": "http.response.body",
+                        "body": body[i:i + CHUNK], "more_body": True})
+        await send({"type": "http.response.body", "body": b"",
+                    "more_body": False})
+    return app
+
+
+async def run(app, coding: str, requests: int):
+    """
+    Returns (bytes on the wire per response, CPU ms per request).
+    """
+    scope = {"type": "http",
+             "headers": [(b"accept-encoding", coding.encode())]}
+    sent = 0
+
+    async def send(message):
+        nonlocal sent
+        sent += len(message.get("body", b""))
+
+    start = time.process_time()
+    for _ in range(requests):
+        await app(scope, None, send)
+    cpu = time.process_time() - start
+    return sent // requests, cpu / requests * 1000
+
+
+async def main(args):
+    if args.html:
+        with open(args.html, 'rb') as f:
+            body = f.read()
+    else:
+        body = synthetic_page()
+    print(f"page: {len(body)} bytes, codings available: {', '.join(CODINGS)}")
+    print()
+
+    modes = [("identity", "identity", None, False)]
+    for coding in CODINGS:
+        modes += [
+            (f"{coding} uncached", coding, None, False),
+            (f"{coding} cached", coding, SizedLRUCache(64 * 1024 * 1024),
+             False),
+            (f"{coding} streamed", coding, None, True),
+        ]
+
+    for name, coding, cache, stream in modes:
+        app = CompressionMiddleware(make_app(body, stream), cache=cache)
+        if cache is not None:
+            await run(app, coding, 1)
+        wire, cpu = await run(app, coding, args.requests)
+        print(f"{name:<18} {wire:>9} bytes ({wire / len(body):6.1%})  "
+              f"{cpu:8.3f} ms CPU/request")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--html", default=None,
+                        help="saved page to compress instead of the "
+                             "synthetic one")
+    asyncio.run(main(parser.parse_args()))
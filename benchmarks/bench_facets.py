@@ -0,0 +1,107 @@
+"""
+Microbenchmark for the in-memory facet index.
+
+Builds a synthetic catalog shaped like the Steam dataset (about 70k games,
+~400 tags, ~30 genres, ~40 categories, ~100 languages, tens of thousands of
+developers and publishers) and times AND-filters of growing size, then the
+batched per-facet counts shown in the sidebar.
+
+Run from the project root:
+    python benchmarks/bench_facets.py --games 70000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.facets import FacetIndex
+
+# facet type -> (number of attributes, attributes per game)
+SHAPE = {
+    'genre': (30, 3),
+    'category': (40, 5),
+    'tag': (400, 15),
+    'lang': (100, 6),
+    'audio_lang': (100, 2),
+    'developer': (40000, 1),
+    'publisher': (30000, 1),
+}
+
+
+def build_catalog(n_games: int, seed: int = 0):
+    rng = random.Random(seed)
+    game_ids = list(range(10, 10 + n_games * 3, 3))
+    relations = {}
+    for facet_type, (n_attrs, per_game) in SHAPE.items():
+        # skewed popularity: low ids are far more common, as in real tags
+        weights = [1.0 / (i + 1) for i in range(n_attrs)]
+        rows = []
+        for gid in game_ids:
+            for attr in set(rng.choices(range(1, n_attrs + 1), weights,
+                                        k=per_game)):
+                rows.append((gid, attr))
+        relations[facet_type] = rows
+    return game_ids, relations
+
+
+def timeit(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main(args):
+    game_ids, relations = build_catalog(args.games)
+    start = time.perf_counter()
+    index = FacetIndex(game_ids, relations)
+    print(f"built index over {len(game_ids)} games in "
+          f"{time.perf_counter() - start:.2f}s")
+
+    selections = [
+        {'genre': [1]},
+        {'genre': [1], 'category': [2]},
+        {'genre': [1], 'category': [2], 'tag': [1, 3]},
+        {'genre': [1], 'category': [2], 'tag': [1, 3], 'lang': [1]},
+        {'genre': [1, 2], 'category': [2, 4], 'tag': [1, 3, 5],
+         'lang': [1, 2]},
+        {'tag': [120, 7], 'developer': [3]},
+    ]
+    for selection in selections:
+        facets = sum(len(v) for v in selection.values())
+        total, _ = index.page(selection)
+        first = timeit(lambda: index.page(selection, 10, 0), args.repeat)
+        deep = timeit(lambda: index.page(selection, 10, total // 2),
+                      args.repeat)
+        print(f"{facets} facets, {total:>6} matches: first page "
+              f"{first * 1e6:8.1f} us, middle page {deep * 1e6:8.1f} us")
+
+    # sidebar counts: every tag (the ~400 case) plus the rest of the sidebar,
+    # with 5 facets already selected
+    print()
+    count_selections = [
+        {},
+        {'genre': [1]},
+        {'genre': [1], 'category': [2], 'tag': [1, 3], 'lang': [1]},
+        {'genre': [2], 'category': [5], 'tag': [9, 14], 'lang': [3]},
+    ]
+    for selection in count_selections:
+        facets = sum(len(v) for v in selection.values())
+        total = index.match(selection).count
+        tags = timeit(lambda: index.counts(selection, ['tag']), args.repeat)
+        sidebar = timeit(lambda: index.counts(selection), args.repeat // 10
+                         or 1)
+        print(f"counts with {facets} facets, {total:>6} matches: "
+              f"{len(index.postings['tag'])} tags {tags * 1e3:7.2f} ms, "
+              f"full sidebar {sidebar * 1e3:7.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=70000)
+    parser.add_argument("--repeat", type=int, default=200)
+    main(parser.parse_args())
@@ -0,0 +1,209 @@
+"""
+Concurrent load test for the purchase engine (database/purchases.py).
+
+Creates `--users` throwaway users with a balance that covers only about
+`--budget` of the `--games` games picked for the run, then fires every
+(user, game) purchase `--duplicates` times at once from `--concurrency`
+threads, each with its own admin connection: double clicks, retries of the
+same request (same idempotency key) and fresh requests for a game already
+being bought, all racing on the same user rows. Reports purchases/sec,
+latency and outcomes, then checks the database for anomalies:
+
+- a game bought twice by one user
+- a negative balance
+- a balance that does not match starting balance minus purchases
+- outcomes that disagree with the rows (PURCHASED exactly once per row)
+
+Needs the games database from database/setup with the current schema.
+The test users are named bench_purchase_* and are deleted before and
+after the run (their purchases go with them).
+
+Run from the project root:
+    python benchmarks/bench_purchases.py --users 50 --games 20 --duplicates 4
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.db import ConnectionPool, CREDENTIALS, ROLE_ADMIN
+from database.purchases import PURCHASED, make_purchase, purchase_stats
+
+USER_PREFIX = "bench_purchase_"
+
+
+def cleanup(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("DELETE FROM user WHERE username LIKE %s",
+                       (USER_PREFIX + "%",))
+    conn.commit()
+
+
+def setup(conn, args, rng: random.Random):
+    """
+    Returns ({user_id: starting balance}, {game_id: price}).
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT game_id, price_usd FROM game WHERE price_usd > 0 "
+            "ORDER BY game_id LIMIT 1000")
+        candidates = cursor.fetchall()
+    games = dict(rng.sample(candidates, min(args.games, len(candidates))))
+    balance = (sum(games.values()) * Decimal(str(args.budget))) \
+        .quantize(Decimal("0.01"))
+
+    users = {}
+    with conn.cursor() as cursor:
+        for i in range(args.users):
+            cursor.execute(
+                "INSERT INTO user (username, balance, password_hash, salt, "
+                "user_role, date_joined) VALUES (%s, %s, %s, %s, 'user', "
+                "CURDATE())",
+                (f"{USER_PREFIX}{i}", balance, b"0" * 64, "benchslt"))
+            users[cursor.lastrowid] = balance
+    conn.commit()
+    return users, games
+
+
+def attempts(users, games, args, rng: random.Random) -> list:
+    """
+    Every (user, game) pair `--duplicates` times. Half the copies reuse the
+    first copy's request key (a retried request), the rest carry their own
+    (the same purchase started again).
+    """
+    work = []
+    for user_id in users:
+        for game_id in games:
+            key = uuid.uuid4().hex
+            for d in range(args.duplicates):
+                work.append((user_id, game_id,
+                             key if d % 2 == 0 else uuid.uuid4().hex))
+    rng.shuffle(work)
+    return work
+
+
+def check(conn, users, games, results) -> list:
+    """
+    Returns a description of every anomaly found.
+    """
+    anomalies = []
+    ids = tuple(users)
+    marks = ", ".join(["%s"] * len(ids))
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"SELECT user_id, game_id, COUNT(*), SUM(purchase_price) "
+            f"FROM purchases WHERE user_id IN ({marks}) "
+            f"GROUP BY user_id, game_id", ids)
+        rows = cursor.fetchall()
+        cursor.execute(
+            f"SELECT user_id, balance FROM user WHERE user_id IN ({marks})",
+            ids)
+        balances = dict(cursor.fetchall())
+    conn.commit()
+
+    spent = Counter()
+    owned = set()
+    for user_id, game_id, count, paid in rows:
+        owned.add((user_id, game_id))
+        spent[user_id] += paid
+        if count > 1:
+            anomalies.append(f"user {user_id} owns game {game_id} {count}x")
+        if paid != games[game_id] * count:
+            anomalies.append(
+                f"user {user_id} paid {paid} for game {game_id}")
+
+    for user_id, start in users.items():
+        if balances[user_id] < 0:
+            anomalies.append(
+                f"user {user_id} balance is {balances[user_id]}")
+        if balances[user_id] != start - spent[user_id]:
+            anomalies.append(
+                f"user {user_id} balance {balances[user_id]} != "
+                f"{start} - {spent[user_id]}")
+
+    purchased = Counter(
+        (user_id, game_id) for (user_id, game_id, _), outcome in results
+        if outcome == PURCHASED)
+    for pair in owned | set(purchased):
+        if purchased[pair] != (1 if pair in owned else 0):
+            anomalies.append(
+                f"user {pair[0]} game {pair[1]}: {purchased[pair]} "
+                f"PURCHASED outcomes, {int(pair in owned)} rows")
+    return anomalies
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    user, password = CREDENTIALS[ROLE_ADMIN]
+    pool = ConnectionPool(user, password, args.concurrency)
+
+    with pool.connection() as conn:
+        cleanup(conn)
+        users, games = setup(conn, args, rng)
+    work = attempts(users, games, args, rng)
+
+    results = []
+    latencies = []
+    lock = threading.Lock()
+
+    def buy(item):
+        start = time.perf_counter()
+        with pool.connection() as conn:
+            outcome = make_purchase(conn, *item)
+        elapsed = time.perf_counter() - start
+        with lock:
+            results.append((item, outcome))
+            latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(buy, work))
+    elapsed = time.perf_counter() - start
+
+    try:
+        with pool.connection() as conn:
+            anomalies = check(conn, users, games, results)
+    finally:
+        if not args.keep:
+            with pool.connection() as conn:
+                cleanup(conn)
+        pool.close()
+
+    latencies.sort()
+    outcomes = Counter(outcome for _, outcome in results)
+    print(f"{len(work)} requests from {args.concurrency} threads in "
+          f"{elapsed:.3f}s: {len(work) / elapsed:.0f} requests/s, "
+          f"{outcomes[PURCHASED] / elapsed:.0f} purchases/s")
+    print(f"latency p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+    print("outcomes:", dict(outcomes))
+    print("engine:", purchase_stats())
+    print(f"anomalies: {len(anomalies)}")
+    for anomaly in anomalies[:20]:
+        print("  " + anomaly)
+    return 1 if anomalies else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--duplicates", type=int, default=4,
+                        help="concurrent copies of each purchase")
+    parser.add_argument("--budget", type=float, default=0.6,
+                        help="share of the games' total price each user "
+                             "can afford")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true",
+                        help="keep the test users and purchases")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,161 @@
+"""
+Microbenchmark for mapping database rows to the objects.py models.
+
+Compares the validated mapping the list methods used to do (one pydantic
+model per row with full validation, then validating the container again)
+against the trusted path (game_from_row / user_from_row / trusted_model) for
+game, user and attributes_view rows, at 10, 1k and 100k rows. Rows are
+synthetic but have the types mysql.connector returns for our schema
+(DECIMAL as Decimal, DATE as date, BINARY as bytes). Both paths are checked
+to produce equal models first.
+
+Run from the project root:
+    python benchmarks/bench_row_mapping.py
+    python benchmarks/bench_row_mapping.py --sizes 10,1000 --repeat 20
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.objects import (
+    ATTRIBUTE_FIELDS,
+    Attribute,
+    Attributes,
+    Game,
+    Games,
+    User,
+    Users,
+    trusted_model,
+    game_from_row,
+    get_supported_platforms,
+    user_from_row
+)
+
+
+def game_rows(n: int, rng: random.Random) -> list:
+    return [(
+        i,
+        f"Game {i}",
+        datetime.date(2000 + i % 24, 1 + i % 12, 1 + i % 28),
+        "20000 - 50000",
+        Decimal(f"{rng.randint(0, 6000) / 100:.2f}"),
+        "About game " * 20,
+        rng.randint(0, 100),
+        f"{rng.randint(0, 7):03b}",
+        f"https://cdn.example.com/apps/{i}/header.jpg",
+    ) for i in range(n)]
+
+
+def user_rows(n: int, rng: random.Random) -> list:
+    return [(
+        i,
+        f"user{i}",
+        Decimal(f"{rng.randint(0, 20000) / 100:.2f}"),
+        bytes(f"{rng.getrandbits(256):064x}", "ascii"),
+        f"{rng.getrandbits(32):08x}",
+        "user",
+        datetime.date(2024, 1 + i % 12, 1 + i % 28),
+    ) for i in range(n)]
+
+
+def attribute_rows(n: int, rng: random.Random) -> list:
+    types = list(ATTRIBUTE_FIELDS)
+    return [(types[i % len(types)], i, f"name {i}") for i in range(n)]
+
+
+# the mapping the list methods did before the trusted path
+def validated_games(rows):
+    return Games(games=[Game(
+        game_id=row[0],
+        game_name=row[1],
+        release_date=row[2],
+        estimated_owners=row[3],
+        price_usd=row[4],
+        about_game=row[5],
+        metacritic_score=row[6],
+        platform_support=get_supported_platforms(row[7]) if row[7] else None,
+        header_image=row[8]
+    ) for row in rows])
+
+
+def validated_users(rows):
+    return Users(users=[User(
+        user_id=row[0],
+        username=row[1],
+        balance=row[2],
+        password_hash=row[3],
+        salt=row[4],
+        user_role=row[5],
+        date_joined=row[6]
+    ) for row in rows])
+
+
+def validated_attributes(rows):
+    lists = {t: [] for t in ATTRIBUTE_FIELDS}
+    for row in rows:
+        lists[row[0]].append({'id': row[1], 'name': row[2]})
+    return Attributes(**{f: lists[t] for t, f in ATTRIBUTE_FIELDS.items()})
+
+
+def trusted_games(rows):
+    return Games.construct(games=[game_from_row(row) for row in rows])
+
+
+def trusted_users(rows):
+    return Users.construct(users=[user_from_row(row) for row in rows])
+
+
+def trusted_attributes(rows):
+    lists = {t: [] for t in ATTRIBUTE_FIELDS}
+    for row in rows:
+        lists[row[0]].append(
+            trusted_model(Attribute, id=row[1], name=row[2]))
+    return Attributes.construct(
+        **{f: lists[t] for t, f in ATTRIBUTE_FIELDS.items()})
+
+
+CASES = (
+    ("game", game_rows, validated_games, trusted_games),
+    ("user", user_rows, validated_users, trusted_users),
+    ("attribute", attribute_rows, validated_attributes, trusted_attributes),
+)
+
+
+def timeit(fn, rows, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(args):
+    rng = random.Random(0)
+    sizes = [int(s) for s in args.sizes.split(",")]
+    for name, make_rows, validated, trusted in CASES:
+        check = make_rows(50, rng)
+        assert validated(check).dict() == trusted(check).dict(), name
+
+        for n in sizes:
+            rows = make_rows(n, rng)
+            repeat = max(1, min(args.repeat, 200000 // max(n, 1)))
+            slow = timeit(validated, rows, repeat)
+            fast = timeit(trusted, rows, repeat)
+            print(f"{name:<9} {n:>7} rows: validated {slow * 1000:9.3f} ms "
+                  f"trusted {fast * 1000:9.3f} ms  ({slow / fast:4.1f}x)")
+        print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10,1000,100000")
+    parser.add_argument("--repeat", type=int, default=50)
+    main(parser.parse_args())
@@ -0,0 +1,121 @@
+"""
+Load test for single-flight coalescing of database reads.
+
+Reproduces the thundering herd behind a viral game page or an expired
+catalog cache: `--concurrency` requests for the same key arrive together,
+`--rounds` times, and each either runs its own query or goes through
+database.aio.SingleFlight. Reports queries issued, calls coalesced, wall
+time and per-request latency.
+
+By default the query is simulated: it holds one of POOL_SIZES[client]
+worker threads for `--latency` seconds, like a query holding a pooled
+connection, so uncoalesced herds queue behind the pool. With --game it runs
+the real game page detail query through run_db instead (needs the games
+database from database/setup).
+
+Run from the project root:
+    python benchmarks/bench_single_flight.py --concurrency 200 --latency 0.05
+    python benchmarks/bench_single_flight.py --game 10 --concurrency 100
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.aio import SingleFlight, run_db, shutdown_executors
+from database.db import POOL_SIZES, ROLE_CLIENT, close_pools
+from database.objects import GameInfo
+
+
+def make_query(args):
+    """
+    Returns (coroutine function running one query, executed-query counter).
+    """
+    executed = [0]
+    lock = threading.Lock()
+
+    if args.game is not None:
+        fn = GameInfo(game_id=args.game).get_game_detail
+
+        async def query():
+            with lock:
+                executed[0] += 1
+            return await run_db(ROLE_CLIENT, fn)
+        return query, executed
+
+    pool = ThreadPoolExecutor(max_workers=POOL_SIZES[ROLE_CLIENT])
+
+    def slow_query():
+        with lock:
+            executed[0] += 1
+        time.sleep(args.latency)
+        return object()
+
+    async def query():
+        return await asyncio.get_running_loop().run_in_executor(
+            pool, slow_query)
+    return query, executed
+
+
+async def request(call) -> float:
+    start = time.perf_counter()
+    await call()
+    return time.perf_counter() - start
+
+
+async def run_mode(name, call, args, executed):
+    executed[0] = 0
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        latencies += await asyncio.gather(
+            *(request(call) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{name:>12}: {len(latencies)} requests, {executed[0]} queries, "
+          f"{elapsed:.3f}s wall, p50 {p50 * 1000:.1f} ms, "
+          f"p99 {p99 * 1000:.1f} ms")
+
+
+async def main(args):
+    query, executed = make_query(args)
+    flight = SingleFlight()
+
+    async def direct():
+        return await query()
+
+    async def coalesced():
+        return await flight.run(("bench", args.game), query)
+
+    # warm up (pool connections, thread start-up)
+    await asyncio.gather(*(direct() for _ in range(POOL_SIZES[ROLE_CLIENT])))
+
+    await run_mode("direct", direct, args, executed)
+    await run_mode("single-flight", coalesced, args, executed)
+    print(flight.stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="simulated query time in seconds")
+    parser.add_argument("--game", type=int, default=None,
+                        help="query this game's detail row instead")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(main(args))
+    finally:
+        shutdown_executors()
+        close_pools()
@@ -0,0 +1,134 @@
+"""
+Time-to-first-byte and peak memory of the home page, buffered vs streamed.
+
+Renders the real index.html / _listing.html / _sidebar.html templates with a
+synthetic catalog. The sidebar is built the way sidebar_fragment builds it
+(facet counts from a FacetIndex, then the _sidebar.html render), with the
+fragment cache cold. "buffered" computes the sidebar and renders the page to
+one string before sending anything, as TemplateResponse did; "streamed" goes
+through streaming.render_chunks with the sidebar deferred.
+
+Run from the project root:
+    python benchmarks/bench_streaming.py --games 20000 --repeat 20
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import jinja2
+
+from bench_facets import SHAPE, build_catalog
+from database.facets import FacetIndex
+from streaming import Deferred, render_chunks
+
+Item = namedtuple('Item', 'id name')
+Game = namedtuple('Game', 'game_id game_name header_image')
+
+LIST_FACETS = ('genre', 'category', 'tag', 'lang')
+SIDEBAR_INITIAL = 15
+
+
+def make_env() -> jinja2.Environment:
+    env = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(os.path.join(ROOT, 'templates')),
+        autoescape=jinja2.select_autoescape()
+    )
+    env.globals['url_for'] = \
+        lambda name, **params: '/' + name + ''.join(
+            f'/{v}' for v in params.values())
+    return env
+
+
+def sidebar_context(index: FacetIndex, selection: dict) -> dict:
+    checked = {t: set(selection.get(t, ())) for t in
+               LIST_FACETS + ('developer', 'publisher')}
+    shown = {
+        t: [Item(i, f'{t} {i}')
+            for i in range(1, min(SHAPE[t][0], SIDEBAR_INITIAL) + 1)]
+        for t in LIST_FACETS
+    }
+    counts = index.counts(selection, list(LIST_FACETS))
+    return {
+        'request': None,
+        'genres': shown['genre'],
+        'categories': shown['category'],
+        'tags': shown['tag'],
+        'langs': shown['lang'],
+        'audio_langs': [Item(i, f'audio {i}')
+                        for i in range(1, SHAPE['audio_lang'][0] + 1)],
+        'developers': [],
+        'publishers': [],
+        'counts': counts,
+        'checked': checked,
+        'query': None,
+    }
+
+
+async def measure(make_stream) -> tuple:
+    """
+    Returns (seconds to first chunk, seconds to last chunk, peak bytes).
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    first = None
+    async for chunk in make_stream():
+        if first is None:
+            first = time.perf_counter() - start
+    total = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return first, total, peak
+
+
+async def main(args):
+    game_ids, relations = build_catalog(args.games)
+    index = FacetIndex(game_ids, relations)
+    env = make_env()
+    page = env.get_template('index.html')
+    listing_template = env.get_template('_listing.html')
+    sidebar_template = env.get_template('_sidebar.html')
+
+    selection = {'genre': [1], 'tag': [1, 3]}
+    games = [Game(gid, f'Game {gid}', f'https://cdn.example.com/{gid}.jpg')
+             for gid in index.page(selection, 10, 0)[1]]
+    listing = listing_template.render(
+        request=None, games=games, page=0, prev_page='/home/0',
+        next_page='/home/1', checked=selection, query=None)
+    user = {'username': 'bench', 'user_role': 'user', 'user_id': 1}
+
+    async def make_sidebar():
+        return sidebar_template.render(sidebar_context(index, selection))
+
+    async def buffered():
+        sidebar = await make_sidebar()
+        yield page.render(request=None, user=user, listing=listing,
+                          sidebar=sidebar).encode()
+
+    def streamed():
+        sidebar = Deferred('sidebar', make_sidebar)
+        return render_chunks(page, {'request': None, 'user': user,
+                                    'listing': listing, 'sidebar': sidebar},
+                             [sidebar])
+
+    for name, make_stream in (('buffered', buffered), ('streamed', streamed)):
+        results = [await measure(make_stream) for _ in range(args.repeat)]
+        ttfb = sorted(r[0] for r in results)[len(results) // 2]
+        total = sorted(r[1] for r in results)[len(results) // 2]
+        peak = max(r[2] for r in results)
+        print(f"{name:<9} TTFB {ttfb * 1000:7.2f} ms  total "
+              f"{total * 1000:7.2f} ms  peak {peak / 1024:8.1f} KiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
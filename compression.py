@@ -0,0 +1,303 @@
+"""
+Response compression.
+
+CompressionMiddleware negotiates a content coding from Accept-Encoding
+(brotli and zstd when their packages are installed, gzip always) and
+compresses text responses above a minimum size. Complete bodies are
+compressed in one go and the result is kept in compressed_cache, keyed by a
+digest of the uncompressed body, so identical pages are not compressed
+twice. Streamed bodies are collected up to STREAM_BUFFER_SIZE and, if they
+end within it, handled like complete ones; longer streams are compressed
+chunk by chunk.
+"""
+
+from typing import Dict, List, Optional, Tuple
+import gzip
+import hashlib
+import zlib
+
+from database.cache import SizedLRUCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# bodies smaller than this are sent as they are
+MINIMUM_SIZE = 1024
+# streamed bodies are held back up to this size: a page that ends within it
+# (such as /home and /search, whose slow parts are fetched before streaming
+# starts) is compressed once, through the cache, instead of with a flush per
+# chunk
+STREAM_BUFFER_SIZE = 64 * 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/json', 'application/javascript', 'image/svg+xml')
+
+# codings we can produce, in order of preference (best ratio first)
+CODINGS = tuple(
+    coding for coding, available in (
+        ('br', brotli is not None),
+        ('zstd', zstandard is not None),
+        ('gzip', True),
+    ) if available
+)
+
+# compressed variants of recent bodies: (body digest, coding) -> bytes
+COMPRESSED_CACHE_BYTES = 16 * 1024 * 1024
+compressed_cache = SizedLRUCache(COMPRESSED_CACHE_BYTES)
+
+_stats = {
+    "responses": 0,
+    "streamed": 0,
+    "bytes_in": 0,
+    "bytes_out": 0,
+}
+
+
+def negotiate(accept_encoding: str,
+              codings: Tuple[str, ...] = CODINGS) -> Optional[str]:
+    """
+    Returns the first of `codings` (ours, by preference) that the client
+    accepts (q > 0), or None to send the body uncompressed.
+    """
+    accepted = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+
+    for coding in codings:
+        if accepted.get(coding, accepted.get('*', 0.0)) > 0:
+            return coding
+    return None
+
+
+def compress(data: bytes, coding: str) -> bytes:
+    if coding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if coding == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, GZIP_LEVEL, mtime=0)
+
+
+# Incremental compressor for streamed bodies; every chunk is flushed so the
+# client can start rendering before the body is complete
+class StreamCompressor:
+    def __init__(self, coding: str):
+        self.coding = coding
+        if coding == 'br':
+            self._obj = brotli.Compressor(quality=BROTLI_QUALITY)
+        elif coding == 'zstd':
+            self._obj = zstandard.ZstdCompressor(
+                level=ZSTD_LEVEL).compressobj()
+        else:
+            self._obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.coding == 'br':
+            return self._obj.process(data) + self._obj.flush()
+        if self.coding == 'zstd':
+            return self._obj.compress(data) + \
+                self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.coding == 'br':
+            return self._obj.finish()
+        return self._obj.flush()
+
+
+def compression_stats() -> dict:
+    stats = dict(_stats, codings=list(CODINGS))
+    stats["ratio"] = (stats["bytes_out"] / stats["bytes_in"]
+                      if stats["bytes_in"] else 0.0)
+    return stats
+
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[str]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode('latin-1')
+    return None
+
+
+def _compressed_headers(headers: List[Tuple[bytes, bytes]], coding: str,
+                        length: Optional[int]) -> List[Tuple[bytes, bytes]]:
+    out = []
+    vary = None
+    for key, value in headers:
+        name = key.lower()
+        if name == b'content-length':
+            continue
+        if name == b'vary':
+            vary = value
+            continue
+        if name == b'etag' and not value.startswith(b'W/'):
+            # the compressed bytes are a different representation
+            value = b'W/' + value
+        out.append((key, value))
+
+    out.append((b'content-encoding', coding.encode()))
+    if vary is None:
+        out.append((b'vary', b'Accept-Encoding'))
+    elif b'accept-encoding' not in vary.lower():
+        out.append((b'vary', vary + b', Accept-Encoding'))
+    else:
+        out.append((b'vary', vary))
+    if length is not None:
+        out.append((b'content-length', str(length).encode()))
+    return out
+
+
+# ASGI middleware compressing eligible responses
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = MINIMUM_SIZE,
+                 cache: SizedLRUCache = None,
+                 stream_buffer_size: int = STREAM_BUFFER_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache = cache
+        self.stream_buffer_size = stream_buffer_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept = _header(scope.get("headers", []), b'accept-encoding')
+        coding = negotiate(accept) if accept else None
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressingSend(
+            send, coding, self.minimum_size, self.cache,
+            self.stream_buffer_size)
+        await self.app(scope, receive, responder)
+
+
+# Wraps `send` for one response: holds back the start message until the
+# body shows whether and how to compress
+class _CompressingSend:
+    def __init__(self, send, coding: str, minimum_size: int,
+                 cache: Optional[SizedLRUCache], stream_buffer_size: int):
+        self.send = send
+        self.coding = coding
+        self.minimum_size = minimum_size
+        self.cache = cache
+        self.stream_buffer_size = stream_buffer_size
+        self.start: Optional[Dict] = None
+        self.stream: Optional[StreamCompressor] = None
+        self.passthrough = False
+        # body chunks held back while the size of a streamed body is unknown
+        self.buffer: Optional[List[bytes]] = None
+        self.buffered = 0
+
+    def _eligible(self) -> bool:
+        if self.start["status"] in (204, 206, 304):
+            return False
+        headers = self.start.get("headers", [])
+        if _header(headers, b'content-encoding') is not None:
+            return False
+        content_type = _header(headers, b'content-type') or ''
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more = message.get("more_body", False)
+
+        if self.stream is not None:
+            await self._send_chunk(body, more)
+            return
+
+        headers = self.start.get("headers", [])
+        if self.buffer is None:
+            # first body message
+            if not self._eligible() or \
+                    (not more and len(body) < self.minimum_size):
+                self.passthrough = True
+                await self.send(self.start)
+                await self.send(message)
+                return
+            self.buffer = []
+
+        if more or self.buffer:
+            self.buffer.append(body)
+            self.buffered += len(body)
+            if more and self.buffered < self.stream_buffer_size:
+                return
+            body = b"".join(self.buffer)
+            self.buffer = []
+
+        if more:
+            # long streamed response: compress as it goes, length unknown
+            self.stream = StreamCompressor(self.coding)
+            _stats["streamed"] += 1
+            _stats["responses"] += 1
+            await self.send(dict(
+                self.start,
+                headers=_compressed_headers(headers, self.coding, None)))
+            await self._send_chunk(body, more)
+            return
+
+        if len(body) < self.minimum_size:
+            # a short stream, now complete
+            self.passthrough = True
+            await self.send(self.start)
+            await self.send({"type": "http.response.body", "body": body,
+                             "more_body": False})
+            return
+
+        key = None
+        compressed = None
+        if self.cache is not None:
+            key = (hashlib.blake2b(body, digest_size=16).digest(),
+                   self.coding)
+            compressed = self.cache.get(key)
+        if compressed is None:
+            compressed = compress(body, self.coding)
+            if key is not None:
+                self.cache.put(key, compressed)
+
+        _stats["responses"] += 1
+        _stats["bytes_in"] += len(body)
+        _stats["bytes_out"] += len(compressed)
+        await self.send(dict(
+            self.start,
+            headers=_compressed_headers(headers, self.coding,
+                                        len(compressed))))
+        await self.send({"type": "http.response.body", "body": compressed,
+                         "more_body": False})
+
+    async def _send_chunk(self, body: bytes, more: bool):
+        chunk = self.stream.compress(body) if body else b""
+        if not more:
+            chunk += self.stream.finish()
+        _stats["bytes_in"] += len(body)
+        _stats["bytes_out"] += len(chunk)
+        await self.send({"type": "http.response.body", "body": chunk,
+                         "more_body": more})
@@ -0,0 +1,209 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+import mysql.connector
+
+from database.db import POOL_SIZES, ROLE_CLIENT, PoolTimeout, get_pool
+
+# what run_db raises when the database is unreachable or overloaded
+DB_ERRORS = (mysql.connector.Error, PoolTimeout)
+
+# One executor per role, sized to that role's pool, so a worker thread never
+# blocks waiting for a connection and admin work cannot starve client reads
+_executors = {}
+
+
+def get_executor(role: str = ROLE_CLIENT) -> ThreadPoolExecutor:
+    executor = _executors.get(role)
+    if executor is None:
+        executor = ThreadPoolExecutor(
+            max_workers=POOL_SIZES[role],
+            thread_name_prefix=f"db-{role}"
+        )
+        _executors[role] = executor
+    return executor
+
+
+def _call_with_conn(role: str, fn: Callable, args: tuple, kwargs: dict):
+    with get_pool(role).connection() as conn:
+        return fn(conn, *args, **kwargs)
+
+
+async def run_db(role: str, fn: Callable, *args, **kwargs) -> Any:
+    """
+    Runs `fn(conn, *args, **kwargs)` on a pooled connection for `role` in a
+    worker thread and awaits the result, leaving the event loop free for
+    other requests while the query is in flight.
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(_call_with_conn, role, fn, args, kwargs)
+    return await loop.run_in_executor(get_executor(role), call)
+
+
+# Coalesces concurrent identical calls: while a call for a key is in flight,
+# later calls with the same key wait for it and get its result (or its
+# exception) instead of issuing their own
+class SingleFlight:
+    def __init__(self):
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.max_waiters = 0
+        self._waiters: Dict[Hashable, int] = {}
+
+    async def run(self, key: Hashable, make: Callable[[], Awaitable]) -> Any:
+        """
+        Awaits `make()`, or the call already in flight for `key`.
+        """
+        self.calls += 1
+        flight = self._flights.get(key)
+        if flight is None:
+            self.executions += 1
+            flight = asyncio.ensure_future(make())
+            self._flights[key] = flight
+            self._waiters[key] = 1
+            flight.add_done_callback(functools.partial(self._landed, key))
+        else:
+            self.coalesced += 1
+            self._waiters[key] += 1
+            self.max_waiters = max(self.max_waiters, self._waiters[key])
+        # a caller that is cancelled (client gone) must not cancel the call
+        # the others are waiting on
+        return await asyncio.shield(flight)
+
+    def _landed(self, key: Hashable, flight: asyncio.Future):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+            del self._waiters[key]
+        if not flight.cancelled() and flight.exception() is not None:
+            self.errors += 1
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "coalesced_rate": (self.coalesced / self.calls
+                               if self.calls else 0.0),
+            "errors": self.errors,
+            "in_flight": len(self._flights),
+            "max_waiters": self.max_waiters,
+        }
+
+
+single_flight = SingleFlight()
+
+
+async def shared_db(key: Hashable, role: str, fn: Callable, *args,
+                    **kwargs) -> Any:
+    """
+    run_db for reads: concurrent calls with the same `key` share one query.
+    The key must identify everything the result depends on, including any
+    state bound into `fn`.
+    """
+    call = functools.partial(run_db, role, fn, *args, **kwargs)
+    return await single_flight.run(key, call)
+
+
+_stale_stats = {
+    "stale_served": 0,
+    "stale_on_error": 0,
+    "revalidations": 0,
+    "revalidation_errors": 0,
+}
+# (cache id, key) -> background revalidation task
+_revalidating: Dict[Hashable, asyncio.Task] = {}
+
+
+async def _load(cache, key, role: str, fn: Callable, args: tuple,
+                kwargs: dict) -> Any:
+    """
+    Loads `key` into `cache`. Returns None if the load failed (the method
+    returned None or the database could not be reached).
+    """
+    try:
+        value = await shared_db((id(cache), key), role, fn, *args, **kwargs)
+    except DB_ERRORS as err:
+        print(err)
+        return None
+    cache.put(key, value)
+    return value
+
+
+async def cached_db(cache, key, role: str, fn: Callable, *args,
+                    **kwargs) -> Any:
+    """
+    Returns `key` from `cache`, running `fn` through run_db and storing the
+    result on a miss. Concurrent misses for the same key share one load.
+    Failed loads (None) are not cached; if one fails, the expired value
+    is returned while the cache still allows it (see get_stale).
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    value = await _load(cache, key, role, fn, args, kwargs)
+    if value is None:
+        stale = cache.get_stale(key)
+        if stale is not None:
+            _stale_stats["stale_on_error"] += 1
+            return stale[0]
+    return value
+
+
+async def swr_db(cache, key, role: str, fn: Callable, *args,
+                 **kwargs) -> Any:
+    """
+    cached_db with stale-while-revalidate: an expired value still within
+    the cache's max_stale is returned at once and reloaded in the
+    background. The stale value keeps being served until a reload
+    succeeds.
+    """
+    stale = cache.get_stale(key)
+    if stale is None:
+        return await cached_db(cache, key, role, fn, *args, **kwargs)
+
+    value, fresh = stale
+    if not fresh:
+        _stale_stats["stale_served"] += 1
+        flight = (id(cache), key)
+        if flight not in _revalidating:
+            _stale_stats["revalidations"] += 1
+            task = asyncio.ensure_future(
+                _revalidate(flight, cache, key, role, fn, args, kwargs))
+            _revalidating[flight] = task
+    return value
+
+
+async def _revalidate(flight, cache, key, role: str, fn: Callable,
+                      args: tuple, kwargs: dict):
+    try:
+        if await _load(cache, key, role, fn, args, kwargs) is None:
+            _stale_stats["revalidation_errors"] += 1
+    finally:
+        del _revalidating[flight]
+
+
+def stale_stats() -> dict:
+    return dict(_stale_stats, revalidating=len(_revalidating))
+
+
+async def fan_out(**lookups: Awaitable) -> Dict[str, Any]:
+    """
+    Awaits independent lookups (run_db, cached_db, ... calls) concurrently
+    and returns their results by name. Each query borrows its own pooled
+    connection, so the wait is the slowest lookup rather than the sum.
+    """
+    results = await asyncio.gather(*lookups.values())
+    return dict(zip(lookups, results))
+
+
+def shutdown_executors():
+    for executor in _executors.values():
+        executor.shutdown(wait=True)
+    _executors.clear()
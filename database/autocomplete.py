@@ -0,0 +1,162 @@
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+import unicodedata
+import mysql.connector
+
+# Suggestion kinds and the attributes_view type each one is built from
+# (games come from the game table)
+ATTRIBUTE_KINDS = ('developer', 'publisher', 'tag')
+KINDS = ('game',) + ATTRIBUTE_KINDS
+
+# Longest prefix accepted, and most suggestions returned per lookup
+MAX_PREFIX = 64
+MAX_SUGGESTIONS = 20
+
+
+def normalize(text: str) -> str:
+    """
+    Lowercases and strips accents so "Pokémon" matches "poke".
+    """
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+# Sorted-array prefix index over names. Every word start of a name is a key,
+# so "souls" finds "Dark Souls"; lookups are two binary searches.
+class PrefixIndex:
+    def __init__(self, entries: Iterable[Tuple[int, str]]):
+        """
+        entries: (id, display name) pairs.
+        """
+        self.names: Dict[int, str] = {}
+        keyed = []
+        for item_id, name in entries:
+            if not name:
+                continue
+            self.names[item_id] = name
+            key = normalize(name)
+            start = 0
+            while start < len(key):
+                keyed.append((key[start:start + MAX_PREFIX], item_id))
+                nxt = key.find(' ', start)
+                if nxt < 0:
+                    break
+                start = nxt + 1
+        keyed.sort()
+
+        self.keys: List[str] = [k for k, _ in keyed]
+        self.ids = array('I', (i for _, i in keyed))
+
+    def suggest(self, prefix: str,
+                limit: int = MAX_SUGGESTIONS) -> List[Tuple[int, str]]:
+        """
+        Returns up to `limit` (id, name) pairs whose name, or a word in it,
+        starts with `prefix`; whole-name matches come first.
+        """
+        prefix = normalize(prefix).strip()[:MAX_PREFIX]
+        if not prefix:
+            return []
+
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + '\uffff', lo)
+
+        # short prefixes can match most of the catalog; look at a bounded
+        # window of keys and keep whole-name matches first
+        hi = min(hi, lo + limit * 10)
+        leading, inner = [], []
+        seen = set()
+        for i in range(lo, hi):
+            item_id = self.ids[i]
+            if item_id in seen:
+                continue
+            seen.add(item_id)
+            name = self.names[item_id]
+            if normalize(name).startswith(prefix):
+                leading.append((item_id, name))
+            else:
+                inner.append((item_id, name))
+            if len(leading) >= limit:
+                break
+        return (leading + inner)[:limit]
+
+    def name(self, item_id: int) -> Optional[str]:
+        return self.names.get(item_id)
+
+
+# Attribute names of one facet type sorted by normalized name, for paging
+# through the list with an optional name prefix
+class NameList:
+    def __init__(self, entries: Iterable[Tuple[int, str]]):
+        keyed = sorted(
+            (normalize(name), item_id, name)
+            for item_id, name in entries if name
+        )
+        self.keys: List[str] = [k for k, _, _ in keyed]
+        self.items: List[Tuple[int, str]] = [(i, n) for _, i, n in keyed]
+
+    def page(self, prefix: str = "", offset: int = 0,
+             limit: int = 50) -> Tuple[int, List[Tuple[int, str]]]:
+        """
+        Returns (number of names starting with prefix, that slice of them).
+        """
+        prefix = normalize(prefix).strip()[:MAX_PREFIX]
+        lo, hi = 0, len(self.keys)
+        if prefix:
+            lo = bisect_left(self.keys, prefix)
+            hi = bisect_left(self.keys, prefix + '\uffff', lo)
+        start = min(lo + max(offset, 0), hi)
+        return hi - lo, self.items[start:min(start + limit, hi)]
+
+
+# Prefix indexes for every suggestion kind
+class Autocomplete:
+    def __init__(self, entries: Dict[str, Iterable[Tuple[int, str]]]):
+        self.indexes = {kind: PrefixIndex(entries.get(kind, ()))
+                        for kind in KINDS}
+
+    @classmethod
+    def load(cls, conn: mysql.connector.MySQLConnection) -> 'Autocomplete':
+        placeholders = ", ".join(["%s"] * len(ATTRIBUTE_KINDS))
+        try:
+            with conn.cursor() as cursor:
+                entries = {kind: [] for kind in KINDS}
+                cursor.execute("SELECT game_id, game_name FROM game;")
+                entries['game'] = cursor.fetchall()
+
+                cursor.execute(f"""
+                    SELECT type, id, name FROM attributes_view
+                    WHERE type IN ({placeholders});
+                    """, ATTRIBUTE_KINDS)
+                for kind, item_id, name in cursor.fetchall():
+                    entries[kind].append((item_id, name))
+
+            return cls(entries)
+        except mysql.connector.Error as err:
+            print(err)
+            return None
+
+    def suggest(self, kind: str, prefix: str,
+                limit: int = MAX_SUGGESTIONS) -> List[Tuple[int, str]]:
+        index = self.indexes.get(kind)
+        if index is None:
+            return []
+        return index.suggest(prefix, min(limit, MAX_SUGGESTIONS))
+
+    def name(self, kind: str, item_id: int) -> Optional[str]:
+        index = self.indexes.get(kind)
+        return None if index is None else index.name(item_id)
+
+
+_autocomplete: Optional[Autocomplete] = None
+
+def load_autocomplete(
+        conn: mysql.connector.MySQLConnection) -> Autocomplete:
+    global _autocomplete
+    autocomplete = Autocomplete.load(conn)
+    if autocomplete is not None:
+        _autocomplete = autocomplete
+    return autocomplete
+
+def get_autocomplete() -> Optional[Autocomplete]:
+    return _autocomplete
@@ -0,0 +1,269 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+import sys
+import threading
+import time
+
+
+# Process-level cache whose entries expire after `ttl` seconds and can be
+# dropped explicitly when the underlying data changes. Expired entries stay
+# readable through get_stale for another `max_stale` seconds, so callers can
+# serve them while reloading or when the reload fails.
+class TTLCache:
+    def __init__(self, ttl: float, max_stale: float = 0.0):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._entries: Dict[Hashable, tuple] = {}
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[Optional[Hashable]], None]] = []
+
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Returns the cached value, or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() < entry[1]:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def __contains__(self, key: Hashable) -> bool:
+        """
+        Whether `key` has a fresh entry, without counting a lookup.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and time.monotonic() < entry[1]
+
+    def get_stale(self, key: Hashable) -> Optional[Tuple[Any, bool]]:
+        """
+        Returns (value, fresh) for an entry that is fresh or expired less
+        than max_stale seconds ago, otherwise None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            now = time.monotonic()
+            if entry is None or now >= entry[1] + self.max_stale:
+                self.misses += 1
+                return None
+            if now < entry[1]:
+                self.hits += 1
+                return entry[0], True
+            self.stale_hits += 1
+            return entry[0], False
+
+    def put(self, key: Hashable, value: Any):
+        if value is None:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+
+    def invalidate(self, key: Hashable = None):
+        """
+        Drops one key, or every entry when key is None, and notifies
+        listeners registered with on_invalidate.
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+        for listener in self._listeners:
+            listener(key)
+
+    def expire(self, key: Hashable = None):
+        """
+        Like invalidate, but the entries stay readable through get_stale
+        for max_stale seconds.
+        """
+        now = time.monotonic()
+        with self._lock:
+            keys = list(self._entries) if key is None else [key]
+            for k in keys:
+                entry = self._entries.get(k)
+                if entry is not None and entry[1] > now:
+                    self._entries[k] = (entry[0], now)
+        for listener in self._listeners:
+            listener(key)
+
+    def on_invalidate(self, listener: Callable[[Optional[Hashable]], None]):
+        self._listeners.append(listener)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale_hits": self.stale_hits,
+            }
+
+
+# Least-recently-used cache bounded by entry count. Entries have no TTL;
+# expire() marks them stale (get misses, get_stale still returns them for
+# `max_stale` seconds) until they are replaced or evicted.
+class LRUCache:
+    def __init__(self, max_entries: int, max_stale: float = 0.0):
+        self.max_entries = max_entries
+        self.max_stale = max_stale
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        # key -> monotonic time until which an expired entry may be served
+        self._expired: Dict[Hashable, float] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None or key in self._expired:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __contains__(self, key: Hashable) -> bool:
+        """
+        Whether `key` has a fresh entry, without counting a lookup or
+        refreshing its recency.
+        """
+        with self._lock:
+            return key in self._entries and key not in self._expired
+
+    def get_stale(self, key: Hashable) -> Optional[Tuple[Any, bool]]:
+        """
+        Returns (value, fresh) for a fresh entry or one expired less than
+        max_stale seconds ago, otherwise None.
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            until = self._expired.get(key)
+            if until is not None and time.monotonic() >= until:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if until is None:
+                self.hits += 1
+                return value, True
+            self.stale_hits += 1
+            return value, False
+
+    def put(self, key: Hashable, value: Any):
+        if value is None:
+            return
+        with self._lock:
+            self._expired.pop(key, None)
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                old, _ = self._entries.popitem(last=False)
+                self._expired.pop(old, None)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable = None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._expired.clear()
+            else:
+                self._entries.pop(key, None)
+                self._expired.pop(key, None)
+
+    def expire(self, key: Hashable = None):
+        """
+        Like invalidate, but the entries stay readable through get_stale
+        for max_stale seconds.
+        """
+        if not self.max_stale:
+            self.invalidate(key)
+            return
+        until = time.monotonic() + self.max_stale
+        with self._lock:
+            keys = list(self._entries) if key is None else \
+                [key] if key in self._entries else []
+            for k in keys:
+                self._expired.setdefault(k, until)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "stale": len(self._expired),
+                "stale_hits": self.stale_hits,
+                "evictions": self.evictions,
+            }
+
+
+# LRU cache bounded by the total size of its values as well as their number,
+# for entries whose sizes vary widely such as rendered page fragments
+class SizedLRUCache(LRUCache):
+    def __init__(self, max_bytes: int, max_entries: int = 100_000,
+                 sizeof: Callable[[Any], int] = sys.getsizeof,
+                 max_stale: float = 0.0):
+        super().__init__(max_entries, max_stale)
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._sizes: Dict[Hashable, int] = {}
+        self.bytes = 0
+
+    def put(self, key: Hashable, value: Any):
+        """
+        Stores a value, evicting least-recently-used entries until the cache
+        is back under budget. Values larger than the whole budget are not
+        stored.
+        """
+        if value is None:
+            return
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._expired.pop(key, None)
+            self.bytes -= self._sizes.pop(key, 0)
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._sizes[key] = size
+            self.bytes += size
+            while self.bytes > self.max_bytes or \
+                    len(self._entries) > self.max_entries:
+                old, _ = self._entries.popitem(last=False)
+                self.bytes -= self._sizes.pop(old)
+                self._expired.pop(old, None)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable = None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._sizes.clear()
+                self._expired.clear()
+                self.bytes = 0
+            else:
+                self._entries.pop(key, None)
+                self._expired.pop(key, None)
+                self.bytes -= self._sizes.pop(key, 0)
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        with self._lock:
+            stats["bytes"] = self.bytes
+            stats["max_bytes"] = self.max_bytes
+        return stats
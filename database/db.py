@@ -1,5 +1,9 @@
 import mysql.connector
 from mysql.connector import errorcode
+from contextlib import contextmanager
+from collections import deque
+import threading
+import time
 import sys
 
 HOST = 'localhost'
@@ -9,30 +13,239 @@ PASSWORD = 'client'
 DATABASE = 'games'
 DEBUG = True
 
+# Roles the app connects as, and their credentials
+ROLE_CLIENT = 'client'
+ROLE_ADMIN = 'admin'
+CREDENTIALS = {
+    ROLE_CLIENT: (USER, PASSWORD),
+    ROLE_ADMIN: ('admin', 'admin'),
+}
+
+# Pool sizing per role, checkout timeout (seconds) and how long a connection
+# may sit idle before it is pinged again on borrow
+POOL_SIZES = {
+    ROLE_CLIENT: 10,
+    ROLE_ADMIN: 5,
+}
+CHECKOUT_TIMEOUT = 5.0
+VALIDATE_AFTER_IDLE = 30.0
+
+
+def _connect(user: str, password: str) -> mysql.connector.MySQLConnection:
+    return mysql.connector.connect(
+        host=HOST,
+        user=user,
+        port=PORT,
+        password=password,
+        database=DATABASE
+    )
+
 def get_conn(
-        user: str=USER, 
+        user: str=USER,
         password: str=PASSWORD) -> mysql.connector.MySQLConnection:
     """"
     Returns a connected MySQL connector instance, if connection is successful.
-    If unsuccessful, exits.
+    If unsuccessful, logs why and raises the mysql.connector.Error, so the
+    caller can fall back (e.g. to cached data) instead of the process
+    exiting.
     """
     try:
-        conn = mysql.connector.connect(
-          host=HOST,
-          user=user,
-          port=PORT,
-          password=password,
-          database=DATABASE
-        )
+        conn = _connect(user, password)
         print('Successfully connected.')
         return conn
     except mysql.connector.Error as err:
         if err.errno == errorcode.ER_ACCESS_DENIED_ERROR and DEBUG:
-            sys.stderr('Incorrect username or password when connecting to DB.')
+            print('Incorrect username or password when connecting to DB.',
+                  file=sys.stderr)
         elif err.errno == errorcode.ER_BAD_DB_ERROR and DEBUG:
-            sys.stderr('Database does not exist.')
+            print('Database does not exist.', file=sys.stderr)
         elif DEBUG:
-            sys.stderr(err)
+            print(err, file=sys.stderr)
         else:
-            sys.stderr('An error occurred, please contact the administrator.')
-        sys.exit(1)
\ No newline at end of file
+            print('An error occurred, please contact the administrator.',
+                  file=sys.stderr)
+        raise
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# Bounded pool of connections for a single MySQL user
+class ConnectionPool:
+    def __init__(self, user: str, password: str, size: int,
+                 timeout: float = CHECKOUT_TIMEOUT,
+                 validate_after: float = VALIDATE_AFTER_IDLE):
+        self.user = user
+        self.password = password
+        self.size = size
+        self.timeout = timeout
+        self.validate_after = validate_after
+
+        self._idle = deque()
+        self._created = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+        self._connects = 0
+        self._discarded = 0
+
+    def acquire(self, timeout: float = None) -> mysql.connector.MySQLConnection:
+        """
+        Borrows a connection, opening a new one while under the size limit
+        and otherwise waiting up to `timeout` seconds for one to be returned.
+        Raises PoolTimeout if none becomes available in time.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout(f"pool for {self.user} is closed")
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    conn, last_used = None, None
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(
+                        f"no {self.user} connection free after {timeout}s")
+                waited = True
+                self._cond.wait(remaining)
+
+            self._checkouts += 1
+            if waited:
+                self._waits += 1
+                self._wait_time += time.monotonic() - start
+
+        # connect and validate outside the lock
+        try:
+            if conn is not None and \
+                    time.monotonic() - last_used > self.validate_after:
+                if not conn.is_connected():
+                    self._discard(conn)
+                    conn = None
+            if conn is None:
+                conn = _connect(self.user, self.password)
+                with self._cond:
+                    self._connects += 1
+        except mysql.connector.Error:
+            with self._cond:
+                self._created -= 1
+                self._cond.notify()
+            raise
+
+        return conn
+
+    def release(self, conn: mysql.connector.MySQLConnection):
+        """
+        Returns a connection to the pool, ending any open transaction so the
+        next borrower does not inherit a stale snapshot or unread results.
+        """
+        try:
+            if conn.unread_result:
+                conn.consume_results()
+            if conn.in_transaction:
+                conn.rollback()
+        except mysql.connector.Error:
+            self._discard(conn)
+            with self._cond:
+                self._created -= 1
+                self._cond.notify()
+            return
+
+        with self._cond:
+            if self._closed:
+                self._created -= 1
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def _discard(self, conn):
+        # _cond wraps an RLock, so this is safe from callers that hold it
+        with self._cond:
+            self._discarded += 1
+        try:
+            conn.close()
+        except mysql.connector.Error:
+            pass
+
+    def stats(self) -> dict:
+        with self._cond:
+            in_use = self._created - len(self._idle)
+            return {
+                "user": self.user,
+                "size": self.size,
+                "open": self._created,
+                "idle": len(self._idle),
+                "in_use": in_use,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "avg_wait_ms": (self._wait_time / self._waits * 1000
+                                if self._waits else 0.0),
+                "timeouts": self._timeouts,
+                "connects": self._connects,
+                "discarded": self._discarded,
+            }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._created -= 1
+                self._discard(conn)
+            self._cond.notify_all()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(role: str = ROLE_CLIENT) -> ConnectionPool:
+    """
+    Returns the shared pool for a role, creating it on first use.
+    """
+    pool = _pools.get(role)
+    if pool is not None:
+        return pool
+
+    with _pools_lock:
+        if role not in _pools:
+            user, password = CREDENTIALS[role]
+            _pools[role] = ConnectionPool(user, password, POOL_SIZES[role])
+        return _pools[role]
+
+@contextmanager
+def pooled_conn(role: str = ROLE_CLIENT, timeout: float = None):
+    with get_pool(role).connection(timeout) as conn:
+        yield conn
+
+def pool_stats() -> dict:
+    return {role: pool.stats() for role, pool in _pools.items()}
+
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
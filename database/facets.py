@@ -0,0 +1,426 @@
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import chain
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import threading
+import mysql.connector
+
+# Facet type -> (junction table, attribute id column). Type names match the
+# `type` column of attributes_view.
+FACET_TABLES = {
+    'category': ('game_categories', 'category_id'),
+    'genre': ('game_genres', 'genre_id'),
+    'tag': ('game_tags', 'tag_id'),
+    'lang': ('game_langs', 'lang_id'),
+    'audio_lang': ('game_audio_langs', 'audio_lang_id'),
+    'developer': ('game_developers', 'dev_id'),
+    'publisher': ('game_publishers', 'pub_id'),
+}
+
+# A posting with fewer than n_games / SPARSE_RATIO members is kept as a
+# sorted array of 32-bit positions, otherwise as a bitmap over all positions
+# (whichever is smaller, as in roaring bitmaps)
+SPARSE_RATIO = 32
+
+# Facet types with at most this many attributes (genres, tags, categories,
+# languages) also keep a bitmap for their sparse postings, so sidebar counts
+# are a bigint AND + popcount per attribute instead of a Python loop
+COUNT_BITMAP_LIMIT = 1024
+
+
+# Set of game positions for one attribute, stored sparse or dense
+class Posting:
+    __slots__ = ('count', 'positions', 'bits', 'raw')
+
+    def __init__(self, positions: List[int], n_games: int,
+                 keep_bits: bool = False):
+        self.count = len(positions)
+        sparse = self.count * SPARSE_RATIO < n_games
+        self.positions = array('I', positions) if sparse else None
+        self.bits = None
+        self.raw = None
+
+        if not sparse or keep_bits:
+            raw = bytearray((n_games + 7) // 8)
+            for p in positions:
+                raw[p >> 3] |= 1 << (p & 7)
+            self.bits = int.from_bytes(raw, 'little')
+            if not sparse:
+                # byte view for O(1) membership tests against candidates
+                self.raw = bytes(raw)
+
+    @property
+    def dense(self) -> bool:
+        return self.positions is None
+
+    def __contains__(self, p: int) -> bool:
+        if self.raw is not None:
+            return (self.raw[p >> 3] >> (p & 7)) & 1 == 1
+        i = bisect_left(self.positions, p)
+        return i < len(self.positions) and self.positions[i] == p
+
+
+# Result of a facet match: either a sorted position list or a bitmap
+class Match:
+    __slots__ = ('positions', 'bits', 'count')
+
+    def __init__(self, positions: Optional[List[int]] = None,
+                 bits: Optional[int] = None):
+        self.positions = positions
+        self.bits = bits
+        self.count = len(positions) if positions is not None \
+            else bits.bit_count()
+
+    def to_bits(self, n_games: int) -> int:
+        if self.bits is not None:
+            return self.bits
+        raw = bytearray((n_games + 7) // 8)
+        for p in self.positions:
+            raw[p >> 3] |= 1 << (p & 7)
+        return int.from_bytes(raw, 'little')
+
+    def _words(self) -> memoryview:
+        n_words = (self.bits.bit_length() + 63) // 64
+        return memoryview(self.bits.to_bytes(n_words * 8, 'little')).cast('Q')
+
+    def iter_positions(self, start: int = 0) -> Iterable[int]:
+        """
+        Yields member positions >= start in ascending order.
+        """
+        if self.positions is not None:
+            for i in range(bisect_left(self.positions, start),
+                           len(self.positions)):
+                yield self.positions[i]
+            return
+
+        words = self._words()
+        first = start >> 6
+        for w in range(first, len(words)):
+            word = words[w]
+            if w == first:
+                word &= ~((1 << (start & 63)) - 1)
+            while word:
+                low = word & -word
+                yield (w << 6) + low.bit_length() - 1
+                word ^= low
+
+    def iter_positions_before(self, end: int) -> Iterable[int]:
+        """
+        Yields member positions < end in descending order.
+        """
+        if self.positions is not None:
+            for i in range(bisect_left(self.positions, end) - 1, -1, -1):
+                yield self.positions[i]
+            return
+
+        words = self._words()
+        last = min((end - 1) >> 6, len(words) - 1)
+        for w in range(last, -1, -1):
+            word = words[w]
+            if w == (end - 1) >> 6:
+                word &= (1 << (((end - 1) & 63) + 1)) - 1
+            while word:
+                top = word.bit_length() - 1
+                yield (w << 6) + top
+                word ^= 1 << top
+
+    def skip(self, offset: int) -> Optional[int]:
+        """
+        Returns the position of the member at index `offset` (or None), so
+        deep pages skip whole 64-bit words by popcount.
+        """
+        if offset >= self.count:
+            return None
+        if self.positions is not None:
+            return self.positions[offset]
+
+        for w, word in enumerate(self._words()):
+            n = word.bit_count()
+            if offset < n:
+                for _ in range(offset):
+                    word &= word - 1
+                return (w << 6) + (word & -word).bit_length() - 1
+            offset -= n
+        return None
+
+
+# In-memory facet engine over the junction tables
+class FacetIndex:
+    def __init__(self, game_ids: Iterable[int],
+                 relations: Dict[str, Iterable[Tuple[int, int]]]):
+        """
+        game_ids: every game id in the catalog.
+        relations: facet type -> iterable of (game_id, attribute_id) rows.
+        """
+        self.game_ids = array('I', sorted(set(game_ids)))
+        self.n_games = len(self.game_ids)
+        self._position = {gid: i for i, gid in enumerate(self.game_ids)}
+        self._all = Match(bits=(1 << self.n_games) - 1)
+
+        self.postings: Dict[str, Dict[int, Posting]] = {}
+        # per type, game position -> attribute ids in CSR form
+        # (offsets[p]:offsets[p + 1] slices values) for counting small matches
+        self._forward: Dict[str, Tuple[array, array]] = {}
+        self._posting_cost: Dict[str, int] = {}
+        for facet_type, rows in relations.items():
+            grouped: Dict[int, set] = {}
+            by_game: Dict[int, set] = {}
+            for game_id, attr_id in rows:
+                p = self._position.get(game_id)
+                if p is not None:
+                    grouped.setdefault(attr_id, set()).add(p)
+                    by_game.setdefault(p, set()).add(attr_id)
+            keep_bits = len(grouped) <= COUNT_BITMAP_LIMIT
+            self.postings[facet_type] = {
+                attr_id: Posting(sorted(ps), self.n_games, keep_bits)
+                for attr_id, ps in grouped.items()
+            }
+
+            offsets = array('I', [0])
+            values = array('I')
+            for p in range(self.n_games):
+                values.extend(sorted(by_game.get(p, ())))
+                offsets.append(len(values))
+            self._forward[facet_type] = (offsets, values)
+
+            # rough per-request work of ANDing every posting against a match:
+            # one Python step per sparse member, bigint ANDs run at C speed
+            self._posting_cost[facet_type] = sum(
+                self.n_games // 512 if p.bits is not None else p.count
+                for p in self.postings[facet_type].values()
+            )
+
+    @classmethod
+    def load(cls, conn: mysql.connector.MySQLConnection) -> 'FacetIndex':
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT game_id FROM game;")
+                game_ids = [row[0] for row in cursor.fetchall()]
+
+                relations = {}
+                for facet_type, (table, column) in FACET_TABLES.items():
+                    cursor.execute(f"SELECT game_id, {column} FROM {table};")
+                    relations[facet_type] = cursor.fetchall()
+
+            return cls(game_ids, relations)
+        except mysql.connector.Error as err:
+            print(err)
+            return None
+
+    def match(self, selection: Dict[str, Iterable[int]]) -> Match:
+        """
+        Returns the games that have every selected attribute. Postings are
+        intersected smallest first; an empty selection matches everything.
+        """
+        postings = []
+        for facet_type, attr_ids in selection.items():
+            table = self.postings.get(facet_type, {})
+            for attr_id in set(attr_ids):
+                posting = table.get(attr_id)
+                if posting is None:
+                    return Match(positions=[])
+                postings.append(posting)
+
+        if not postings:
+            return self._all
+
+        postings.sort(key=lambda p: p.count)
+        first = postings[0]
+
+        if first.dense:
+            # sparse postings sort first, so every posting here is dense
+            bits = first.bits
+            for posting in postings[1:]:
+                bits &= posting.bits
+                if not bits:
+                    break
+            return Match(bits=bits)
+
+        candidates = list(first.positions)
+        for posting in postings[1:]:
+            if not candidates:
+                break
+            candidates = [p for p in candidates if p in posting]
+        return Match(positions=candidates)
+
+    def counts(self, selection: Dict[str, Iterable[int]],
+               facet_types: Iterable[str] = None) -> Dict[str, Dict[int, int]]:
+        """
+        Returns, per facet type, how many games would match if each attribute
+        were added to `selection`. The selection is matched once; counts then
+        come from a single pass over whichever is cheaper: the matching games'
+        attribute lists, or every posting ANDed against the match bitmap.
+        """
+        facet_types = list(self.postings) if facet_types is None \
+            else [t for t in facet_types if t in self.postings]
+        base = self.match(selection)
+
+        if base is self._all:
+            return {
+                t: {a: p.count for a, p in self.postings[t].items()}
+                for t in facet_types
+            }
+
+        counts = {}
+        base_bits = base_raw = None
+        for facet_type in facet_types:
+            postings = self.postings[facet_type]
+            offsets, values = self._forward[facet_type]
+
+            forward_cost = base.count * len(values) // max(self.n_games, 1)
+            posting_cost = self._posting_cost[facet_type]
+            if base.count == 0:
+                counts[facet_type] = {}
+            elif forward_cost <= posting_cost:
+                counts[facet_type] = Counter(chain.from_iterable(
+                    values[offsets[p]:offsets[p + 1]]
+                    for p in base.iter_positions()
+                ))
+            else:
+                if base_bits is None:
+                    base_bits = base.to_bits(self.n_games)
+                    base_raw = base_bits.to_bytes(
+                        (self.n_games + 7) // 8, 'little')
+                result = {}
+                for attr_id, posting in postings.items():
+                    if posting.bits is not None:
+                        n = (base_bits & posting.bits).bit_count()
+                    else:
+                        n = 0
+                        for q in posting.positions:
+                            n += (base_raw[q >> 3] >> (q & 7)) & 1
+                    if n:
+                        result[attr_id] = n
+                counts[facet_type] = result
+        return counts
+
+    def counts_for(self, selection: Dict[str, Iterable[int]], facet_type: str,
+                   attr_ids: Iterable[int]) -> Dict[int, int]:
+        """
+        counts() restricted to a few attributes of one type, for facets whose
+        full attribute list is too long to count on every request.
+        """
+        postings = self.postings.get(facet_type, {})
+        result = {}
+        for attr_id in attr_ids:
+            if attr_id not in postings:
+                result[attr_id] = 0
+                continue
+            extended = {t: list(ids) for t, ids in selection.items()}
+            extended.setdefault(facet_type, []).append(attr_id)
+            result[attr_id] = self.match(extended).count
+        return result
+
+    def member_test(self, selection: Dict[str, Iterable[int]]
+                    ) -> Optional[Callable[[int], bool]]:
+        """
+        Returns a game_id -> bool predicate for the selection (None when the
+        selection is empty), for filtering other indexes while they scan.
+        """
+        if not any(selection.values()):
+            return None
+
+        result = self.match(selection)
+        if result.positions is not None:
+            return frozenset(self.game_ids[p] for p in result.positions) \
+                .__contains__
+
+        raw = result.bits.to_bytes((self.n_games + 7) // 8, 'little')
+        position = self._position
+
+        def test(game_id: int) -> bool:
+            p = position.get(game_id)
+            return p is not None and (raw[p >> 3] >> (p & 7)) & 1 == 1
+        return test
+
+    def page(self, selection: Dict[str, Iterable[int]], limit: int = 10,
+             offset: int = 0) -> Tuple[int, List[int]]:
+        """
+        Returns (total matches, game ids for the requested page) with games
+        ordered by game_id.
+        """
+        result = self.match(selection)
+        start = result.skip(offset)
+        if start is None:
+            return result.count, []
+
+        ids = []
+        for p in result.iter_positions(start):
+            ids.append(self.game_ids[p])
+            if len(ids) == limit:
+                break
+        return result.count, ids
+
+    def page_keyset(self, selection: Dict[str, Iterable[int]],
+                    after_id: int = None, before_id: int = None,
+                    limit: int = 10) -> Tuple[int, List[int]]:
+        """
+        Keyset version of page(): the matches after `after_id`, or the
+        `limit` matches just before `before_id`, in ascending game_id order.
+        Cost depends on the page size, not on how deep the anchor is.
+        """
+        result = self.match(selection)
+        ids = []
+        if before_id is not None:
+            end = bisect_left(self.game_ids, before_id)
+            if end > 0:
+                for p in result.iter_positions_before(end):
+                    ids.append(self.game_ids[p])
+                    if len(ids) == limit:
+                        break
+            ids.reverse()
+            return result.count, ids
+
+        start = 0 if after_id is None else \
+            bisect_left(self.game_ids, after_id + 1)
+        for p in result.iter_positions(start):
+            ids.append(self.game_ids[p])
+            if len(ids) == limit:
+                break
+        return result.count, ids
+
+
+_index: Optional[FacetIndex] = None
+_index_lock = threading.Lock()
+
+def load_facet_index(conn: mysql.connector.MySQLConnection) -> FacetIndex:
+    """
+    (Re)builds the shared facet index from the database.
+    """
+    global _index
+    index = FacetIndex.load(conn)
+    if index is not None:
+        with _index_lock:
+            _index = index
+    return index
+
+def get_facet_index() -> Optional[FacetIndex]:
+    return _index
+
+def parse_selection(**params: List[str]) -> Dict[str, List[int]]:
+    """
+    Turns query-string id lists (facet type -> list of strings) into a
+    selection of integer ids, dropping empty and malformed values.
+    """
+    selection = {}
+    for facet_type, values in params.items():
+        ids = []
+        for value in values:
+            for part in str(value).split(','):
+                part = part.strip()
+                # isdigit() alone also accepts digits int() rejects ('²')
+                if part.isascii() and part.isdigit():
+                    ids.append(int(part))
+        if ids:
+            selection[facet_type] = ids
+    return selection
+
+def selection_key(selection: Dict[str, List[int]]) -> tuple:
+    """
+    Hashable, order-independent form of a selection for use as a cache key.
+    """
+    return tuple(sorted(
+        (facet_type, tuple(sorted(set(ids))))
+        for facet_type, ids in selection.items() if ids
+    ))
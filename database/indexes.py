@@ -0,0 +1,95 @@
+"""
+The in-memory catalog indexes (facets, search, autocomplete) as one unit
+that knows which catalog_version it was built from, so the app can rebuild
+it in the background after the catalog changes and tell pages rendered from
+older indexes apart from current ones.
+"""
+
+from typing import Callable
+import threading
+import time
+import mysql.connector
+
+from database.autocomplete import load_autocomplete
+from database.db import ROLE_CLIENT, PoolTimeout, pooled_conn
+from database.facets import load_facet_index
+from database.objects import get_catalog_version
+from database.search import load_search_index
+
+
+# Loads the three indexes, borrowing a connection per index only. Each load
+# replaces its index only if it succeeds, so requests keep using the previous
+# ones until then.
+class CatalogIndexes:
+    def __init__(self, on_loaded: Callable[[], None] = lambda: None):
+        """
+        on_loaded: called after every complete load, e.g. to drop pages
+        rendered from the previous indexes.
+        """
+        self.on_loaded = on_loaded
+        # catalog_version the loaded indexes were built from, and when they
+        # were loaded; None and 0 until a load has completed
+        self.catalog_version = None
+        self.loaded_at = 0.0
+
+        self._lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._running = False
+        self._pending = False
+        self._pending_rebuild = False
+
+    def load(self, rebuild_search: bool = False) -> bool:
+        """
+        (Re)loads all three indexes; the search index is rebuilt from the
+        catalog when its saved file is out of date or `rebuild_search` is
+        set. Returns whether every index loaded.
+        """
+        with self._lock:
+            # the version is read first, so changes made during the load
+            # leave the indexes marked older than the catalog
+            with pooled_conn(ROLE_CLIENT) as conn:
+                stamp = get_catalog_version(conn)
+            with pooled_conn(ROLE_CLIENT) as conn:
+                facets = load_facet_index(conn)
+            with pooled_conn(ROLE_CLIENT) as conn:
+                search = load_search_index(conn, rebuild=rebuild_search)
+            with pooled_conn(ROLE_CLIENT) as conn:
+                autocomplete = load_autocomplete(conn)
+
+            if stamp is None or None in (facets, search, autocomplete):
+                return False
+            self.catalog_version = stamp[0]
+            self.loaded_at = time.time()
+        self.on_loaded()
+        return True
+
+    def start(self, rebuild_search: bool = False) -> bool:
+        """
+        Runs load in a background thread. While a load is in progress,
+        further calls only queue one more load after it. Returns whether a
+        new thread was started.
+        """
+        with self._state_lock:
+            if self._running:
+                self._pending = True
+                self._pending_rebuild |= rebuild_search
+                return False
+            self._running = True
+        threading.Thread(target=self._run, args=(rebuild_search,),
+                         name="catalog-indexes", daemon=True).start()
+        return True
+
+    def _run(self, rebuild_search: bool):
+        while True:
+            try:
+                if not self.load(rebuild_search):
+                    print("catalog indexes not (fully) reloaded")
+            except (mysql.connector.Error, PoolTimeout, OSError) as err:
+                print(err)
+            with self._state_lock:
+                if not self._pending:
+                    self._running = False
+                    return
+                rebuild_search = self._pending_rebuild
+                self._pending = False
+                self._pending_rebuild = False
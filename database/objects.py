@@ -1,21 +1,97 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from array import array
+from typing import Dict, List, Optional
 import datetime
 import mysql.connector
+from database.cache import LRUCache, SizedLRUCache, TTLCache
+from database.facets import selection_key
+from database.ownership import ownership_index
+from database.purchases import OWNED_OUTCOMES, make_purchase
+from database.query import fetch_all, fetch_one, games_filter_ids_query
 
 # Procedures, Functions, Views, and CONSTANTS
 VIEW_ATTRIBUTES = 'attributes_view'
 FUNC_AUTHENTICATE = 'authenticate'
-FUNC_HAS_PURCHASED = 'has_purchased'
 PROC_CHANGE_PASSWORD = 'sp_change_password'
 PROC_ADD_USER = 'sp_add_user'
 PROC_DELETE_USER = 'sp_delete_user'
 PROC_UPDATE_USER_ROLE = 'sp_update_user_role'
-PROC_GET_GAME_INFO = 'sp_get_game_info'
-PROC_MAKE_PURCHASE = 'sp_make_purchase'
-PROC_GET_GAMES_BY_ALL_LIMIT = 'sp_get_games_by_all_limit'
+TABLE_GAME_DETAIL = 'game_detail'
+DETAIL_SEPARATOR = '\t'
+DETAIL_COLUMNS = """
+    game_id, game_name, release_date, estimated_owners, price_usd,
+    about_game, metacritic_score, platform_support, header_image, video_urls,
+    categories, genres, tags, supp_langs, supp_audio_langs, developers,
+    publishers
+"""
+TABLE_CATALOG_VERSION = 'catalog_version'
 DEFAULT_ROLE = 'user'
 
+# attributes_view hardly ever changes; cache it for the process and fall
+# back to re-reading it every ATTRIBUTES_TTL seconds. Until a re-read
+# succeeds the old lists are served for up to ATTRIBUTES_MAX_STALE seconds.
+ATTRIBUTES_TTL = 600
+ATTRIBUTES_MAX_STALE = 24 * 3600
+ATTRIBUTES_KEY = 'attributes'
+attributes_cache = TTLCache(ttl=ATTRIBUTES_TTL, max_stale=ATTRIBUTES_MAX_STALE)
+
+# facet type (attributes_view.type) -> Attributes field
+ATTRIBUTE_FIELDS = {
+    'genre': 'genres',
+    'category': 'categories',
+    'tag': 'tags',
+    'lang': 'languages',
+    'audio_lang': 'audio_languages',
+    'developer': 'developers',
+    'publisher': 'publishers',
+}
+
+# per-type sorted name lists derived from the cached attributes; dropped
+# together with them
+facet_list_cache = TTLCache(ttl=ATTRIBUTES_TTL)
+attributes_cache.on_invalidate(lambda key: facet_list_cache.invalidate())
+
+# How long catalog data expired by a catalog change may still be served
+# when reloading it fails
+CATALOG_MAX_STALE = 3600
+
+# shared game page details (everything except the per-user ownership flag),
+# keyed by game_id
+GAME_DETAIL_CACHE_SIZE = 4096
+game_detail_cache = LRUCache(
+    max_entries=GAME_DETAIL_CACHE_SIZE, max_stale=CATALOG_MAX_STALE)
+
+# ordered game ids matching a filter, keyed by the normalized selection
+# (selection_key), so every page of the same filter is a slice of one list
+FILTER_RESULT_CACHE_BYTES = 16 * 1024 * 1024
+filter_result_cache = SizedLRUCache(
+    FILTER_RESULT_CACHE_BYTES, max_stale=CATALOG_MAX_STALE)
+
+# catalog_version is re-read at most every CATALOG_VERSION_TTL seconds, so a
+# conditional request usually costs no query at all; a stamp up to
+# CATALOG_VERSION_MAX_STALE seconds old is used while it is re-read
+CATALOG_VERSION_TTL = 2.0
+CATALOG_VERSION_MAX_STALE = 60
+CATALOG_VERSION_KEY = 'catalog_version'
+catalog_version_cache = TTLCache(
+    ttl=CATALOG_VERSION_TTL, max_stale=CATALOG_VERSION_MAX_STALE)
+
+# Returns (catalog version, unix time it was last bumped)
+def get_catalog_version(conn: mysql.connector.MySQLConnection) -> tuple:
+    query = f"""
+            SELECT version, UNIX_TIMESTAMP(updated_at)
+            FROM {TABLE_CATALOG_VERSION} WHERE id = 1;
+            """
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(query)
+            row = cursor.fetchone()
+            return (row[0], float(row[1])) if row else None
+    except mysql.connector.Error as err:
+        print(err)
+        return None
+
 # Transforms a binary string to a list of supported platforms
 def get_supported_platforms(bin_str: str) -> List[str]:
     platforms = []
@@ -27,6 +103,79 @@ def get_supported_platforms(bin_str: str) -> List[str]:
         platforms.append('Linux')
     return platforms
 
+# Bit string -> platform list for every platform_support value, so rows
+# decode with one dict lookup
+PLATFORM_TABLE = {
+    f"{bits:03b}": tuple(get_supported_platforms(f"{bits:03b}"))
+    for bits in range(8)
+}
+
+def decode_platforms(bin_str: Optional[str]) -> Optional[List[str]]:
+    if not bin_str:
+        return None
+    platforms = PLATFORM_TABLE.get(bin_str)
+    if platforms is None:
+        return get_supported_platforms(bin_str)
+    return list(platforms)
+
+# Trusted row mapping. Rows read straight from our own schema already have
+# the column types setup.sql declares, so models are built without
+# validation (trusted_model, or construct() for containers); the only
+# conversions validation used to make (DECIMAL -> float, BINARY -> str,
+# platform bits -> list) are done here.
+def trusted_model(cls, **values):
+    """
+    construct() without the per-field default lookup: `values` are taken
+    as-is and fields left out get their (immutable) class defaults.
+    """
+    model = cls.__new__(cls)
+    fields = _TRUSTED_DEFAULTS.get(cls)
+    if fields is None:
+        fields = _TRUSTED_DEFAULTS[cls] = {
+            name: field.default for name, field in cls.__fields__.items()
+        }
+    object.__setattr__(model, '__dict__', {**fields, **values})
+    object.__setattr__(model, '__fields_set__', set(values))
+    return model
+
+_TRUSTED_DEFAULTS = {}
+
+def _float(value) -> Optional[float]:
+    return None if value is None else float(value)
+
+def _text(value) -> Optional[str]:
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode()
+    return value
+
+# Build a Game from a `SELECT * FROM game` row
+def game_from_row(row: tuple) -> 'Game':
+    return trusted_model(
+        Game,
+        game_id=row[0],
+        game_name=row[1],
+        release_date=row[2],
+        estimated_owners=row[3],
+        price_usd=_float(row[4]),
+        about_game=row[5],
+        metacritic_score=row[6],
+        platform_support=decode_platforms(row[7]),
+        header_image=row[8]
+    )
+
+# Build a User from a `SELECT * FROM user` row
+def user_from_row(row: tuple) -> 'User':
+    return trusted_model(
+        User,
+        user_id=row[0],
+        username=row[1],
+        balance=_float(row[2]),
+        password_hash=_text(row[3]),
+        salt=row[4],
+        user_role=row[5],
+        date_joined=row[6]
+    )
+
 # Game object to relate to the game table
 class Game(BaseModel):
     game_id: Optional[int] = None
@@ -60,75 +209,111 @@ class GameInfo(BaseModel):
     publishers: Optional[List[str]] = None
     is_purchased: Optional[bool] = None
 
-    # Get detailed game information
-    def get_game_info(self, conn: mysql.connector.MySQLConnection, 
-                      user_id: str=None) -> 'GameInfo':
-        
-        if not self.game_id or not user_id:
+    # Get the shared game details (no per-user fields), safe to cache
+    def get_game_detail(self, 
+                        conn: mysql.connector.MySQLConnection) -> 'GameInfo':
+        if not self.game_id:
             return None
-        
-        has_purchased_params = (user_id, self.game_id)
-        has_purchased_query = f"SELECT {FUNC_HAS_PURCHASED}(%s, %s);"
-        query = f"CALL {PROC_GET_GAME_INFO}(%s);"
+
+        query = f"""
+                SELECT {DETAIL_COLUMNS}
+                FROM {TABLE_GAME_DETAIL} WHERE game_id = %s;
+                """
         
         try:
             with conn.cursor() as cursor:
-                cursor.execute(has_purchased_query, has_purchased_params)
-                row = cursor.fetchone()
-                purchased = False
-                print("row1: ", row)
-                if row[0] > 0:
-                    purchased = True
-                
                 cursor.execute(query, (self.game_id,))
                 row = cursor.fetchone()
-                print("row", row)
                 if row:
-                    game_info = GameInfo(
-                        game_id=row[0],
-                        game_name=row[1],
-                        release_date=row[2],
-                        estimated_owners=row[3],
-                        price_usd=row[4],
-                        about_game=row[5],
-                        metacritic_score=row[6],
-                        platform_support=get_supported_platforms(row[7]) if row[7] 
-                                            else None,
-                        header_image=row[8],
-                        video_urls=row[9].split(',') if row[9] else None,
-                        categories=row[10].split(',') if row[10] else None,
-                        genres=row[11].split(',') if row[11] else None,
-                        tags=row[12].split(',') if row[12] else None,
-                        supported_langs=row[13].split(',') if row[13] else None,
-                        supported_audio_langas=row[14].split(',') if row[14] 
-                                            else None,
-                        developers=row[15].split(',') if row[15] else None,
-                        publishers=row[16].split(',') if row[16] else None,
-                        is_purchased=purchased
-                    )
-
-                    return game_info
+                    return GameInfo.from_detail_row(row)
                 else:
                     return None
         except mysql.connector.Error as err:
             print(err)
             return None
-    
-    # Purchase the game
-    def purchase_game(self, conn: mysql.connector.MySQLConnection, 
-                      user_id: int) -> 'GameInfo':
-        if not self.game_id or not user_id:
+
+    # Get the shared details of several games, keyed by game_id
+    @staticmethod
+    def get_game_details(conn: mysql.connector.MySQLConnection,
+                         game_ids: List[int]) -> Dict[int, 'GameInfo']:
+        if not game_ids:
+            return {}
+
+        placeholders = ", ".join(["%s"] * len(game_ids))
+        query = f"""
+                SELECT {DETAIL_COLUMNS}
+                FROM {TABLE_GAME_DETAIL} WHERE game_id IN ({placeholders});
+                """
+
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(query, tuple(game_ids))
+                return {
+                    row[0]: GameInfo.from_detail_row(row)
+                    for row in cursor.fetchall()
+                }
+        except mysql.connector.Error as err:
+            print(err)
             return None
 
+    # Version (refresh count) of every game's details, keyed by game_id
+    @staticmethod
+    def get_detail_versions(conn: mysql.connector.MySQLConnection
+                            ) -> Dict[int, int]:
+        query = f"SELECT game_id, detail_version FROM {TABLE_GAME_DETAIL};"
+
         try:
             with conn.cursor() as cursor:
-                cursor.callproc(PROC_MAKE_PURCHASE, (user_id, self.game_id))
-                conn.commit()
+                cursor.execute(query)
+                return dict(cursor.fetchall())
         except mysql.connector.Error as err:
             print(err)
             return None
-        
-        return self
+
+    # Build from a game_detail row selected as DETAIL_COLUMNS
+    @staticmethod
+    def from_detail_row(row: tuple) -> 'GameInfo':
+        sep = DETAIL_SEPARATOR
+        return trusted_model(
+            GameInfo,
+            game_id=row[0],
+            game_name=row[1],
+            release_date=row[2],
+            estimated_owners=row[3],
+            price_usd=_float(row[4]),
+            about_game=row[5],
+            metacritic_score=row[6],
+            platform_support=decode_platforms(row[7]),
+            header_image=row[8],
+            video_urls=row[9].split(sep) if row[9] else None,
+            categories=row[10].split(sep) if row[10] else None,
+            genres=row[11].split(sep) if row[11] else None,
+            tags=row[12].split(sep) if row[12] else None,
+            supported_langs=row[13].split(sep) if row[13] 
+                                else None,
+            supported_audio_langas=row[14].split(sep) if row[14] 
+                                else None,
+            developers=row[15].split(sep) if row[15] else None,
+            publishers=row[16].split(sep) if row[16] else None
+        )
+
+    # Per-request copy of shared (possibly cached) details with the
+    # ownership flag set
+    def with_purchased(self, purchased: bool) -> 'GameInfo':
+        return self.copy(update={"is_purchased": purchased})
+    
+    # Purchase the game; see database/purchases.py. Returns the outcome
+    # (purchases.PURCHASED, ...), or None on a database error.
+    def purchase_game(self, conn: mysql.connector.MySQLConnection, 
+                      user_id: int, request_key: str = None) -> str:
+        if not self.game_id or not user_id:
+            return None
+
+        outcome = make_purchase(conn, user_id, self.game_id, request_key)
+        if outcome in OWNED_OUTCOMES:
+            ownership_index.record_purchase(user_id, self.game_id)
+
+        return outcome
             
 
 # Games object to relate to the game table (multiple games)            
@@ -140,80 +325,119 @@ class Games(BaseModel):
         
         query = """
                 SELECT * FROM game LIMIT %s OFFSET %s;
-                """ % (limit, offset)
+                """
         
         try:
-            with conn.cursor() as cursor:
-                cursor.execute(query)
-                rows = cursor.fetchall()
-                games = []
-                for row in rows:
-                    game = Game(
-                        game_id=row[0],
-                        game_name=row[1],
-                        release_date=row[2],
-                        estimated_owners=row[3],
-                        price_usd=row[4],
-                        about_game=row[5],
-                        metacritic_score=row[6],
-                        platform_support=get_supported_platforms(row[7]) 
-                                            if row[7] else None,
-                        header_image=row[8]
-                    )
-                    games.append(game)
+            rows = fetch_all(conn, query, (limit, offset))
+            games = []
+            for row in rows:
+                game = game_from_row(row)
+                games.append(game)
             
-            return Games(games=games)
+            return Games.construct(games=games)
         except mysql.connector.Error as err:
             print(err)
             return None
     
-    # Get games by all attributes
-    def get_games_by_all_limit(self, conn: mysql.connector.MySQLConnection,
-            category_ids_str: str = "", genre_ids_str: str = "",
-            tag_ids_str: str = "", lang_ids_str: str = "", 
-            audio_lang_ids_str: str = "", dev_ids_str: str = "",
-            pub_ids_str: str = "", limit: int = 10, offset: int = 0
-            ) -> 'Games':
-        
+    # Keyset pagination on game_id: the page after `after_id`, or the page
+    # ending just before `before_id`, always in ascending game_id order
+    def get_games_keyset(self, conn: mysql.connector.MySQLConnection,
+                         after_id: int = None, before_id: int = None,
+                         limit: int = 10) -> 'Games':
+        if before_id is not None:
+            query = """
+                    SELECT * FROM (
+                        SELECT * FROM game WHERE game_id < %s
+                        ORDER BY game_id DESC LIMIT %s
+                    ) page ORDER BY game_id;
+                    """
+            params = (before_id, limit)
+        elif after_id is not None:
+            query = """
+                    SELECT * FROM game WHERE game_id > %s
+                    ORDER BY game_id LIMIT %s;
+                    """
+            params = (after_id, limit)
+        else:
+            query = """
+                    SELECT * FROM game ORDER BY game_id LIMIT %s;
+                    """
+            params = (limit,)
+
+        try:
+            rows = fetch_all(conn, query, params)
+            games = []
+            for row in rows:
+                game = game_from_row(row)
+                games.append(game)
+
+            return Games.construct(games=games)
+        except mysql.connector.Error as err:
+            print(err)
+            return None
+
+    # Get games by id, keeping the order of game_ids
+    def get_games_by_ids(self, conn: mysql.connector.MySQLConnection,
+                         game_ids: List[int]) -> 'Games':
+        if not game_ids:
+            return Games(games=[])
+
+        placeholders = ", ".join(["%s"] * len(game_ids))
         query = f"""
-                CALL {PROC_GET_GAMES_BY_ALL_LIMIT}( 
-                    '{category_ids_str}', 
-                    '{genre_ids_str}', 
-                    '{tag_ids_str}', 
-                    '{lang_ids_str}', 
-                    '{audio_lang_ids_str}', 
-                    '{dev_ids_str}', 
-                    '{pub_ids_str}', 
-                    {limit}, 
-                    {offset}
-                );
+                SELECT * FROM game WHERE game_id IN ({placeholders});
                 """
         
         try:
             with conn.cursor() as cursor:
-                cursor.execute(query)
+                cursor.execute(query, tuple(game_ids))
                 rows = cursor.fetchall()
-                games = []
+                by_id = {}
                 for row in rows:
-                    game = Game(
-                        game_id=row[0],
-                        game_name=row[1],
-                        release_date=row[2],
-                        estimated_owners=row[3],
-                        price_usd=row[4],
-                        about_game=row[5],
-                        metacritic_score=row[6],
-                        platform_support=get_supported_platforms(row[7]) 
-                                            if row[7] else None,
-                        header_image=row[8]
-                    )
-                    games.append(game)
+                    by_id[row[0]] = game_from_row(row)
 
-            return Games(games=games)
+            return Games.construct(
+                games=[by_id[i] for i in game_ids if i in by_id])
         except mysql.connector.Error as err:
             print(err)
             return None
 
+    # Get games having every selected attribute; `selection` maps facet
+    # types (see database.facets.FACET_TABLES) to attribute ids
+    def get_games_by_all_limit(self, conn: mysql.connector.MySQLConnection,
+            selection: Dict[str, List[int]], limit: int = 10,
+            offset: int = 0) -> 'Games':
+        game_ids = Games.get_filter_ids(conn, selection)
+        if game_ids is None:
+            return None
+
+        return self.get_games_by_ids(
+            conn, game_ids[offset:offset + limit].tolist())
+
+    @staticmethod
+    def get_filter_ids(conn: mysql.connector.MySQLConnection,
+                       selection: Dict[str, List[int]]) -> array:
+        """
+        Returns the ids of all games matching `selection` in game_id order,
+        from filter_result_cache when the same filter was run before.
+        """
+        key = selection_key(selection)
+        game_ids = filter_result_cache.get(key)
+        if game_ids is not None:
+            return game_ids
+
+        query, params = games_filter_ids_query(selection)
+        try:
+            rows = fetch_all(conn, query, params)
+        except mysql.connector.Error as err:
+            print(err)
+            # the ids from before the last catalog change, if still allowed
+            stale = filter_result_cache.get_stale(key)
+            return None if stale is None else stale[0]
+
+        game_ids = array('I', (row[0] for row in rows))
+        filter_result_cache.put(key, game_ids)
+        return game_ids
+
 # User object to relate to the user table
 class User(BaseModel):
     user_id: Optional[int] = None
@@ -229,25 +453,15 @@ class User(BaseModel):
 
         query = """
                 SELECT * FROM user WHERE user_id = %s;
-                """ % (params)
+                """
         try:
-            with conn.cursor() as cursor:
-                cursor.execute(query)
-                row = cursor.fetchone()
-                if row:
-                    user = User(
-                        user_id=row[0],
-                        username=row[1],
-                        balance=row[2],
-                        password_hash=row[3],
-                        salt=row[4],
-                        user_role=row[5],
-                        date_joined=row[6]
-                    )
+            row = fetch_one(conn, query, params)
+            if row:
+                user = user_from_row(row)
 
-                    return user
-                else:
-                    return None
+                return user
+            else:
+                return None
         except mysql.connector.Error as err:
             print(err)
             return None
@@ -381,26 +595,16 @@ class Users(BaseModel):
         
         query = """
                 SELECT * FROM user LIMIT %s OFFSET %s;
-                """ % (limit, offset)
+                """
         
         try:
-            with conn.cursor() as cursor:
-                cursor.execute(query)
-                rows = cursor.fetchall()
-                users = []
-                for row in rows:
-                    user = User(
-                        user_id=row[0],
-                        username=row[1],
-                        balance=row[2],
-                        password_hash=row[3],
-                        salt=row[4],
-                        user_role=row[5],
-                        date_joined=row[6]
-                    )
-                    users.append(user)
+            rows = fetch_all(conn, query, (limit, offset))
+            users = []
+            for row in rows:
+                user = user_from_row(row)
+                users.append(user)
             
-            return Users(users=users)
+            return Users.construct(users=users)
         except mysql.connector.Error as err:
             print(err)
             return None
@@ -418,10 +622,10 @@ class Purchase(BaseModel):
 
         query = """
                 SELECT * FROM purchases WHERE purchase_id = %s;
-                """ % (params)
+                """
         
         with conn.cursor() as cursor:
-            cursor.execute(query)
+            cursor.execute(query, params)
             row = cursor.fetchone()
             if row:
                 purchase = Purchase(
@@ -444,10 +648,10 @@ class Purchases(BaseModel):
         
         query = """
                 SELECT * FROM purchases LIMIT %s OFFSET %s;
-                """ % (limit, offset)
+                """
         
         with conn.cursor() as cursor:
-            cursor.execute(query)
+            cursor.execute(query, (limit, offset))
             rows = cursor.fetchall()
             purchases = []
             for row in rows:
@@ -468,10 +672,10 @@ class Purchases(BaseModel):
         
         query = """
                 SELECT * FROM purchases WHERE user_id = %s LIMIT %s OFFSET %s;
-                """ % (user_id, limit, offset)
+                """
         
         with conn.cursor() as cursor:
-            cursor.execute(query)
+            cursor.execute(query, (user_id, limit, offset))
             rows = cursor.fetchall()
             purchases = []
             for row in rows:
@@ -493,10 +697,10 @@ class Purchases(BaseModel):
             query = """
                     SELECT * FROM purchases 
                     WHERE game_id = %s LIMIT %s OFFSET %s;
-                    """ % (game_id, limit, offset)
+                    """
             
             with conn.cursor() as cursor:
-                cursor.execute(query)
+                cursor.execute(query, (game_id, limit, offset))
                 rows = cursor.fetchall()
                 purchases = []
                 for row in rows:
@@ -528,7 +732,7 @@ class UserPurchases(BaseModel):
                     user_id: int, limit: int = 10, 
                     offset: int = 0) -> List['UserPurchases']:
             
-            query = f"""
+            query = """
                     SELECT 
                         p.purchase_id, 
                         p.user_id, 
@@ -545,28 +749,26 @@ class UserPurchases(BaseModel):
                     ON p.game_id = g.game_id
                     WHERE p.user_id = %s
                     LIMIT %s OFFSET %s;
-                    """ % (user_id, limit, offset)
+                    """
             
             try:
                 purchases = []
-                with conn.cursor() as cursor:
-                    cursor.execute(query)
-                    rows = cursor.fetchall()
-                    for row in rows:
-                        purchase = UserPurchases(
-                            purchase_id=row[0],
-                            user_id=row[1],
-                            game_id=row[2],
-                            purchase_date=row[3],
-                            game_name=row[4],
-                            release_date=row[5],
-                            price_usd=row[6],
-                            platform_support=get_supported_platforms(row[7]) 
-                                                if row[7] else None,
-                            metacritic_score=row[8],
-                            header_image=row[9]
-                        )
-                        purchases.append(purchase)
+                rows = fetch_all(conn, query, (user_id, limit, offset))
+                for row in rows:
+                    purchase = trusted_model(
+                        UserPurchases,
+                        purchase_id=row[0],
+                        user_id=row[1],
+                        game_id=row[2],
+                        purchase_date=row[3],
+                        game_name=row[4],
+                        release_date=row[5],
+                        price_usd=_float(row[6]),
+                        platform_support=decode_platforms(row[7]),
+                        metacritic_score=row[8],
+                        header_image=row[9]
+                    )
+                    purchases.append(purchase)
 
                 return purchases
             except mysql.connector.Error as err:
@@ -577,6 +779,9 @@ class Attribute(BaseModel):
     id: Optional[int] = None
     name: Optional[str] = None
     checked: Optional[bool] = False
+# Attribute lists for the filter sidebar. Instances served from
+# attributes_cache are shared between requests and must not be mutated; use
+# the per-request `checked` selection instead of Attribute.checked.
 class Attributes(BaseModel):
     genres: Optional[List[Attribute]] = None
     categories: Optional[List[Attribute]] = None
@@ -596,60 +801,20 @@ class Attributes(BaseModel):
             with conn.cursor() as cursor:
                 cursor.execute(query)
                 rows = cursor.fetchall()
-                genres = []
-                categories = []
-                tags = []
-                languages = []
-                audio_languages = []
-                developers = []
-                publishers = []
-
+                lists = {t: [] for t in ATTRIBUTE_FIELDS}
                 for row in rows:
-                    if row[0] == 'genre':
-                        genres.append({
-                            'id': row[1],
-                            'name': row[2]
-                        })
-                    elif row[0] == 'category':
-                        categories.append({
-                            'id': row[1],
-                            'name': row[2]
-                        })
-                    elif row[0] == 'tag':
-                        tags.append({
-                            'id': row[1],
-                            'name': row[2]
-                        })
-                    elif row[0] == 'lang':
-                        languages.append({
-                            'id': row[1],
-                            'name': row[2]
-                        })
-                    elif row[0] == 'audio_lang':
-                        audio_languages.append({
-                            'id': row[1],
-                            'name': row[2]
-                        })
-                    elif row[0] == 'developer':
-                        developers.append({
-                            'id': row[1],
-                            'name': row[2]
-                        })
-                    elif row[0] == 'publisher':
-                        publishers.append({
-                            'id': row[1],
-                            'name': row[2]
-                        })
-
-                return Attributes(
-                    genres=genres,
-                    categories=categories,
-                    tags=tags,
-                    languages=languages,
-                    audio_languages=audio_languages,
-                    developers=developers,
-                    publishers=publishers
-                )
+                    items = lists.get(row[0])
+                    if items is not None:
+                        items.append(
+                            trusted_model(Attribute, id=row[1], name=row[2]))
+
+                return Attributes.construct(**{
+                    field: lists[t] for t, field in ATTRIBUTE_FIELDS.items()
+                })
         except mysql.connector.Error as err:
             print(err)
-            return None
\ No newline at end of file
+            return None
+
+    @staticmethod
+    def invalidate_cache():
+        attributes_cache.invalidate(ATTRIBUTES_KEY)
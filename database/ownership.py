@@ -0,0 +1,142 @@
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+import threading
+import mysql.connector
+
+from database.query import fetch_all
+
+# users whose owned games are kept in memory; at 4 bytes per owned game
+# even large libraries stay small
+OWNERSHIP_MAX_USERS = 100_000
+
+
+# The game ids one user owns, as a sorted array of unsigned ints. Membership
+# is a binary search over a contiguous buffer, and a library of a few hundred
+# games is a couple of KiB.
+class OwnedGames:
+    def __init__(self, game_ids: Iterable[int] = ()):
+        self._ids = array('I', sorted(set(game_ids)))
+
+    def __contains__(self, game_id: int) -> bool:
+        i = bisect_left(self._ids, game_id)
+        return i < len(self._ids) and self._ids[i] == game_id
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def add(self, game_id: int):
+        i = bisect_left(self._ids, game_id)
+        if i == len(self._ids) or self._ids[i] != game_id:
+            self._ids.insert(i, game_id)
+
+    def nbytes(self) -> int:
+        return self._ids.itemsize * len(self._ids)
+
+
+# Process-wide index of user_id -> OwnedGames, least recently used first.
+# Users are loaded lazily with one query and kept current by record_purchase,
+# which GameInfo.purchase_game calls after every committed purchase.
+class OwnershipIndex:
+    def __init__(self, max_users: int = OWNERSHIP_MAX_USERS):
+        self.max_users = max_users
+        self._users: "OrderedDict[int, OwnedGames]" = OrderedDict()
+        # user_id -> purchases recorded while a load of that user ran
+        self._loading: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def peek(self, user_id: int) -> Optional[OwnedGames]:
+        """
+        Returns the user's owned games if they are loaded, otherwise None.
+        """
+        with self._lock:
+            owned = self._users.get(user_id)
+            if owned is None:
+                self.misses += 1
+                return None
+            self._users.move_to_end(user_id)
+            self.hits += 1
+            return owned
+
+    def load(self, conn: mysql.connector.MySQLConnection,
+             user_id: int) -> Optional[OwnedGames]:
+        """
+        Reads the user's owned games from the database and keeps them,
+        unless a purchase was recorded while the query ran (the rows may
+        predate it; the next lookup loads again). Returns None on a
+        database error.
+        """
+        query = """
+                SELECT game_id FROM purchases
+                WHERE user_id = %s ORDER BY game_id;
+                """
+
+        with self._lock:
+            self._loading.setdefault(user_id, 0)
+        try:
+            rows = fetch_all(conn, query, (user_id,))
+        except mysql.connector.Error as err:
+            print(err)
+            with self._lock:
+                self._loading.pop(user_id, None)
+            return None
+
+        owned = OwnedGames(row[0] for row in rows)
+        with self._lock:
+            self.loads += 1
+            if self._loading.pop(user_id, 0):
+                return owned
+            self._users[user_id] = owned
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+                self.evictions += 1
+        return owned
+
+    def record_purchase(self, user_id: int, game_id: int):
+        """
+        Write-through for a committed purchase.
+        """
+        with self._lock:
+            owned = self._users.get(user_id)
+            if owned is not None:
+                owned.add(game_id)
+            if user_id in self._loading:
+                self._loading[user_id] += 1
+
+    def invalidate(self, user_id: int = None):
+        """
+        Drops one user, or every user when user_id is None.
+        """
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(user_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "users": len(self._users),
+                "max_users": self.max_users,
+                "games": sum(len(o) for o in self._users.values()),
+                "bytes": sum(o.nbytes() for o in self._users.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
+
+
+ownership_index = OwnershipIndex()
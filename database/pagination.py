@@ -0,0 +1,32 @@
+import base64
+from typing import Optional, Tuple
+
+# Cursor directions: fetch the rows after / before the anchor game_id
+NEXT = 'n'
+PREV = 'p'
+
+
+def encode_cursor(direction: str, game_id: int) -> str:
+    """
+    Returns an opaque, URL-safe token for keyset pagination.
+    """
+    raw = f"{direction}:{game_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: Optional[str]) -> Optional[Tuple[str, int]]:
+    """
+    Returns (direction, game_id) for a token from encode_cursor, or None if
+    the token is missing or malformed.
+    """
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        direction, game_id = \
+            base64.urlsafe_b64decode(padded).decode().split(":")
+        if direction not in (NEXT, PREV):
+            return None
+        return direction, int(game_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
@@ -0,0 +1,174 @@
+"""
+Purchase engine: checks, records and pays for a purchase in one short
+transaction.
+
+The debit is a conditional UPDATE on the buyer's row (balance >= price), so
+the balance check and the debit are one atomic step and the row lock is only
+held until the commit right after the insert. The unique (user_id, game_id)
+key on purchases makes a second purchase of the same game fail, which rolls
+the debit back; the unique (user_id, request_key) key does the same for a
+retried request, which is then answered with the original outcome. The game
+price is read without locking, so a burst on one popular game does not queue
+on its row.
+"""
+
+from typing import Optional
+import threading
+import mysql.connector
+from mysql.connector import errorcode
+
+from database.query import execute, fetch_all, fetch_one
+
+# Outcomes of make_purchase. REPLAYED means the request key was already used
+# for this game, by the request that bought it.
+PURCHASED = 'purchased'
+REPLAYED = 'replayed'
+ALREADY_OWNED = 'already_owned'
+INSUFFICIENT_FUNDS = 'insufficient_funds'
+NOT_FOUND = 'not_found'
+KEY_CONFLICT = 'key_conflict'
+# outcomes after which the user owns the game
+OWNED_OUTCOMES = (PURCHASED, REPLAYED, ALREADY_OWNED)
+
+# longest request key accepted (purchases.request_key is VARCHAR(64))
+REQUEST_KEY_MAX = 64
+
+# a transaction picked as a deadlock victim or timed out on a lock is
+# rolled back by the server and can simply run again
+RETRY_ERRNOS = (errorcode.ER_LOCK_DEADLOCK, errorcode.ER_LOCK_WAIT_TIMEOUT)
+PURCHASE_ATTEMPTS = 3
+
+SQL_GAME_PRICE = """
+    SELECT price_usd FROM game WHERE game_id = %s;
+    """
+SQL_DEBIT = """
+    UPDATE user SET balance = balance - %s
+    WHERE user_id = %s AND balance >= %s;
+    """
+SQL_USER_EXISTS = """
+    SELECT 1 FROM user WHERE user_id = %s;
+    """
+SQL_INSERT = """
+    INSERT INTO purchases
+        (user_id, game_id, purchase_date, purchase_price, request_key)
+    VALUES (%s, %s, CURDATE(), %s, %s);
+    """
+SQL_EXISTING = """
+    SELECT game_id, request_key FROM purchases
+    WHERE user_id = %s AND (game_id = %s OR request_key = %s);
+    """
+
+
+_stats_lock = threading.Lock()
+_stats = {
+    PURCHASED: 0,
+    REPLAYED: 0,
+    ALREADY_OWNED: 0,
+    INSUFFICIENT_FUNDS: 0,
+    NOT_FOUND: 0,
+    KEY_CONFLICT: 0,
+    "retries": 0,
+    "errors": 0,
+}
+
+
+def _count(name: str):
+    with _stats_lock:
+        _stats[name] += 1
+
+def purchase_stats() -> dict:
+    with _stats_lock:
+        return dict(_stats)
+
+
+class _Rollback(Exception):
+    def __init__(self, outcome: str):
+        self.outcome = outcome
+
+
+def _existing_outcome(conn: mysql.connector.MySQLConnection, user_id: int,
+                      game_id: int, request_key: Optional[str],
+                      default: str) -> str:
+    """
+    Explains a purchase that did not go through by the rows already there:
+    the same request (REPLAYED), the key used for another game, or the game
+    already owned. `default` if there is neither.
+    """
+    rows = fetch_all(conn, SQL_EXISTING, (user_id, game_id, request_key))
+    if request_key is not None:
+        for owned_game, key in rows:
+            if key == request_key:
+                return REPLAYED if owned_game == game_id else KEY_CONFLICT
+    if any(owned_game == game_id for owned_game, _ in rows):
+        return ALREADY_OWNED
+    return default
+
+def _purchase_once(conn: mysql.connector.MySQLConnection, user_id: int,
+                   game_id: int, request_key: Optional[str]) -> str:
+    row = fetch_one(conn, SQL_GAME_PRICE, (game_id,))
+    if row is None or row[0] is None:
+        raise _Rollback(NOT_FOUND)
+    price = row[0]
+
+    # free games need no debit; the unique key alone guards them
+    if price > 0 and not execute(conn, SQL_DEBIT, (price, user_id, price)):
+        # the debit also matches no row when there is no such user
+        if fetch_one(conn, SQL_USER_EXISTS, (user_id,)) is None:
+            raise _Rollback(NOT_FOUND)
+        raise _Rollback(INSUFFICIENT_FUNDS)
+    try:
+        execute(conn, SQL_INSERT, (user_id, game_id, price, request_key))
+    except mysql.connector.IntegrityError as err:
+        if err.errno != errorcode.ER_DUP_ENTRY:
+            # no such user (foreign key)
+            raise _Rollback(NOT_FOUND)
+        raise _Rollback(ALREADY_OWNED)
+    conn.commit()
+    return PURCHASED
+
+def make_purchase(conn: mysql.connector.MySQLConnection, user_id: int,
+                  game_id: int, request_key: str = None) -> Optional[str]:
+    """
+    Buys `game_id` for `user_id`: in one transaction, debits the price if
+    the balance covers it and records the purchase. Requests carrying the
+    same `request_key` take effect at most once. Returns one of the outcome
+    constants above, or None on a database error.
+    """
+    if not user_id or not game_id:
+        return None
+
+    for attempt in range(PURCHASE_ATTEMPTS):
+        # start from a fresh snapshot
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            outcome = _purchase_once(conn, user_id, game_id, request_key)
+        except _Rollback as stop:
+            try:
+                conn.rollback()
+                # a failed debit or insert may be a request that already
+                # went through, or a game bought by a concurrent request
+                if stop.outcome != NOT_FOUND:
+                    outcome = _existing_outcome(
+                        conn, user_id, game_id, request_key, stop.outcome)
+                else:
+                    outcome = stop.outcome
+                conn.rollback()
+            except mysql.connector.Error as err:
+                print(err)
+                _count("errors")
+                return None
+        except mysql.connector.Error as err:
+            try:
+                conn.rollback()
+            except mysql.connector.Error:
+                pass
+            if err.errno in RETRY_ERRNOS and attempt + 1 < PURCHASE_ATTEMPTS:
+                _count("retries")
+                continue
+            print(err)
+            _count("errors")
+            return None
+
+        _count(outcome)
+        return outcome
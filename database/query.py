@@ -0,0 +1,185 @@
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+import threading
+import weakref
+import mysql.connector
+
+from database.facets import FACET_TABLES
+
+# Server-side prepared statements kept open per connection. MySQL caps
+# prepared statements server-wide (max_prepared_stmt_count, 16382 by
+# default), so with every pool full this stays far below the limit.
+STATEMENTS_PER_CONN = 64
+
+# derived table alias per facet type in the filter query
+FILTER_ALIASES = {
+    'category': 'gc',
+    'genre': 'gg',
+    'tag': 'gt',
+    'lang': 'gl',
+    'audio_lang': 'gal',
+    'developer': 'gd',
+    'publisher': 'gp',
+}
+
+
+# Shape of a facet selection: (facet type, number of distinct ids) for each
+# selected type, in FACET_TABLES order. Selections with the same shape share
+# one SQL text and so one prepared statement.
+def filter_shape(selection: Dict[str, Iterable[int]]) -> tuple:
+    return tuple(
+        (facet_type, len(set(selection[facet_type])))
+        for facet_type in FACET_TABLES if selection.get(facet_type)
+    )
+
+def _filter_joins(shape: tuple) -> str:
+    joins = []
+    for facet_type, n in shape:
+        table, column = FACET_TABLES[facet_type]
+        alias = FILTER_ALIASES[facet_type]
+        placeholders = ", ".join(["%s"] * n)
+        joins.append(f"""
+            JOIN (
+                SELECT game_id FROM {table}
+                WHERE {column} IN ({placeholders})
+                GROUP BY game_id
+                HAVING COUNT(DISTINCT {column}) = %s
+            ) {alias} ON g.game_id = {alias}.game_id""")
+    return ''.join(joins)
+
+@lru_cache(maxsize=1024)
+def _filter_ids_sql(shape: tuple) -> str:
+    return (f"SELECT g.game_id FROM game g{_filter_joins(shape)}\n"
+            f"            ORDER BY g.game_id")
+
+def _filter_params(selection: Dict[str, Iterable[int]]) -> list:
+    params = []
+    for facet_type in FACET_TABLES:
+        ids = sorted(set(int(i) for i in selection.get(facet_type) or ()))
+        if ids:
+            params.extend(ids)
+            params.append(len(ids))
+    return params
+
+def games_filter_ids_query(selection: Dict[str, Iterable[int]]
+                           ) -> Tuple[str, tuple]:
+    """
+    Returns (sql, params) for the ids of all games having every selected
+    attribute, in game_id order. Only the table and column names from
+    FACET_TABLES are part of the SQL text; ids and counts are parameters.
+    """
+    return (_filter_ids_sql(filter_shape(selection)),
+            tuple(_filter_params(selection)))
+
+
+_stats_lock = threading.Lock()
+_stats = {
+    "hits": 0,
+    "prepares": 0,
+    "evictions": 0,
+    "errors": 0,
+}
+
+
+# Prepared cursors of one connection, keyed by SQL text, least recently used
+# first. The connector only re-prepares when a cursor is handed a different
+# string object than its last one, so the cached key itself is always
+# passed back to execute().
+class StatementCache:
+    def __init__(self, max_statements: int = STATEMENTS_PER_CONN):
+        self.max_statements = max_statements
+        self._statements: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._statements)
+
+    def execute(self, conn: mysql.connector.MySQLConnection, sql: str,
+                params: tuple = ()):
+        """
+        Executes `sql` with `params` on the connection's prepared cursor
+        for it, preparing it first on a miss. Returns the cursor with its
+        result pending.
+        """
+        entry = self._statements.get(sql)
+        if entry is not None:
+            self._statements.move_to_end(sql)
+            sql, cursor = entry
+            hit = True
+        else:
+            cursor = conn.cursor(prepared=True)
+            self._statements[sql] = (sql, cursor)
+            hit = False
+            if len(self._statements) > self.max_statements:
+                _, (_, oldest) = self._statements.popitem(last=False)
+                self._close(oldest)
+                with _stats_lock:
+                    _stats["evictions"] += 1
+
+        try:
+            cursor.execute(sql, params)
+        except mysql.connector.Error:
+            # the statement may be gone on the server; prepare it again
+            # next time
+            self._statements.pop(sql, None)
+            self._close(cursor)
+            with _stats_lock:
+                _stats["errors"] += 1
+            raise
+
+        with _stats_lock:
+            _stats["hits" if hit else "prepares"] += 1
+        return cursor
+
+    def _close(self, cursor):
+        try:
+            cursor.close()
+        except mysql.connector.Error:
+            pass
+
+
+_caches = weakref.WeakKeyDictionary()
+_caches_lock = threading.Lock()
+
+def statement_cache(conn: mysql.connector.MySQLConnection) -> StatementCache:
+    """
+    Returns the statement cache of a connection. A connection is only used
+    by one thread at a time, so the cache itself needs no lock. It goes away
+    with the connection, and its statements with the server session.
+    """
+    cache = _caches.get(conn)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(conn)
+            if cache is None:
+                cache = _caches[conn] = StatementCache()
+    return cache
+
+def fetch_all(conn: mysql.connector.MySQLConnection, sql: str,
+              params: tuple = ()) -> List[tuple]:
+    return statement_cache(conn).execute(conn, sql, params).fetchall()
+
+def fetch_one(conn: mysql.connector.MySQLConnection, sql: str,
+              params: tuple = ()) -> Optional[tuple]:
+    rows = fetch_all(conn, sql, params)
+    return rows[0] if rows else None
+
+def execute(conn: mysql.connector.MySQLConnection, sql: str,
+            params: tuple = ()) -> int:
+    """
+    Runs a statement that returns no rows (INSERT, UPDATE, ...) and returns
+    the number of rows it changed.
+    """
+    return statement_cache(conn).execute(conn, sql, params).rowcount
+
+def statement_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    with _caches_lock:
+        caches = list(_caches.values())
+    executions = stats["hits"] + stats["prepares"]
+    stats["hit_rate"] = stats["hits"] / executions if executions else 0.0
+    stats["connections"] = len(caches)
+    stats["cached"] = sum(len(c) for c in caches)
+    stats["shapes"] = _filter_ids_sql.cache_info().currsize
+    return stats
@@ -0,0 +1,171 @@
+from array import array
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import heapq
+import math
+import os
+import pickle
+import re
+import mysql.connector
+
+from database.objects import get_catalog_version
+
+# Where the built index is persisted between restarts
+SEARCH_INDEX_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'search_index.pkl')
+
+# BM25 parameters; name tokens count NAME_WEIGHT times so title matches rank
+# above passing mentions in the description
+K1 = 1.2
+B = 0.75
+NAME_WEIGHT = 3
+# descriptions are cut after this many tokens to bound index size
+MAX_ABOUT_TOKENS = 400
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset((
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in',
+    'is', 'it', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'with', 'you',
+    'your',
+))
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+# Inverted index over game names and descriptions with BM25 ranking
+class SearchIndex:
+    def __init__(self, docs: Iterable[Tuple[int, str, str]],
+                 catalog_version: int = None):
+        """
+        docs: (game_id, game_name, about_game) rows, read at
+        `catalog_version` of the catalog.
+        """
+        self.game_ids = array('I')
+        self.doc_len = array('I')
+        postings: Dict[str, Tuple[array, array]] = {}
+
+        for game_id, name, about in docs:
+            doc = len(self.game_ids)
+            self.game_ids.append(game_id)
+
+            tf = Counter(tokenize(about)[:MAX_ABOUT_TOKENS])
+            for term in tokenize(name):
+                tf[term] += NAME_WEIGHT
+            self.doc_len.append(sum(tf.values()))
+
+            for term, n in tf.items():
+                entry = postings.get(term)
+                if entry is None:
+                    entry = postings[term] = (array('I'), array('H'))
+                entry[0].append(doc)
+                entry[1].append(min(n, 0xFFFF))
+
+        self.postings = postings
+        # catalog_version the rows were read at; every change to a game
+        # bumps it, so a saved index with another version is outdated
+        self.catalog_version = catalog_version
+        self.avg_len = (sum(self.doc_len) / len(self.doc_len)
+                        if self.doc_len else 0.0)
+
+    @classmethod
+    def load(cls, conn: mysql.connector.MySQLConnection) -> 'SearchIndex':
+        # read the version first: a change during the scan then leaves the
+        # index marked older than the catalog, and it is rebuilt next time
+        stamp = get_catalog_version(conn)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT game_id, game_name, about_game
+                    FROM game ORDER BY game_id;
+                    """)
+                return cls(cursor.fetchall(),
+                           stamp[0] if stamp is not None else None)
+        except mysql.connector.Error as err:
+            print(err)
+            return None
+
+    def save(self, path: str = SEARCH_INDEX_PATH):
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def from_file(path: str = SEARCH_INDEX_PATH) -> Optional['SearchIndex']:
+        try:
+            with open(path, 'rb') as f:
+                index = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None
+        return index if isinstance(index, SearchIndex) else None
+
+    def search(self, query: str, limit: int = 10, offset: int = 0,
+               allowed: Callable[[int], bool] = None
+               ) -> Tuple[int, List[int]]:
+        """
+        Returns (number of matching games, game ids of the requested page)
+        ranked by BM25. `allowed`, if given, is a game_id predicate (e.g.
+        from FacetIndex.member_test) applied while scoring.
+        """
+        n_docs = len(self.game_ids)
+        terms = set(tokenize(query))
+        if not terms or not n_docs:
+            return 0, []
+
+        scores: Dict[int, float] = {}
+        doc_len = self.doc_len
+        norm = K1 * (1 - B)
+        scale = K1 * B / self.avg_len
+        game_ids = self.game_ids
+
+        for term in terms:
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+            docs, tfs = entry
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc, tf in zip(docs, tfs):
+                if allowed is not None and not allowed(game_ids[doc]):
+                    continue
+                s = idf * tf * (K1 + 1) / (tf + norm + scale * doc_len[doc])
+                scores[doc] = scores.get(doc, 0.0) + s
+
+        top = heapq.nlargest(offset + limit, scores.items(),
+                             key=lambda item: item[1])
+        return len(scores), [game_ids[doc] for doc, _ in top[offset:]]
+
+
+_index: Optional[SearchIndex] = None
+
+def load_search_index(conn: mysql.connector.MySQLConnection,
+                      rebuild: bool = False,
+                      path: str = SEARCH_INDEX_PATH) -> SearchIndex:
+    """
+    Loads the shared search index from `path`, or builds it from the catalog
+    (and saves it) when the file is missing, was built at a different
+    catalog_version, or `rebuild` is set.
+    """
+    global _index
+    index = None if rebuild else SearchIndex.from_file(path)
+    if index is not None:
+        stamp = get_catalog_version(conn)
+        saved = getattr(index, 'catalog_version', None)
+        if stamp is None or saved is None or saved != stamp[0]:
+            index = None
+    if index is None:
+        index = SearchIndex.load(conn)
+        if index is not None:
+            try:
+                index.save(path)
+            except OSError as err:
+                print(err)
+    if index is not None:
+        _index = index
+    return index
+
+def get_search_index() -> Optional[SearchIndex]:
+    return _index
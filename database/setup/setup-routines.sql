@@ -47,25 +47,12 @@ DELIMITER ;
 
 -- Triggers
 
--- Drop existing triggers
+-- Drop existing triggers. The balance used to be debited by an
+-- update_balance trigger after each insert into purchases; purchases now
+-- debit it in the same transaction as the insert (sp_make_purchase, and
+-- database/purchases.py in the app).
 DROP TRIGGER IF EXISTS update_balance;
 
--- trigger to update the balance of the user after a purchase
-
-DELIMITER !
-
-CREATE TRIGGER update_balance
-AFTER INSERT ON purchases
-FOR EACH ROW
-BEGIN
-    UPDATE user
-    SET balance = balance - (
-        SELECT price_usd FROM game WHERE game_id = NEW.game_id)
-    WHERE user_id = NEW.user_id;
-END !
-
-DELIMITER ;
-
 -- Procedures
 
 -- Drop existing procedures
@@ -75,245 +62,32 @@ DROP PROCEDURE IF EXISTS sp_get_games_by_all_limit;
 DROP PROCEDURE IF EXISTS sp_create_users;
 DROP PROCEDURE IF EXISTS sp_make_random_purchases;
 
--- Procedure to get all information about a game
-DELIMITER !
-
-CREATE PROCEDURE sp_get_game_info(game_id INT)
-BEGIN
-    CREATE TEMPORARY TABLE game_info AS
-    SELECT
-        game.game_id,
-        game.game_name,
-        game.release_date,
-        game.estimated_owners,
-        game.price_usd,
-        game.about_game,
-        game.metacritic_score,
-        game.platform_support,
-        game.header_image,
-        GROUP_CONCAT(DISTINCT game_videos.video_url) AS video_urls,
-        GROUP_CONCAT(DISTINCT categories.category_name) AS categories,
-        GROUP_CONCAT(DISTINCT genres.genre_name) AS genres,
-        GROUP_CONCAT(DISTINCT tags.tag_name) AS tags,
-        GROUP_CONCAT(DISTINCT supp_langs.lang) AS supp_langs,
-        GROUP_CONCAT(DISTINCT supp_audio_langs.audio_lang) AS supp_audio_langs,
-        GROUP_CONCAT(DISTINCT developers.dev_name) AS developers,
-        GROUP_CONCAT(DISTINCT publishers.pub_name) AS publishers
-    FROM game
-    NATURAL LEFT JOIN game_videos
-    NATURAL LEFT JOIN game_categories
-    NATURAL LEFT JOIN categories
-    NATURAL LEFT JOIN game_genres
-    NATURAL LEFT JOIN genres
-    NATURAL LEFT JOIN game_tags
-    NATURAL LEFT JOIN tags
-    NATURAL LEFT JOIN game_langs
-    NATURAL LEFT JOIN supp_langs
-    NATURAL LEFT JOIN game_audio_langs
-    NATURAL LEFT JOIN supp_audio_langs
-    NATURAL LEFT JOIN game_developers
-    NATURAL LEFT JOIN developers
-    NATURAL LEFT JOIN game_publishers
-    NATURAL LEFT JOIN publishers
-    WHERE game.game_id = game_id
-    GROUP BY 
-        game.game_id,
-        game.game_name,
-        game.release_date,
-        game.estimated_owners,
-        game.price_usd,
-        game.about_game,
-        game.metacritic_score,
-        game.platform_support,
-        game.header_image;
-
-    SELECT * FROM game_info;
-    DROP TEMPORARY TABLE game_info;
-END !
-
-DELIMITER ;
-
 -- procedure to make a purchase
 
 DELIMITER !
 
 CREATE PROCEDURE sp_make_purchase(user_id INT, game_id INT)
 BEGIN
-    IF 
-        has_enough_balance(user_id, game_id) AND NOT 
-        has_purchased(user_id, game_id) 
-    THEN
-        INSERT INTO purchases (user_id, game_id, purchase_date)
-        VALUES (user_id, game_id, CURDATE());
-    END IF;
-END !
-
-DELIMITER ;
-
--- Procedure to get games by all filters with limit and offset
-
-DELIMITER !
-
-CREATE PROCEDURE sp_get_games_by_all_limit(
-    IN category_ids VARCHAR(255), 
-    IN genre_ids VARCHAR(255),
-    IN tag_ids VARCHAR(255),
-    IN lang_ids VARCHAR(255),
-    IN audio_lang_ids VARCHAR(255),
-    IN dev_ids VARCHAR(255),
-    IN pub_ids VARCHAR(255),
-    IN limit_num INT,
-    IN offset_num INT
-)
-BEGIN
-    DECLARE category_cnt INT DEFAULT 0;
-    DECLARE genre_cnt INT DEFAULT 0;
-    DECLARE tag_cnt INT DEFAULT 0;
-    DECLARE lang_cnt INT DEFAULT 0;
-    DECLARE audio_lang_cnt INT DEFAULT 0;
-    DECLARE dev_cnt INT DEFAULT 0;
-    DECLARE pub_cnt INT DEFAULT 0;
-
-    IF TRIM(category_ids) <> '' THEN
-        SET category_cnt = (
-            LENGTH(category_ids) - 
-            LENGTH(REPLACE(category_ids, ',', '')) + 1);
-    END IF;
-
-    IF TRIM(genre_ids) <> '' THEN
-        SET genre_cnt = (
-            LENGTH(genre_ids) - 
-            LENGTH(REPLACE(genre_ids, ',', '')) + 1);
-    END IF;
-
-    IF TRIM(tag_ids) <> '' THEN
-        SET tag_cnt = (
-            LENGTH(tag_ids) - 
-            LENGTH(REPLACE(tag_ids, ',', '')) + 1);
-    END IF;
-
-    IF TRIM(lang_ids) <> '' THEN
-        SET lang_cnt = (
-            LENGTH(lang_ids) - 
-            LENGTH(REPLACE(lang_ids, ',', '')) + 1);
-    END IF;
-
-    IF TRIM(audio_lang_ids) <> '' THEN
-        SET audio_lang_cnt = (
-            LENGTH(audio_lang_ids) - 
-            LENGTH(REPLACE(audio_lang_ids, ',', '')) + 1);
-    END IF;
-
-    IF TRIM(dev_ids) <> '' THEN
-        SET dev_cnt = (
-            LENGTH(dev_ids) - 
-            LENGTH(REPLACE(dev_ids, ',', '')) + 1);
-    END IF;
-
-    IF TRIM(pub_ids) <> '' THEN
-        SET pub_cnt = (
-            LENGTH(pub_ids) - 
-            LENGTH(REPLACE(pub_ids, ',', '')) + 1);
-    END IF;
-
-    SET @dq := 'SELECT g.* FROM game g ';
-
-    IF category_cnt > 0 THEN
-        SET @dq := CONCAT(
-            @dq, 
-            'JOIN (
-                SELECT game_id FROM game_categories 
-                WHERE category_id IN (', category_ids, ') 
-                GROUP BY game_id 
-                HAVING COUNT(DISTINCT category_id) = ', category_cnt, '
-            ) gc ON g.game_id = gc.game_id ');
-    END IF;
-
-    IF genre_cnt > 0 THEN
-        SET @dq := CONCAT(
-            @dq, 
-            'JOIN (
-                SELECT game_id FROM game_genres 
-                WHERE genre_id IN (', genre_ids, ') 
-                GROUP BY game_id 
-                HAVING COUNT(DISTINCT genre_id) = ', genre_cnt, '
-            ) gg ON g.game_id = gg.game_id ');
-    END IF;
-
-    IF tag_cnt > 0 THEN
-        SET @dq := CONCAT(
-            @dq, 
-            'JOIN (
-                SELECT game_id FROM game_tags 
-                WHERE tag_id IN (', tag_ids, ') 
-                GROUP BY game_id 
-                HAVING COUNT(DISTINCT tag_id) = ', tag_cnt, '
-            ) gt ON g.game_id = gt.game_id ');
-    END IF;
-
-    IF lang_cnt > 0 THEN
-        SET @dq := CONCAT(
-            @dq, 
-            'JOIN (
-                SELECT game_id FROM game_langs 
-                WHERE lang_id IN (', lang_ids, ') 
-                GROUP BY game_id 
-                HAVING COUNT(DISTINCT lang_id) = ', lang_cnt, '
-            ) gl ON g.game_id = gl.game_id ');
-    END IF;
-
-    IF audio_lang_cnt > 0 THEN
-        SET @dq := CONCAT(
-            @dq, 
-            'JOIN (
-                SELECT game_id FROM game_audio_langs 
-                WHERE audio_lang_id IN (', audio_lang_ids, ') 
-                GROUP BY game_id 
-                HAVING 
-                COUNT(DISTINCT audio_lang_id) = ', audio_lang_cnt, '
-            ) gal ON g.game_id = gal.game_id ');
-    END IF;
-
-    IF dev_cnt > 0 THEN
-        SET @dq := CONCAT(
-            @dq, 
-            'JOIN (
-                SELECT game_id FROM game_developers 
-                WHERE dev_id IN (', dev_ids, ') 
-                GROUP BY game_id 
-                HAVING COUNT(DISTINCT dev_id) = ', dev_cnt, '
-            ) gd ON g.game_id = gd.game_id ');
-    END IF;
+    DECLARE game_price DECIMAL(10, 2);
+    -- already owned: the unique (user_id, game_id) key rejects the insert
+    DECLARE EXIT HANDLER FOR 1062 ROLLBACK;
 
-    IF pub_cnt > 0 THEN
-        SET @dq := CONCAT(
-            @dq, 
-            'JOIN (
-                SELECT game_id FROM game_publishers 
-                WHERE pub_id IN (', pub_ids, ') 
-                GROUP BY game_id 
-                HAVING COUNT(DISTINCT pub_id) = ', pub_cnt, '
-            ) gp ON g.game_id = gp.game_id ');
-    END IF;
+    SELECT price_usd INTO game_price FROM game WHERE game.game_id = game_id;
 
-    IF 
-        category_cnt = 0 
-        AND genre_cnt = 0 
-        AND tag_cnt = 0 
-        AND lang_cnt = 0 
-        AND audio_lang_cnt = 0 
-        AND dev_cnt = 0 
-        AND pub_cnt = 0 
-    THEN
-        SET @dq := CONCAT(@dq, 'WHERE 1=1');
+    -- the balance check and the debit are one conditional update, which
+    -- locks the user's row until the purchase is committed or rolled back
+    START TRANSACTION;
+    UPDATE user SET balance = balance - game_price
+    WHERE user.user_id = user_id AND balance >= game_price;
+
+    IF ROW_COUNT() = 1 OR game_price = 0 THEN
+        INSERT INTO purchases 
+            (user_id, game_id, purchase_date, purchase_price)
+        VALUES (user_id, game_id, CURDATE(), game_price);
+        COMMIT;
+    ELSE
+        ROLLBACK;
     END IF;
-
-    SET @dq := CONCAT(
-        @dq, ' LIMIT ', limit_num, ' OFFSET ', offset_num);
-
-    PREPARE stmt FROM @dq;
-    EXECUTE stmt;
-    DEALLOCATE PREPARE stmt;
 END !
 
 DELIMITER ;
@@ -362,4 +136,358 @@ BEGIN
     DROP TEMPORARY TABLE user_ids;
     DROP TEMPORARY TABLE game_ids;
 END !
-DELIMITER ;
\ No newline at end of file
+DELIMITER ;
+
+-- Materialized game details
+
+DROP PROCEDURE IF EXISTS sp_bump_catalog_version;
+DROP PROCEDURE IF EXISTS sp_refresh_game_detail;
+DROP PROCEDURE IF EXISTS sp_refresh_linked_game_details;
+DROP PROCEDURE IF EXISTS sp_refresh_all_game_details;
+
+-- Marks the catalog as changed
+
+DELIMITER !
+
+CREATE PROCEDURE sp_bump_catalog_version()
+BEGIN
+    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+END !
+
+DELIMITER ;
+
+-- Rebuilds the game_detail row for one game from game_detail_source.
+-- The refreshes below upsert rather than delete and insert, so an existing
+-- row is updated in place and any other error (a value that does not fit,
+-- a missing game) is raised instead of skipped. game_id alone is not unique
+-- in game, so a game listed under two names refreshes one row, last wins.
+
+DELIMITER !
+
+CREATE PROCEDURE sp_refresh_game_detail(game_id INT)
+BEGIN
+    SET SESSION group_concat_max_len = 1000000;
+
+    INSERT INTO game_detail (
+        game_id, game_name, release_date, estimated_owners, price_usd,
+        about_game, metacritic_score, platform_support, header_image,
+        video_urls, categories, genres, tags, supp_langs, supp_audio_langs,
+        developers, publishers
+    )
+    SELECT * FROM game_detail_source s WHERE s.game_id = game_id
+    ON DUPLICATE KEY UPDATE
+        game_name = s.game_name, release_date = s.release_date,
+        estimated_owners = s.estimated_owners, price_usd = s.price_usd,
+        about_game = s.about_game, metacritic_score = s.metacritic_score,
+        platform_support = s.platform_support,
+        header_image = s.header_image, video_urls = s.video_urls,
+        categories = s.categories, genres = s.genres, tags = s.tags,
+        supp_langs = s.supp_langs, supp_audio_langs = s.supp_audio_langs,
+        developers = s.developers, publishers = s.publishers,
+        detail_version = detail_version + 1;
+
+    CALL sp_bump_catalog_version();
+END !
+
+DELIMITER ;
+
+-- Rebuilds the game_detail rows of every game linked to one attribute,
+-- after the attribute is renamed. `kind` is a type from attributes_view.
+
+DELIMITER !
+
+CREATE PROCEDURE sp_refresh_linked_game_details(kind VARCHAR(16),
+                                                attr_id INT)
+BEGIN
+    SET SESSION group_concat_max_len = 1000000;
+
+    INSERT INTO game_detail (
+        game_id, game_name, release_date, estimated_owners, price_usd,
+        about_game, metacritic_score, platform_support, header_image,
+        video_urls, categories, genres, tags, supp_langs, supp_audio_langs,
+        developers, publishers
+    )
+    SELECT * FROM game_detail_source s
+    WHERE s.game_id IN (
+        SELECT game_id FROM game_categories
+        WHERE kind = 'category' AND category_id = attr_id
+        UNION ALL
+        SELECT game_id FROM game_genres
+        WHERE kind = 'genre' AND genre_id = attr_id
+        UNION ALL
+        SELECT game_id FROM game_tags
+        WHERE kind = 'tag' AND tag_id = attr_id
+        UNION ALL
+        SELECT game_id FROM game_langs
+        WHERE kind = 'lang' AND lang_id = attr_id
+        UNION ALL
+        SELECT game_id FROM game_audio_langs
+        WHERE kind = 'audio_lang' AND audio_lang_id = attr_id
+        UNION ALL
+        SELECT game_id FROM game_developers
+        WHERE kind = 'developer' AND dev_id = attr_id
+        UNION ALL
+        SELECT game_id FROM game_publishers
+        WHERE kind = 'publisher' AND pub_id = attr_id
+    )
+    ON DUPLICATE KEY UPDATE
+        game_name = s.game_name, release_date = s.release_date,
+        estimated_owners = s.estimated_owners, price_usd = s.price_usd,
+        about_game = s.about_game, metacritic_score = s.metacritic_score,
+        platform_support = s.platform_support,
+        header_image = s.header_image, video_urls = s.video_urls,
+        categories = s.categories, genres = s.genres, tags = s.tags,
+        supp_langs = s.supp_langs, supp_audio_langs = s.supp_audio_langs,
+        developers = s.developers, publishers = s.publishers,
+        detail_version = detail_version + 1;
+
+    CALL sp_bump_catalog_version();
+END !
+
+DELIMITER ;
+
+-- Rebuilds game_detail for the whole catalog in one set-based pass (run
+-- once after loading data, and after deleting a category, genre, tag,
+-- language, developer or publisher: its links go by ON DELETE CASCADE,
+-- which fires no trigger)
+
+DELIMITER !
+
+CREATE PROCEDURE sp_refresh_all_game_details()
+BEGIN
+    SET SESSION group_concat_max_len = 1000000;
+
+    INSERT INTO game_detail (
+        game_id, game_name, release_date, estimated_owners, price_usd,
+        about_game, metacritic_score, platform_support, header_image,
+        video_urls, categories, genres, tags, supp_langs, supp_audio_langs,
+        developers, publishers
+    )
+    SELECT * FROM game_detail_source s
+    ON DUPLICATE KEY UPDATE
+        game_name = s.game_name, release_date = s.release_date,
+        estimated_owners = s.estimated_owners, price_usd = s.price_usd,
+        about_game = s.about_game, metacritic_score = s.metacritic_score,
+        platform_support = s.platform_support,
+        header_image = s.header_image, video_urls = s.video_urls,
+        categories = s.categories, genres = s.genres, tags = s.tags,
+        supp_langs = s.supp_langs, supp_audio_langs = s.supp_audio_langs,
+        developers = s.developers, publishers = s.publishers,
+        detail_version = detail_version + 1;
+
+    CALL sp_bump_catalog_version();
+END !
+
+DELIMITER ;
+
+-- Drop existing game_detail triggers
+DROP TRIGGER IF EXISTS game_detail_game_insert;
+DROP TRIGGER IF EXISTS game_detail_game_update;
+DROP TRIGGER IF EXISTS catalog_version_game_delete;
+DROP TRIGGER IF EXISTS game_detail_videos_insert;
+DROP TRIGGER IF EXISTS game_detail_videos_delete;
+DROP TRIGGER IF EXISTS game_detail_categories_insert;
+DROP TRIGGER IF EXISTS game_detail_categories_delete;
+DROP TRIGGER IF EXISTS game_detail_genres_insert;
+DROP TRIGGER IF EXISTS game_detail_genres_delete;
+DROP TRIGGER IF EXISTS game_detail_tags_insert;
+DROP TRIGGER IF EXISTS game_detail_tags_delete;
+DROP TRIGGER IF EXISTS game_detail_langs_insert;
+DROP TRIGGER IF EXISTS game_detail_langs_delete;
+DROP TRIGGER IF EXISTS game_detail_audio_langs_insert;
+DROP TRIGGER IF EXISTS game_detail_audio_langs_delete;
+DROP TRIGGER IF EXISTS game_detail_developers_insert;
+DROP TRIGGER IF EXISTS game_detail_developers_delete;
+DROP TRIGGER IF EXISTS game_detail_publishers_insert;
+DROP TRIGGER IF EXISTS game_detail_publishers_delete;
+DROP TRIGGER IF EXISTS game_detail_categories_rename;
+DROP TRIGGER IF EXISTS game_detail_genres_rename;
+DROP TRIGGER IF EXISTS game_detail_tags_rename;
+DROP TRIGGER IF EXISTS game_detail_langs_rename;
+DROP TRIGGER IF EXISTS game_detail_audio_langs_rename;
+DROP TRIGGER IF EXISTS game_detail_developers_rename;
+DROP TRIGGER IF EXISTS game_detail_publishers_rename;
+
+-- Keep game_detail current when a game or any of its relations change
+
+DELIMITER !
+
+CREATE TRIGGER game_detail_game_insert AFTER INSERT ON game
+FOR EACH ROW
+BEGIN
+    CALL sp_refresh_game_detail(NEW.game_id);
+END !
+
+CREATE TRIGGER game_detail_game_update AFTER UPDATE ON game
+FOR EACH ROW
+BEGIN
+    CALL sp_refresh_game_detail(NEW.game_id);
+END !
+
+-- game_detail rows of deleted games go with the game (ON DELETE CASCADE),
+-- which fires no trigger, so deletes bump the version here
+CREATE TRIGGER catalog_version_game_delete AFTER DELETE ON game
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_catalog_version();
+END !
+
+CREATE TRIGGER game_detail_videos_insert AFTER INSERT ON game_videos
+FOR EACH ROW
+BEGIN
+    CALL sp_refresh_game_detail(NEW.game_id);
+END !
+
+CREATE TRIGGER game_detail_videos_delete AFTER DELETE ON game_videos
+FOR EACH ROW
+BEGIN
+    CALL sp_refresh_game_detail(OLD.game_id);
+END !
+
+CREATE TRIGGER game_detail_categories_insert AFTER INSERT ON game_categories
+FOR EACH ROW
+BEGIN
+    CALL sp_refresh_game_detail(NEW.game_id);
+END !
+
+CREATE TRIGGER game_detail_categories_delete AFTER DELETE ON game_categories
+FOR EACH ROW
+BEGIN
+    CALL sp_refresh_game_detail(OLD.game_id);
+END !
+
+CREATE TRIGGER game_detail_genres_insert AFTER INSERT ON game_genres
+FOR EACH ROW
+BEGIN
+    CALL sp_refresh_game_detail(NEW.game_id);
+END !
+
+CREATE TRIGGER game_detail_genres_delete AFTER DELETE ON game_genres
+FOR EACH ROW
+BEGIN
+    CALL sp_refresh_game_detail(OLD.game_id);
+END !
+
+CREATE TRIGGER game_detail_tags_insert AFTER INSERT ON game_tags
+FOR EACH ROW
+BEGIN
+    CALL sp_refresh_game_detail(NEW.game_id);
+END !
+
+CREATE TRIGGER game_detail_tags_delete AFTER DELETE ON game_tags
+FOR EACH ROW
+BEGIN
+    CALL sp_refresh_game_detail(OLD.game_id);
+END !
+
+CREATE TRIGGER game_detail_langs_insert AFTER INSERT ON game_langs
+FOR EACH ROW
+BEGIN
+    CALL sp_refresh_game_detail(NEW.game_id);
+END !
+
+CREATE TRIGGER game_detail_langs_delete AFTER DELETE ON game_langs
+FOR EACH ROW
+BEGIN
+    CALL sp_refresh_game_detail(OLD.game_id);
+END !
+
+CREATE TRIGGER game_detail_audio_langs_insert AFTER INSERT ON game_audio_langs
+FOR EACH ROW
+BEGIN
+    CALL sp_refresh_game_detail(NEW.game_id);
+END !
+
+CREATE TRIGGER game_detail_audio_langs_delete AFTER DELETE ON game_audio_langs
+FOR EACH ROW
+BEGIN
+    CALL sp_refresh_game_detail(OLD.game_id);
+END !
+
+CREATE TRIGGER game_detail_developers_insert AFTER INSERT ON game_developers
+FOR EACH ROW
+BEGIN
+    CALL sp_refresh_game_detail(NEW.game_id);
+END !
+
+CREATE TRIGGER game_detail_developers_delete AFTER DELETE ON game_developers
+FOR EACH ROW
+BEGIN
+    CALL sp_refresh_game_detail(OLD.game_id);
+END !
+
+CREATE TRIGGER game_detail_publishers_insert AFTER INSERT ON game_publishers
+FOR EACH ROW
+BEGIN
+    CALL sp_refresh_game_detail(NEW.game_id);
+END !
+
+CREATE TRIGGER game_detail_publishers_delete AFTER DELETE ON game_publishers
+FOR EACH ROW
+BEGIN
+    CALL sp_refresh_game_detail(OLD.game_id);
+END !
+
+-- Game pages show attribute names, so renaming one refreshes the games
+-- linked to it
+
+CREATE TRIGGER game_detail_categories_rename AFTER UPDATE ON categories
+FOR EACH ROW
+BEGIN
+    IF NOT (NEW.category_name <=> OLD.category_name) THEN
+        CALL sp_refresh_linked_game_details('category', NEW.category_id);
+    END IF;
+END !
+
+CREATE TRIGGER game_detail_genres_rename AFTER UPDATE ON genres
+FOR EACH ROW
+BEGIN
+    IF NOT (NEW.genre_name <=> OLD.genre_name) THEN
+        CALL sp_refresh_linked_game_details('genre', NEW.genre_id);
+    END IF;
+END !
+
+CREATE TRIGGER game_detail_tags_rename AFTER UPDATE ON tags
+FOR EACH ROW
+BEGIN
+    IF NOT (NEW.tag_name <=> OLD.tag_name) THEN
+        CALL sp_refresh_linked_game_details('tag', NEW.tag_id);
+    END IF;
+END !
+
+CREATE TRIGGER game_detail_langs_rename AFTER UPDATE ON supp_langs
+FOR EACH ROW
+BEGIN
+    IF NOT (NEW.lang <=> OLD.lang) THEN
+        CALL sp_refresh_linked_game_details('lang', NEW.lang_id);
+    END IF;
+END !
+
+CREATE TRIGGER game_detail_audio_langs_rename AFTER UPDATE ON supp_audio_langs
+FOR EACH ROW
+BEGIN
+    IF NOT (NEW.audio_lang <=> OLD.audio_lang) THEN
+        CALL sp_refresh_linked_game_details('audio_lang', NEW.audio_lang_id);
+    END IF;
+END !
+
+CREATE TRIGGER game_detail_developers_rename AFTER UPDATE ON developers
+FOR EACH ROW
+BEGIN
+    IF NOT (NEW.dev_name <=> OLD.dev_name) THEN
+        CALL sp_refresh_linked_game_details('developer', NEW.dev_id);
+    END IF;
+END !
+
+CREATE TRIGGER game_detail_publishers_rename AFTER UPDATE ON publishers
+FOR EACH ROW
+BEGIN
+    IF NOT (NEW.pub_name <=> OLD.pub_name) THEN
+        CALL sp_refresh_linked_game_details('publisher', NEW.pub_id);
+    END IF;
+END !
+
+DELIMITER ;
+
+-- Build the detail store for the data loaded by load-data.sql
+CALL sp_refresh_all_game_details();
@@ -25,6 +25,8 @@ DROP TABLE IF EXISTS developers;
 DROP TABLE IF EXISTS game_developers;
 DROP TABLE IF EXISTS publishers;
 DROP TABLE IF EXISTS game_publishers;
+DROP TABLE IF EXISTS game_detail;
+DROP TABLE IF EXISTS catalog_version;
 
 -- Table with general info about the game
 CREATE TABLE game (
@@ -76,8 +78,17 @@ CREATE TABLE purchases (
     user_id INT,
     game_id INT,
     purchase_date DATE,
+    -- price paid, so balances can be reconciled against purchases
+    purchase_price DECIMAL(10, 2),
+    -- idempotency key of the request that made the purchase; a retried
+    -- request with the same key cannot buy again
+    request_key VARCHAR(64),
     FOREIGN KEY (user_id) REFERENCES user(user_id) ON DELETE CASCADE,
-    FOREIGN KEY (game_id) REFERENCES game(game_id) ON DELETE CASCADE
+    FOREIGN KEY (game_id) REFERENCES game(game_id) ON DELETE CASCADE,
+    -- a game is bought at most once per user; also serves the ownership
+    -- index load (a user's games in game_id order) and has_purchased
+    UNIQUE KEY uq_purchases_user_game (user_id, game_id),
+    UNIQUE KEY uq_purchases_user_request (user_id, request_key)
 );
 
 -- Contains single category for each game
@@ -195,6 +206,49 @@ CREATE TABLE game_publishers (
 );
 
 
+-- Denormalized copy of everything the game page shows, one row per game.
+-- List columns hold names separated by tabs. Filled by
+-- sp_refresh_all_game_details and kept current by triggers (see
+-- setup-routines.sql), so the game page is a single primary-key lookup.
+CREATE TABLE game_detail (
+    game_id INT PRIMARY KEY,
+    game_name VARCHAR(255),
+    release_date DATE,
+    estimated_owners VARCHAR(255),
+    price_usd DECIMAL(10, 2),
+    about_game TEXT,
+    metacritic_score INT,
+    platform_support VARCHAR(3),
+    header_image VARCHAR(255),
+    video_urls MEDIUMTEXT,
+    categories MEDIUMTEXT,
+    genres MEDIUMTEXT,
+    tags MEDIUMTEXT,
+    supp_langs MEDIUMTEXT,
+    supp_audio_langs MEDIUMTEXT,
+    developers MEDIUMTEXT,
+    publishers MEDIUMTEXT,
+    -- last time any of the game's rows or relations changed
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP 
+        ON UPDATE CURRENT_TIMESTAMP,
+    -- bumped by every refresh of the row; unlike updated_at it moves on
+    -- for two refreshes within the same second
+    detail_version BIGINT NOT NULL DEFAULT 1,
+    FOREIGN KEY (game_id) REFERENCES game(game_id) ON DELETE CASCADE
+);
+
+-- Single-row version stamp of the catalog, bumped whenever a game or any of
+-- its relations changes (see sp_bump_catalog_version). The app uses it to
+-- validate cached pages and answer conditional requests.
+CREATE TABLE catalog_version (
+    id TINYINT PRIMARY KEY,
+    version BIGINT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP 
+        ON UPDATE CURRENT_TIMESTAMP
+);
+
+INSERT INTO catalog_version (id, version) VALUES (1, 1);
+
 -- header_image index
 CREATE INDEX idx_game_price_usd ON game(price_usd);
 
@@ -246,3 +300,52 @@ SELECT
     pub_name AS name
 FROM publishers
 ORDER BY type, name;
+
+-- view that builds game_detail rows
+DROP VIEW IF EXISTS game_detail_source;
+
+-- One row per game with every list the game page shows, joined with tabs.
+-- Each list is its own correlated subquery, so the work is the sum of the
+-- list sizes rather than their product, as with one join per list.
+CREATE VIEW game_detail_source AS
+SELECT
+    g.game_id,
+    g.game_name,
+    g.release_date,
+    g.estimated_owners,
+    g.price_usd,
+    g.about_game,
+    g.metacritic_score,
+    g.platform_support,
+    g.header_image,
+    (SELECT GROUP_CONCAT(DISTINCT v.video_url SEPARATOR '\t')
+        FROM game_videos v WHERE v.game_id = g.game_id) AS video_urls,
+    (SELECT GROUP_CONCAT(DISTINCT c.category_name SEPARATOR '\t')
+        FROM game_categories gc
+        JOIN categories c ON c.category_id = gc.category_id
+        WHERE gc.game_id = g.game_id) AS categories,
+    (SELECT GROUP_CONCAT(DISTINCT ge.genre_name SEPARATOR '\t')
+        FROM game_genres gg
+        JOIN genres ge ON ge.genre_id = gg.genre_id
+        WHERE gg.game_id = g.game_id) AS genres,
+    (SELECT GROUP_CONCAT(DISTINCT t.tag_name SEPARATOR '\t')
+        FROM game_tags gt
+        JOIN tags t ON t.tag_id = gt.tag_id
+        WHERE gt.game_id = g.game_id) AS tags,
+    (SELECT GROUP_CONCAT(DISTINCT l.lang SEPARATOR '\t')
+        FROM game_langs gl
+        JOIN supp_langs l ON l.lang_id = gl.lang_id
+        WHERE gl.game_id = g.game_id) AS supp_langs,
+    (SELECT GROUP_CONCAT(DISTINCT al.audio_lang SEPARATOR '\t')
+        FROM game_audio_langs gal
+        JOIN supp_audio_langs al ON al.audio_lang_id = gal.audio_lang_id
+        WHERE gal.game_id = g.game_id) AS supp_audio_langs,
+    (SELECT GROUP_CONCAT(DISTINCT d.dev_name SEPARATOR '\t')
+        FROM game_developers gd
+        JOIN developers d ON d.dev_id = gd.dev_id
+        WHERE gd.game_id = g.game_id) AS developers,
+    (SELECT GROUP_CONCAT(DISTINCT p.pub_name SEPARATOR '\t')
+        FROM game_publishers gp
+        JOIN publishers p ON p.pub_id = gp.pub_id
+        WHERE gp.game_id = g.game_id) AS publishers
+FROM game g;
@@ -0,0 +1,86 @@
+"""
+Background prefetch of pages users are likely to ask for next.
+
+A Prefetcher runs warm-up coroutines (typically: render the next listing
+page into fragment_cache) in the background within a budget: at most
+`concurrency` at a time, and only while `has_capacity()` says foreground
+work leaves room for it. It remembers which keys it warmed so that hits on
+them can be counted, giving the prefetch hit rate.
+"""
+
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable
+import asyncio
+
+PREFETCH_CONCURRENCY = 2
+# warmed keys remembered for hit accounting
+PREFETCH_TRACKED = 10_000
+
+
+class Prefetcher:
+    def __init__(self, has_capacity: Callable[[], bool] = lambda: True,
+                 concurrency: int = PREFETCH_CONCURRENCY,
+                 tracked: int = PREFETCH_TRACKED):
+        self.has_capacity = has_capacity
+        self.concurrency = concurrency
+        self.tracked = tracked
+        self._running = {}
+        # warmed keys not yet used by a request, oldest first
+        self._unused: "OrderedDict[Hashable, None]" = OrderedDict()
+
+        self.scheduled = 0
+        self.warmed = 0
+        self.hits = 0
+        self.skipped = 0
+        self.errors = 0
+
+    def schedule(self, key: Hashable,
+                 warm: Callable[[], Awaitable[bool]]) -> bool:
+        """
+        Runs `warm()` in the background unless `key` is already being
+        warmed or the budget is used up. `warm` returns whether it stored
+        something for `key`. Returns whether it was scheduled.
+        """
+        if key in self._running:
+            return False
+        if len(self._running) >= self.concurrency or not self.has_capacity():
+            self.skipped += 1
+            return False
+
+        self.scheduled += 1
+        self._running[key] = asyncio.ensure_future(self._run(key, warm))
+        return True
+
+    async def _run(self, key: Hashable, warm: Callable[[], Awaitable[bool]]):
+        try:
+            if await warm():
+                self.warmed += 1
+                self._unused[key] = None
+                self._unused.move_to_end(key)
+                while len(self._unused) > self.tracked:
+                    self._unused.popitem(last=False)
+        except Exception as err:
+            self.errors += 1
+            print(err)
+        finally:
+            del self._running[key]
+
+    def hit(self, key: Hashable):
+        """
+        Records that a request was served from an entry under `key`; the
+        first use of a warmed entry counts as a prefetch hit.
+        """
+        if key in self._unused:
+            del self._unused[key]
+            self.hits += 1
+
+    def stats(self) -> dict:
+        return {
+            "scheduled": self.scheduled,
+            "warmed": self.warmed,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.warmed if self.warmed else 0.0,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "running": len(self._running),
+        }
@@ -0,0 +1,186 @@
+"""
+Pre-rendered game pages.
+
+The shared part of every game page (everything except the navbar greeting
+and the ownership/purchase widget) is rendered once per game_detail version
+and stored gzip-compressed on disk, to be served as-is by /games/{game_id}
+while they are current. The app regenerates them in a background thread
+whenever the catalog version moves on. Run this module to (re)generate the
+pages by hand:
+
+    python static_pages.py [--full]
+"""
+
+from typing import Callable, Dict
+import gzip
+import json
+import os
+import sys
+import threading
+import jinja2
+import mysql.connector
+
+from database.db import ROLE_CLIENT, PoolTimeout, pooled_conn
+from database.objects import GameInfo, get_catalog_version
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_PAGES_DIR = os.path.join(BASE_DIR, 'static_pages')
+TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
+STATIC_TEMPLATE = 'game_static.html'
+# game_id -> game_detail.detail_version of the rendered page
+MANIFEST_NAME = 'manifest.json'
+
+# games rendered per detail query, and gzip level of the stored pages
+GENERATE_BATCH = 500
+COMPRESS_LEVEL = 6
+
+
+def page_path(game_id: int, out_dir: str = STATIC_PAGES_DIR) -> str:
+    return os.path.join(out_dir, f"{game_id}.html.gz")
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+# Renders game_static.html for every game into STATIC_PAGES_DIR, keeping a
+# manifest of the game_detail version each page was built from so later runs
+# only touch games whose details changed. A connection is borrowed per query
+# only; rendering and compressing hold none.
+class StaticPageGenerator:
+    def __init__(self, url_path_for: Callable[..., str],
+                 out_dir: str = STATIC_PAGES_DIR):
+        """
+        url_path_for: route name -> path lookup (app.url_path_for); pages
+        are rendered outside a request, so links are site-relative.
+        """
+        self.out_dir = out_dir
+        self.env = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(TEMPLATES_DIR),
+            autoescape=jinja2.select_autoescape()
+        )
+        self.env.globals["url_for"] = \
+            lambda name, **params: str(url_path_for(name, **params))
+        self._lock = threading.Lock()
+        # catalog_version every page on disk is current for, once a run has
+        # completed; None until then
+        self.catalog_version = None
+
+        self._state_lock = threading.Lock()
+        self._running = False
+        self._pending = False
+
+    def path(self, game_id: int) -> str:
+        return page_path(game_id, self.out_dir)
+
+    def generate(self, full: bool = False) -> dict:
+        """
+        Renders pages for games that are new or whose game_detail row changed
+        since the last run (every game when `full`) and removes pages of
+        deleted games. Returns how many pages were written and removed, or
+        None if the database failed.
+        """
+        with self._lock:
+            # the version is read first, so changes made during the run
+            # leave the pages marked older than the catalog
+            with pooled_conn(ROLE_CLIENT) as conn:
+                stamp = get_catalog_version(conn)
+                versions = GameInfo.get_detail_versions(conn)
+            if stamp is None or versions is None:
+                return None
+
+            os.makedirs(self.out_dir, exist_ok=True)
+            manifest = {} if full else self._read_manifest()
+            changed = [
+                game_id for game_id, version in versions.items()
+                if manifest.get(game_id) != version
+                or not os.path.exists(self.path(game_id))
+            ]
+
+            written = 0
+            complete = True
+            template = self.env.get_template(STATIC_TEMPLATE)
+            for i in range(0, len(changed), GENERATE_BATCH):
+                batch = changed[i:i + GENERATE_BATCH]
+                with pooled_conn(ROLE_CLIENT) as conn:
+                    details = GameInfo.get_game_details(conn, batch)
+                if details is None:
+                    complete = False
+                    break
+                for game_id, game in details.items():
+                    html = template.render(game=game, static=True)
+                    _write_atomic(
+                        self.path(game_id),
+                        gzip.compress(html.encode(), COMPRESS_LEVEL, mtime=0)
+                    )
+                    manifest[game_id] = versions[game_id]
+                    written += 1
+
+            removed = 0
+            for game_id in [g for g in manifest if g not in versions]:
+                del manifest[game_id]
+                try:
+                    os.remove(self.path(game_id))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+
+            self._write_manifest(manifest)
+            if complete:
+                self.catalog_version = stamp[0]
+            return {"written": written, "removed": removed,
+                    "pages": len(manifest)}
+
+    def start(self, full: bool = False) -> bool:
+        """
+        Runs generate in a background thread. While a run is in progress,
+        further calls only queue one more run after it. Returns whether a
+        new thread was started.
+        """
+        with self._state_lock:
+            if self._running:
+                self._pending = True
+                return False
+            self._running = True
+        threading.Thread(target=self._run, args=(full,),
+                         name="static-pages", daemon=True).start()
+        return True
+
+    def _run(self, full: bool):
+        while True:
+            try:
+                print(self.generate(full))
+            except (mysql.connector.Error, PoolTimeout, OSError) as err:
+                print(err)
+            with self._state_lock:
+                if not self._pending:
+                    self._running = False
+                    return
+                self._pending = False
+                full = False
+
+    def _read_manifest(self) -> Dict[int, int]:
+        try:
+            with open(os.path.join(self.out_dir, MANIFEST_NAME)) as f:
+                return {int(k): v for k, v in json.load(f).items()}
+        except (OSError, ValueError):
+            return {}
+
+    def _write_manifest(self, manifest: Dict[int, int]):
+        _write_atomic(
+            os.path.join(self.out_dir, MANIFEST_NAME),
+            json.dumps(manifest, separators=(",", ":")).encode()
+        )
+
+
+def main():
+    from app import app
+
+    generator = StaticPageGenerator(app.url_path_for)
+    print(generator.generate(full="--full" in sys.argv[1:]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Streaming template rendering.
+
+render_chunks turns a Jinja template's generate() output into an async
+stream of byte chunks, so the first part of a page goes out while the rest
+is still being rendered. Slow sections of a page can be passed as Deferred
+values: the template outputs a placeholder, everything before it is flushed,
+and only then is the section's coroutine awaited and its HTML sent.
+"""
+
+from typing import AsyncIterator, Awaitable, Callable, Iterable
+import jinja2
+
+# rendered output is sent in pieces of about this size
+STREAM_CHUNK = 16 * 1024
+
+
+# A page section produced by `make()` (a coroutine function returning HTML)
+# once everything before it in the page has been sent
+class Deferred:
+    def __init__(self, name: str, make: Callable[[], Awaitable[str]]):
+        self.marker = f"<!--deferred:{name}-->"
+        self.make = make
+
+    def __html__(self) -> str:
+        return self.marker
+
+
+async def render_chunks(template: jinja2.Template, context: dict,
+                        deferred: Iterable[Deferred] = (),
+                        chunk_size: int = STREAM_CHUNK
+                        ) -> AsyncIterator[bytes]:
+    """
+    Yields the rendered template as UTF-8 chunks of about `chunk_size`,
+    flushing before each deferred section.
+    """
+    pending = {d.marker: d for d in deferred}
+    buffer = []
+    size = 0
+
+    for text in template.generate(context):
+        while pending:
+            marker = next((m for m in pending if m in text), None)
+            if marker is None:
+                break
+            before, _, text = text.partition(marker)
+            buffer.append(before)
+            if buffer:
+                yield ''.join(buffer).encode()
+                buffer, size = [], 0
+            section = await pending.pop(marker).make()
+            yield (section or '').encode()
+
+        buffer.append(text)
+        size += len(text)
+        if size >= chunk_size:
+            yield ''.join(buffer).encode()
+            buffer, size = [], 0
+
+    if buffer:
+        yield ''.join(buffer).encode()
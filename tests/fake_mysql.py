@@ -0,0 +1,172 @@
+"""
+In-memory stand-in for the parts of MySQL the purchase engine relies on.
+
+FakeDatabase holds game prices, user balances and committed purchases.
+FakeConnection speaks the connector interface database/query.py uses
+(cursor(prepared=True), execute, fetchall, rowcount, commit, rollback) for
+the statements in database/purchases.py, with InnoDB's behaviour where the
+engine's guarantees depend on it:
+
+- the debit UPDATE takes an exclusive lock on the user's row, held until
+  commit or rollback, and sees the latest committed balance
+- an INSERT that hits an uncommitted purchase with the same unique key
+  waits for that transaction, then fails with ER_DUP_ENTRY if it committed
+- plain SELECTs read committed data only
+- lock waits give up with ER_LOCK_WAIT_TIMEOUT
+
+Statements are matched by their text, so the double breaks loudly if the
+engine starts issuing SQL it does not model.
+"""
+
+from decimal import Decimal
+from typing import Dict, List, Optional
+import threading
+import mysql.connector
+from mysql.connector import errorcode
+
+from database import purchases
+
+LOCK_WAIT_TIMEOUT = 5.0
+
+
+class FakeDatabase:
+    def __init__(self, prices: Dict[int, Decimal],
+                 balances: Dict[int, Decimal]):
+        self.prices = dict(prices)
+        self.balances = dict(balances)
+        # committed rows: (user_id, game_id, purchase_price, request_key)
+        self.purchases: List[tuple] = []
+        self.cond = threading.Condition()
+        # user_id -> connection holding the row lock
+        self.row_locks: Dict[int, 'FakeConnection'] = {}
+        self.open: List['FakeConnection'] = []
+        # errno to raise from the next debit, to simulate a deadlock victim
+        self.fail_next_debit: Optional[int] = None
+
+    def connect(self) -> 'FakeConnection':
+        conn = FakeConnection(self)
+        with self.cond:
+            self.open.append(conn)
+        return conn
+
+    def owned(self, user_id: int) -> List[int]:
+        with self.cond:
+            return [p[1] for p in self.purchases if p[0] == user_id]
+
+
+class FakeCursor:
+    def __init__(self, conn: 'FakeConnection'):
+        self.conn = conn
+        self.rows: List[tuple] = []
+        self.rowcount = -1
+
+    def execute(self, sql: str, params: tuple = ()):
+        self.rows, self.rowcount = self.conn._execute(sql, tuple(params))
+
+    def fetchall(self) -> List[tuple]:
+        rows, self.rows = self.rows, []
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, db: FakeDatabase):
+        self.db = db
+        self.in_transaction = False
+        self._debits: Dict[int, Decimal] = {}
+        self._inserts: List[tuple] = []
+
+    def cursor(self, prepared: bool = False) -> FakeCursor:
+        return FakeCursor(self)
+
+    def commit(self):
+        with self.db.cond:
+            for user_id, amount in self._debits.items():
+                self.db.balances[user_id] -= amount
+            self.db.purchases.extend(self._inserts)
+            self._end()
+
+    def rollback(self):
+        with self.db.cond:
+            self._end()
+
+    def _end(self):
+        self._debits.clear()
+        self._inserts.clear()
+        for user_id in [u for u, c in self.db.row_locks.items() if c is self]:
+            del self.db.row_locks[user_id]
+        self.in_transaction = False
+        self.db.cond.notify_all()
+
+    def _wait(self, blocked):
+        """
+        Waits (holding db.cond) until `blocked()` is false.
+        """
+        if not self.db.cond.wait_for(lambda: not blocked(),
+                                     LOCK_WAIT_TIMEOUT):
+            raise mysql.connector.DatabaseError(
+                msg="Lock wait timeout exceeded",
+                errno=errorcode.ER_LOCK_WAIT_TIMEOUT)
+
+    def _execute(self, sql: str, params: tuple):
+        db = self.db
+        with db.cond:
+            self.in_transaction = True
+
+            if sql == purchases.SQL_GAME_PRICE:
+                price = db.prices.get(params[0])
+                return ([] if price is None else [(price,)]), -1
+
+            if sql == purchases.SQL_USER_EXISTS:
+                return ([(1,)] if params[0] in db.balances else []), -1
+
+            if sql == purchases.SQL_EXISTING:
+                user_id, game_id, key = params
+                return [
+                    (p[1], p[3]) for p in db.purchases
+                    if p[0] == user_id and (p[1] == game_id or p[3] == key)
+                ], -1
+
+            if sql == purchases.SQL_DEBIT:
+                amount, user_id, minimum = params
+                if db.fail_next_debit is not None:
+                    errno, db.fail_next_debit = db.fail_next_debit, None
+                    raise mysql.connector.DatabaseError(
+                        msg="Deadlock found", errno=errno)
+                self._wait(lambda: db.row_locks.get(user_id, self)
+                           is not self)
+                if user_id not in db.balances:
+                    return [], 0
+                db.row_locks[user_id] = self
+                balance = db.balances[user_id] - self._debits.get(user_id, 0)
+                if balance < minimum:
+                    return [], 0
+                self._debits[user_id] = self._debits.get(user_id, 0) + amount
+                return [], 1
+
+            if sql == purchases.SQL_INSERT:
+                user_id, game_id, price, key = params
+                row = (user_id, game_id, price, key)
+
+                def clashes(other: tuple) -> bool:
+                    return other[0] == user_id and (
+                        other[1] == game_id
+                        or (key is not None and other[3] == key))
+
+                self._wait(lambda: any(
+                    clashes(r) for c in db.open if c is not self
+                    for r in c._inserts))
+                if any(clashes(r) for r in db.purchases + self._inserts):
+                    raise mysql.connector.IntegrityError(
+                        msg="Duplicate entry", errno=errorcode.ER_DUP_ENTRY)
+                if user_id not in db.balances:
+                    raise mysql.connector.IntegrityError(
+                        msg="Cannot add or update a child row",
+                        errno=errorcode.ER_NO_REFERENCED_ROW_2)
+                self._inserts.append(row)
+                return [], 1
+
+        raise mysql.connector.ProgrammingError(
+            msg=f"statement not modelled: {sql}")
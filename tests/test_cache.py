@@ -0,0 +1,120 @@
+"""
+Eviction and staleness of SizedLRUCache (database/cache.py), the cache in
+front of rendered page fragments.
+
+Run from the project root:
+    python -m pytest -q tests
+"""
+
+from unittest import mock
+import unittest
+
+from database import cache
+from database.cache import SizedLRUCache
+
+
+class SizedLRUCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = SizedLRUCache(max_bytes=10, max_entries=4, sizeof=len)
+
+    def keys(self) -> list:
+        return [k for k in "abcdefgh" if k in self.cache]
+
+    def test_evicts_least_recent_over_byte_budget(self):
+        self.cache.put("a", "xxx")
+        self.cache.put("b", "xxx")
+        self.cache.put("c", "xxx")
+        self.assertEqual(self.cache.bytes, 9)
+        self.cache.put("d", "xxxx")
+        self.assertEqual(self.keys(), ["b", "c", "d"])
+        self.assertEqual(self.cache.bytes, 10)
+        self.assertEqual(self.cache.evictions, 1)
+
+    def test_large_value_evicts_several(self):
+        for key in "abc":
+            self.cache.put(key, "xx")
+        self.cache.put("d", "x" * 9)
+        self.assertEqual(self.keys(), ["d"])
+        self.assertEqual(self.cache.bytes, 9)
+        self.assertEqual(self.cache.evictions, 3)
+
+    def test_evicts_over_entry_budget(self):
+        for key in "abcde":
+            self.cache.put(key, "x")
+        self.assertEqual(self.keys(), ["b", "c", "d", "e"])
+        self.assertEqual(self.cache.bytes, 4)
+
+    def test_get_refreshes_recency(self):
+        for key in "abc":
+            self.cache.put(key, "xxx")
+        self.assertEqual(self.cache.get("a"), "xxx")
+        self.cache.put("d", "xxx")
+        self.assertEqual(self.keys(), ["a", "c", "d"])
+
+    def test_value_over_budget_is_not_stored(self):
+        self.cache.put("a", "xxx")
+        self.cache.put("b", "x" * 11)
+        self.assertNotIn("b", self.cache)
+        self.assertEqual(self.keys(), ["a"])
+        self.assertEqual(self.cache.bytes, 3)
+
+    def test_replacing_a_key_counts_its_size_once(self):
+        self.cache.put("a", "xxxxxx")
+        self.cache.put("a", "xx")
+        self.cache.put("b", "xxxxxxxx")
+        self.assertEqual(self.keys(), ["a", "b"])
+        self.assertEqual(self.cache.bytes, 10)
+        self.assertEqual(self.cache.evictions, 0)
+
+    def test_invalidate(self):
+        for key in "abc":
+            self.cache.put(key, "xx")
+        self.cache.invalidate("b")
+        self.assertEqual((self.keys(), self.cache.bytes), (["a", "c"], 4))
+        self.cache.invalidate()
+        self.assertEqual((self.keys(), self.cache.bytes), ([], 0))
+        self.cache.put("d", "x" * 10)
+        self.assertEqual(self.keys(), ["d"])
+
+    def test_expire_without_max_stale_drops_entries(self):
+        self.cache.put("a", "xx")
+        self.cache.expire()
+        self.assertIsNone(self.cache.get_stale("a"))
+        self.assertEqual(self.cache.bytes, 0)
+
+    def test_expired_entries_served_stale_for_max_stale(self):
+        stale = SizedLRUCache(max_bytes=10, sizeof=len, max_stale=30)
+        with mock.patch.object(cache.time, 'monotonic', return_value=100.0) \
+                as now:
+            stale.put("a", "xx")
+            stale.put("b", "xx")
+            stale.expire("a")
+            self.assertIsNone(stale.get("a"))
+            self.assertNotIn("a", stale)
+            self.assertEqual(stale.get_stale("a"), ("xx", False))
+            self.assertEqual(stale.get_stale("b"), ("xx", True))
+
+            now.return_value = 130.0
+            self.assertIsNone(stale.get_stale("a"))
+            # still counted until replaced or evicted
+            self.assertEqual(stale.bytes, 4)
+            stale.put("a", "xxx")
+            self.assertEqual(stale.get_stale("a"), ("xxx", True))
+            self.assertEqual(stale.bytes, 5)
+
+    def test_stats(self):
+        self.cache.put("a", "xxxx")
+        self.cache.get("a")
+        self.cache.get("b")
+        self.cache.put("b", "x" * 8)
+        stats = self.cache.stats()
+        self.assertEqual(
+            {k: stats[k] for k in ("entries", "hits", "misses", "evictions",
+                                   "bytes", "max_bytes")},
+            {"entries": 1, "hits": 1, "misses": 1, "evictions": 1,
+             "bytes": 8, "max_bytes": 10})
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,228 @@
+"""
+FacetIndex (database/facets.py) checked against what the equivalent SQL
+over the junction tables returns: matches, counts and pages are compared
+with plain set arithmetic on the same rows, on a catalog large enough to
+have both sparse and dense postings and to span many 64-bit words.
+
+Run from the project root:
+    python -m pytest -q tests
+"""
+
+import random
+import unittest
+
+from database.facets import (
+    SPARSE_RATIO,
+    FacetIndex,
+    parse_selection,
+    selection_key
+)
+
+TYPES = ('genre', 'tag', 'developer')
+
+
+def make_catalog(seed: int = 7, n_games: int = 700):
+    """
+    Returns (game_ids, relations) with gaps in the game ids and, per facet
+    type, attributes from nearly every game down to a handful.
+    """
+    rng = random.Random(seed)
+    game_ids = sorted(rng.sample(range(1, 5 * n_games), n_games))
+    densities = {
+        'genre': [0.9, 0.5, 0.2, 0.05],
+        'tag': [0.3, 0.1, 0.04, 0.02, 0.01, 0.005],
+        'developer': [0.01] * 8 + [0.002] * 8,
+    }
+    relations = {}
+    for facet_type, ps in densities.items():
+        relations[facet_type] = [
+            (game_id, attr_id)
+            for attr_id, p in enumerate(ps, start=1)
+            for game_id in game_ids if rng.random() < p
+        ]
+    return game_ids, relations
+
+
+class FacetIndexTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.game_ids, cls.relations = make_catalog()
+        cls.index = FacetIndex(cls.game_ids, cls.relations)
+        # facet type -> attribute id -> game ids, as the junction tables
+        cls.members = {}
+        for facet_type, rows in cls.relations.items():
+            for game_id, attr_id in rows:
+                cls.members.setdefault(facet_type, {}) \
+                    .setdefault(attr_id, set()).add(game_id)
+
+    def expected(self, selection: dict) -> list:
+        games = set(self.game_ids)
+        for facet_type, attr_ids in selection.items():
+            for attr_id in attr_ids:
+                games &= self.members[facet_type].get(attr_id, set())
+        return sorted(games)
+
+    def selections(self, n: int = 200, seed: int = 11):
+        rng = random.Random(seed)
+        yield {}
+        for _ in range(n):
+            selection = {}
+            for facet_type in rng.sample(TYPES, rng.randint(1, 3)):
+                attrs = list(self.members[facet_type])
+                selection[facet_type] = rng.sample(attrs, rng.randint(1, 2))
+            yield selection
+
+    def test_catalog_has_sparse_and_dense_postings(self):
+        postings = [p for table in self.index.postings.values()
+                    for p in table.values()]
+        self.assertTrue(any(p.dense for p in postings))
+        self.assertTrue(any(not p.dense for p in postings))
+        for p in postings:
+            self.assertEqual(
+                p.dense, p.count * SPARSE_RATIO >= len(self.game_ids))
+
+    def test_match_intersects_selected_attributes(self):
+        for selection in self.selections():
+            result = self.index.match(selection)
+            expected = self.expected(selection)
+            self.assertEqual(result.count, len(expected))
+            self.assertEqual(
+                [self.index.game_ids[p] for p in result.iter_positions()],
+                expected)
+
+    def test_unknown_attribute_matches_nothing(self):
+        self.assertEqual(self.index.match({'genre': [1, 999]}).count, 0)
+        self.assertEqual(self.index.page({'tag': [999]}), (0, []))
+
+    def test_counts_match_adding_each_attribute(self):
+        for selection in self.selections(60):
+            counts = self.index.counts(selection)
+            for facet_type, attrs in self.members.items():
+                expected = {}
+                for attr_id in attrs:
+                    extended = dict(selection)
+                    extended[facet_type] = \
+                        list(selection.get(facet_type, ())) + [attr_id]
+                    n = len(self.expected(extended))
+                    if n:
+                        expected[attr_id] = n
+                self.assertEqual(
+                    {a: n for a, n in counts[facet_type].items() if n},
+                    expected, (selection, facet_type))
+
+    def test_counts_agree_across_strategies(self):
+        forward = FacetIndex(self.game_ids, self.relations)
+        by_posting = FacetIndex(self.game_ids, self.relations)
+        for facet_type in TYPES:
+            forward._posting_cost[facet_type] = 10 ** 9
+            by_posting._posting_cost[facet_type] = -1
+        for selection in self.selections(40):
+            if not selection:
+                continue
+            self.assertEqual(
+                {t: dict(c) for t, c in forward.counts(selection).items()},
+                {t: dict(c) for t, c in by_posting.counts(selection).items()})
+
+    def test_counts_for_a_few_attributes(self):
+        selection = {'genre': [2]}
+        counts = self.index.counts_for(selection, 'developer', [1, 9, 999])
+        for attr_id in (1, 9):
+            self.assertEqual(
+                counts[attr_id],
+                len(self.expected({'genre': [2], 'developer': [attr_id]})))
+        self.assertEqual(counts[999], 0)
+
+    def test_offset_pages(self):
+        for selection in list(self.selections(30)):
+            expected = self.expected(selection)
+            for offset in (0, 1, 63, 64, 65, 130, len(expected) - 1,
+                           len(expected), len(expected) + 5):
+                if offset < 0:
+                    continue
+                total, ids = self.index.page(selection, limit=10,
+                                             offset=offset)
+                self.assertEqual(total, len(expected))
+                self.assertEqual(ids, expected[offset:offset + 10],
+                                 (selection, offset))
+
+    def test_keyset_pages_after_an_id(self):
+        for selection in list(self.selections(30)):
+            expected = self.expected(selection)
+            anchors = [None, 0, self.game_ids[0], self.game_ids[-1],
+                       self.game_ids[-1] + 1]
+            anchors += expected[::17]
+            # ids between catalog games, not themselves in the index
+            anchors += [g + 1 for g in self.game_ids[5::97]]
+            for after_id in anchors:
+                total, ids = self.index.page_keyset(
+                    selection, after_id=after_id, limit=10)
+                rest = expected if after_id is None else \
+                    [g for g in expected if g > after_id]
+                self.assertEqual(total, len(expected))
+                self.assertEqual(ids, rest[:10], (selection, after_id))
+
+    def test_keyset_pages_before_an_id(self):
+        for selection in list(self.selections(30)):
+            expected = self.expected(selection)
+            anchors = [0, self.game_ids[0], self.game_ids[63],
+                       self.game_ids[64], self.game_ids[-1],
+                       self.game_ids[-1] + 1]
+            anchors += expected[::17]
+            anchors += [g + 1 for g in self.game_ids[5::97]]
+            for before_id in anchors:
+                total, ids = self.index.page_keyset(
+                    selection, before_id=before_id, limit=10)
+                head = [g for g in expected if g < before_id]
+                self.assertEqual(total, len(expected))
+                self.assertEqual(ids, head[-10:], (selection, before_id))
+
+    def test_keyset_walk_covers_every_match_once(self):
+        selection = {'genre': [1]}
+        expected = self.expected(selection)
+        # a page that does not move past its anchor would loop forever
+        pages = len(expected) // 25 + 2
+
+        seen, after_id = [], None
+        for _ in range(pages):
+            _, ids = self.index.page_keyset(
+                selection, after_id=after_id, limit=25)
+            if not ids:
+                break
+            seen += ids
+            after_id = ids[-1]
+        self.assertEqual(seen, expected)
+
+        back, before_id = [], expected[-1] + 1
+        for _ in range(pages):
+            _, ids = self.index.page_keyset(
+                selection, before_id=before_id, limit=25)
+            if not ids:
+                break
+            back = ids + back
+            before_id = ids[0]
+        self.assertEqual(back, expected)
+
+    def test_member_test(self):
+        self.assertIsNone(self.index.member_test({}))
+        for selection in list(self.selections(20))[1:]:
+            test = self.index.member_test(selection)
+            expected = set(self.expected(selection))
+            for game_id in self.game_ids[::7] + [0, 10 ** 6]:
+                self.assertEqual(test(game_id), game_id in expected)
+
+
+class SelectionTest(unittest.TestCase):
+    def test_parse_selection(self):
+        self.assertEqual(
+            parse_selection(genre=['1,2', ' 3 '], tag=[''],
+                            developer=['x', '4,', '-5', '²', '٣', '6']),
+            {'genre': [1, 2, 3], 'developer': [4, 6]})
+
+    def test_selection_key_ignores_order_and_repeats(self):
+        self.assertEqual(
+            selection_key({'tag': [3, 1, 3], 'genre': [2], 'lang': []}),
+            selection_key({'genre': [2], 'tag': [1, 3]}))
+
+
+if __name__ == "__main__":
+    unittest.main()
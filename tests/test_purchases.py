@@ -0,0 +1,171 @@
+"""
+Guarantees of the purchase engine (database/purchases.py), checked against
+the in-memory database in tests/fake_mysql.py: one debit per owned game, no
+overdraft, and at-most-once effect per request key, including under
+concurrent requests.
+
+Run from the project root:
+    python -m pytest -q tests
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+import threading
+import unittest
+from mysql.connector import errorcode
+
+from database import purchases
+from database.purchases import (
+    ALREADY_OWNED,
+    INSUFFICIENT_FUNDS,
+    KEY_CONFLICT,
+    NOT_FOUND,
+    PURCHASED,
+    REPLAYED,
+    make_purchase
+)
+from tests.fake_mysql import FakeDatabase
+
+USER = 1
+PRICES = {
+    10: Decimal("6.00"),
+    11: Decimal("3.00"),
+    12: Decimal("0.00"),
+}
+
+
+class PurchaseTest(unittest.TestCase):
+    def setUp(self):
+        self.db = FakeDatabase(PRICES, {USER: Decimal("10.00")})
+        self.conn = self.db.connect()
+
+    def buy(self, game_id: int, key: str = None, user_id: int = USER):
+        return make_purchase(self.conn, user_id, game_id, key)
+
+    def test_purchase_debits_price_and_records_it(self):
+        self.assertEqual(self.buy(10, "a"), PURCHASED)
+        self.assertEqual(self.db.balances[USER], Decimal("4.00"))
+        self.assertEqual(self.db.purchases,
+                         [(USER, 10, Decimal("6.00"), "a")])
+
+    def test_insufficient_balance_changes_nothing(self):
+        self.db.balances[USER] = Decimal("5.99")
+        self.assertEqual(self.buy(10, "a"), INSUFFICIENT_FUNDS)
+        self.assertEqual(self.db.balances[USER], Decimal("5.99"))
+        self.assertEqual(self.db.purchases, [])
+        self.assertFalse(self.db.row_locks)
+
+    def test_replay_of_same_key_is_charged_once(self):
+        self.assertEqual(self.buy(10, "a"), PURCHASED)
+        self.assertEqual(self.buy(10, "a"), REPLAYED)
+        # the balance no longer covers the game, but the request went through
+        self.assertEqual(self.buy(10, "a"), REPLAYED)
+        self.assertEqual(self.db.balances[USER], Decimal("4.00"))
+        self.assertEqual(self.db.owned(USER), [10])
+
+    def test_new_request_for_owned_game_is_not_charged(self):
+        self.db.balances[USER] = Decimal("20.00")
+        self.assertEqual(self.buy(10, "a"), PURCHASED)
+        self.assertEqual(self.buy(10, "b"), ALREADY_OWNED)
+        self.assertEqual(self.buy(10), ALREADY_OWNED)
+        self.assertEqual(self.db.balances[USER], Decimal("14.00"))
+        self.assertEqual(self.db.owned(USER), [10])
+
+    def test_key_reused_for_another_game(self):
+        self.assertEqual(self.buy(10, "a"), PURCHASED)
+        self.assertEqual(self.buy(11, "a"), KEY_CONFLICT)
+        self.assertEqual(self.db.balances[USER], Decimal("4.00"))
+        self.assertEqual(self.db.owned(USER), [10])
+
+    def test_free_game_is_bought_once(self):
+        self.db.balances[USER] = Decimal("0.00")
+        self.assertEqual(self.buy(12), PURCHASED)
+        self.assertEqual(self.buy(12), ALREADY_OWNED)
+        self.assertEqual(self.db.owned(USER), [12])
+
+    def test_unknown_game_or_user(self):
+        self.assertEqual(self.buy(99), NOT_FOUND)
+        self.assertEqual(self.buy(12, user_id=2), NOT_FOUND)
+        self.assertEqual(self.db.purchases, [])
+
+    def test_paid_game_for_unknown_user(self):
+        self.assertEqual(self.buy(10, "a", user_id=2), NOT_FOUND)
+        self.assertEqual(self.db.purchases, [])
+        self.assertEqual(self.db.balances, {USER: Decimal("10.00")})
+        self.assertFalse(self.db.row_locks)
+
+    def test_deadlock_victim_is_retried(self):
+        retries = purchases.purchase_stats()["retries"]
+        self.db.fail_next_debit = errorcode.ER_LOCK_DEADLOCK
+        self.assertEqual(self.buy(10, "a"), PURCHASED)
+        self.assertEqual(purchases.purchase_stats()["retries"], retries + 1)
+        self.assertEqual(self.db.balances[USER], Decimal("4.00"))
+
+
+class ConcurrentPurchaseTest(unittest.TestCase):
+    THREADS = 16
+
+    def race(self, db: FakeDatabase, requests: list) -> list:
+        """
+        Runs make_purchase for every (user_id, game_id, key) at once, each
+        on its own connection, and returns the outcomes in order.
+        """
+        start = threading.Barrier(len(requests))
+
+        def buy(request):
+            conn = db.connect()
+            start.wait()
+            return make_purchase(conn, *request)
+
+        with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+            return list(executor.map(buy, requests))
+
+    def test_double_clicks_buy_once(self):
+        db = FakeDatabase(PRICES, {USER: Decimal("10.00")})
+        # half retries of one request, half separate requests
+        requests = [
+            (USER, 10, "same" if i % 2 == 0 else f"other-{i}")
+            for i in range(self.THREADS)
+        ]
+        outcomes = self.race(db, requests)
+
+        self.assertEqual(outcomes.count(PURCHASED), 1)
+        self.assertEqual(db.owned(USER), [10])
+        self.assertEqual(db.balances[USER], Decimal("4.00"))
+        for (_, _, key), outcome in zip(requests, outcomes):
+            if outcome != PURCHASED:
+                bought_with = db.purchases[0][3]
+                self.assertEqual(
+                    outcome,
+                    REPLAYED if key == bought_with else ALREADY_OWNED)
+
+    def test_burst_never_overdraws(self):
+        prices = {game_id: Decimal("3.00") for game_id in range(100, 116)}
+        db = FakeDatabase(prices, {USER: Decimal("10.00")})
+        outcomes = self.race(
+            db, [(USER, game_id, f"k{game_id}") for game_id in prices])
+
+        self.assertEqual(outcomes.count(PURCHASED), 3)
+        self.assertEqual(outcomes.count(INSUFFICIENT_FUNDS), len(prices) - 3)
+        self.assertEqual(db.balances[USER], Decimal("1.00"))
+        self.assertEqual(len(db.owned(USER)), 3)
+
+    def test_users_do_not_interfere(self):
+        balances = {user_id: Decimal("10.00") for user_id in range(1, 9)}
+        db = FakeDatabase(PRICES, balances)
+        requests = [(user_id, game_id, f"{user_id}-{game_id}-{n}")
+                    for user_id in balances for game_id in (10, 11)
+                    for n in range(2)]
+        outcomes = self.race(db, requests)
+
+        self.assertEqual(outcomes.count(PURCHASED), 2 * len(balances))
+        for user_id in balances:
+            self.assertEqual(sorted(db.owned(user_id)), [10, 11])
+            self.assertEqual(db.balances[user_id], Decimal("1.00"))
+        self.assertEqual(
+            sum(p[2] for p in db.purchases),
+            sum(Decimal("10.00") - b for b in db.balances.values()))
+
+
+if __name__ == "__main__":
+    unittest.main()
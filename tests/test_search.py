@@ -0,0 +1,170 @@
+"""
+BM25 ranking and persistence of the search index (database/search.py).
+
+Run from the project root:
+    python -m pytest -q tests
+"""
+
+from unittest import mock
+import math
+import os
+import tempfile
+import unittest
+
+from database import search
+from database.search import (
+    B,
+    K1,
+    NAME_WEIGHT,
+    SearchIndex,
+    load_search_index,
+    tokenize
+)
+
+DOCS = [
+    (10, "Space Pirates", "Fly a ship and fight pirates in space."),
+    (20, "Farm Life", "Grow crops. A pirate ship visits the farm once."),
+    (30, "Pirate Cove", "Pirates everywhere: pirate ships, pirate flags."),
+    (40, "Quiet Garden", "Grow flowers in a quiet garden."),
+    (50, "Dungeon", None),
+]
+
+
+def bm25(docs, query: str) -> dict:
+    """
+    Straight BM25 over the same documents and term weights, for reference.
+    """
+    tfs = {}
+    for game_id, name, about in docs:
+        tf = {}
+        for term in tokenize(about):
+            tf[term] = tf.get(term, 0) + 1
+        for term in tokenize(name):
+            tf[term] = tf.get(term, 0) + NAME_WEIGHT
+        tfs[game_id] = tf
+    avg = sum(sum(tf.values()) for tf in tfs.values()) / len(tfs)
+
+    scores = {}
+    for term in set(tokenize(query)):
+        having = [g for g, tf in tfs.items() if term in tf]
+        idf = math.log(1 + (len(tfs) - len(having) + 0.5)
+                       / (len(having) + 0.5))
+        for game_id in having:
+            tf = tfs[game_id][term]
+            length = sum(tfs[game_id].values())
+            scores[game_id] = scores.get(game_id, 0.0) + idf * tf * \
+                (K1 + 1) / (tf + K1 * (1 - B + B * length / avg))
+    return scores
+
+
+class SearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = SearchIndex(DOCS, catalog_version=4)
+
+    def test_tokenize_drops_case_punctuation_and_stopwords(self):
+        self.assertEqual(tokenize("The Pirates' Cove, and 2 SHIPS!"),
+                         ['pirates', 'cove', '2', 'ships'])
+        self.assertEqual(tokenize(None), [])
+
+    def test_ranking_matches_bm25(self):
+        for query in ("pirate", "pirates ship", "grow garden", "space farm"):
+            expected = bm25(DOCS, query)
+            ranked = sorted(expected, key=lambda g: -expected[g])
+            total, ids = self.index.search(query, limit=10)
+            self.assertEqual(total, len(expected), query)
+            self.assertEqual(ids, ranked, query)
+
+    def test_name_match_ranks_above_description_mention(self):
+        _, ids = self.index.search("pirate")
+        self.assertEqual(ids[0], 30)
+        self.assertLess(ids.index(30), ids.index(20))
+
+    def test_rarer_term_weighs_more(self):
+        # "space" is in one game, "grow" in two
+        _, ids = self.index.search("space grow")
+        self.assertEqual(ids[0], 10)
+
+    def test_length_is_relative_to_average(self):
+        # a name match in a long description still beats a short mention
+        docs = [
+            (1, "Relic", "relic hunt " + "filler words here " * 6),
+            (2, "Cave", "a relic"),
+            (3, "Moor", "quiet moor walk"),
+            (4, "Fen", "fen"),
+            (5, "Lake", "lake lake"),
+        ]
+        expected = bm25(docs, "relic")
+        self.assertGreater(expected[1], expected[2])
+        self.assertEqual(SearchIndex(docs).search("relic"), (2, [1, 2]))
+
+    def test_paging_and_filter(self):
+        total, all_ids = self.index.search("pirates pirate ship", limit=10)
+        self.assertEqual(self.index.search("pirates pirate ship", limit=1,
+                                           offset=1), (total, all_ids[1:2]))
+        total, ids = self.index.search(
+            "pirates pirate ship", allowed=lambda g: g != all_ids[0])
+        self.assertEqual((total, ids), (len(all_ids) - 1, all_ids[1:]))
+
+    def test_no_terms_or_no_matches(self):
+        self.assertEqual(self.index.search("the and of"), (0, []))
+        self.assertEqual(self.index.search("zeppelin"), (0, []))
+        self.assertEqual(SearchIndex([]).search("pirate"), (0, []))
+
+
+class PersistenceTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "index.pkl")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def load(self, saved_version: int, current_version: int) -> tuple:
+        """
+        Saves an index of two games at `saved_version` and loads it while
+        the catalog is at `current_version`. Returns the loaded index and
+        whether it was rebuilt from the catalog.
+        """
+        SearchIndex(DOCS[:2], catalog_version=saved_version).save(self.path)
+        fresh = SearchIndex(DOCS, catalog_version=current_version)
+        stamp = None if current_version is None else (current_version, 0.0)
+        with mock.patch.object(search, 'get_catalog_version',
+                               return_value=stamp), \
+                mock.patch.object(SearchIndex, 'load',
+                                  return_value=fresh) as build:
+            index = load_search_index(None, path=self.path)
+        self.assertIs(search.get_search_index(), index)
+        return index, build.called
+
+    def test_round_trip(self):
+        index = SearchIndex(DOCS, catalog_version=4)
+        index.save(self.path)
+        loaded = SearchIndex.from_file(self.path)
+        self.assertEqual(loaded.catalog_version, 4)
+        self.assertEqual(loaded.search("pirate"), index.search("pirate"))
+
+    def test_saved_index_used_while_current(self):
+        index, built = self.load(saved_version=4, current_version=4)
+        self.assertFalse(built)
+        self.assertEqual(len(index.game_ids), 2)
+
+    def test_saved_index_rebuilt_after_catalog_change(self):
+        index, built = self.load(saved_version=4, current_version=5)
+        self.assertTrue(built)
+        self.assertEqual(len(index.game_ids), len(DOCS))
+        # and saved for the next start
+        self.assertEqual(SearchIndex.from_file(self.path).catalog_version, 5)
+
+    def test_saved_index_rebuilt_without_version(self):
+        _, built = self.load(saved_version=4, current_version=None)
+        self.assertTrue(built)
+
+    def test_unreadable_file(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a pickle')
+        self.assertIsNone(SearchIndex.from_file(self.path))
+        self.assertIsNone(SearchIndex.from_file(self.path + '.missing'))
+
+
+if __name__ == "__main__":
+    unittest.main()